@@ -0,0 +1,120 @@
+"""HTTP client for the journal API, shared by every Streamlit rerun.
+
+One pooled ``requests.Session`` keeps connections alive between reruns.
+GETs of session data are conditional: the last body and its ETag are kept,
+and a 304 from the server returns the kept body without re-sending it.
+"""
+import json
+import threading
+from typing import Iterator, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# (connect, read) seconds; streamed replies get a longer read timeout
+TIMEOUT = (3.05, 30)
+STREAM_TIMEOUT = (3.05, 300)
+
+
+class JournalClient:
+    """Pooled, keep-alive client with ETag revalidation of session data."""
+
+    def __init__(self, base_url: str, *, pool_size: int = 10) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.http = requests.Session()
+        # Idempotent reads retry briefly on connection errors; writes never do
+        retries = Retry(total=2, connect=2, read=0, backoff_factor=0.2, allowed_methods={"GET"})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retries)
+        self.http.mount("http://", adapter)
+        self.http.mount("https://", adapter)
+        self._validated: dict[str, tuple[str, dict]] = {}
+        self._lock = threading.Lock()
+
+    def _url(self, path: str) -> str:
+        return f"{self.base_url}{path}"
+
+    def _get_validated(self, path: str) -> dict:
+        """GET ``path``, reusing the kept body when the server answers 304."""
+        with self._lock:
+            kept = self._validated.get(path)
+        headers = {"If-None-Match": kept[0]} if kept else {}
+        response = self.http.get(self._url(path), headers=headers, timeout=TIMEOUT)
+        if response.status_code == 304 and kept:
+            return kept[1]
+        response.raise_for_status()
+        body = response.json()
+        etag = response.headers.get("ETag")
+        if etag:
+            with self._lock:
+                self._validated[path] = (etag, body)
+        return body
+
+    # -------------------------------
+    # Health
+    # -------------------------------
+    def is_up(self) -> bool:
+        """Liveness check against /healthz (no database or model work)."""
+        try:
+            return self.http.get(self._url("/healthz"), timeout=2).ok
+        except requests.exceptions.RequestException:
+            return False
+
+    # -------------------------------
+    # Sessions
+    # -------------------------------
+    def list_sessions(self) -> list[dict]:
+        return self._get_validated("/sessions")["sessions"]
+
+    def get_session(self, session_id: str) -> dict:
+        return self._get_validated(f"/sessions/{session_id}")
+
+    def create_session(self, session_name: Optional[str] = None) -> dict:
+        payload = {"session_name": session_name} if session_name else {}
+        response = self.http.post(self._url("/sessions"), json=payload, timeout=TIMEOUT)
+        response.raise_for_status()
+        return response.json()
+
+    def rename_session(self, session_id: str, session_name: str) -> None:
+        response = self.http.patch(
+            self._url(f"/sessions/{session_id}"), json={"session_name": session_name}, timeout=TIMEOUT
+        )
+        response.raise_for_status()
+
+    # -------------------------------
+    # Messages
+    # -------------------------------
+    def history_page(self, session_id: str, **params) -> dict:
+        """One keyset page of a session's history (see GET /sessions/{id}/history)."""
+        response = self.http.get(self._url(f"/sessions/{session_id}/history"), params=params, timeout=TIMEOUT)
+        response.raise_for_status()
+        return response.json()
+
+    def stream_chat(self, session_id: str, content: str, result: dict) -> Iterator[str]:
+        """Send a message and yield reply tokens as the backend streams them.
+
+        When the stream completes, ``result`` is filled with the final turn
+        payload (persisted messages, session name and recalled memories).
+        """
+        with self.http.post(
+            self._url("/chat/stream"),
+            json={"session_id": session_id, "role": "user", "content": content},
+            stream=True,
+            timeout=STREAM_TIMEOUT,
+        ) as response:
+            response.raise_for_status()
+            event = None
+            for line in response.iter_lines(decode_unicode=True):
+                if not line:
+                    event = None
+                    continue
+                if line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                elif line.startswith("data:"):
+                    data = json.loads(line[len("data:"):])
+                    if event == "error":
+                        raise requests.exceptions.RequestException(data.get("detail", "stream failed"))
+                    if event == "done":
+                        result.update(data)
+                    elif event is None and "token" in data:
+                        yield data["token"]
@@ -2,19 +2,24 @@ import streamlit as st
 import requests
 from datetime import datetime
 
+from api_client import JournalClient
+
 api = "http://localhost:8000"
 
 st.title("AI Memory Journal")
 
+@st.cache_resource
+def get_client() -> JournalClient:
+    """One pooled client shared by every rerun and browser tab."""
+    return JournalClient(api)
+
+client = get_client()
+
 # -------------------------------
 # API health check
 # -------------------------------
 def check_api_connection():
-    try:
-        requests.get(f"{api}/docs", timeout=2)
-        return True
-    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
-        return False
+    return client.is_up()
 
 if not check_api_connection():
     st.error("⚠️ Backend API is not running. Please start the FastAPI server first.")
@@ -25,23 +30,16 @@ if not check_api_connection():
 # Session Management Functions
 # -------------------------------
 def get_all_sessions():
-    """Fetch all sessions from backend."""
+    """Fetch all sessions from backend (a 304 reuses the last list)."""
     try:
-        response = requests.get(f"{api}/sessions")
-        response.raise_for_status()
-        return response.json()["sessions"]
+        return client.list_sessions()
     except requests.exceptions.RequestException:
         return []
 
 def create_new_session(session_name: str = None):
     """Create a new session."""
     try:
-        payload = {}
-        if session_name:
-            payload["session_name"] = session_name
-        response = requests.post(f"{api}/sessions", json=payload)
-        response.raise_for_status()
-        data = response.json()
+        data = client.create_session(session_name)
         return data["session_id"], data["session_name"]
     except requests.exceptions.RequestException as e:
         st.error(f"Failed to create session: {e}")
@@ -50,22 +48,76 @@ def create_new_session(session_name: str = None):
 def rename_session(session_id: str, new_name: str):
     """Rename a session."""
     try:
-        response = requests.patch(
-            f"{api}/sessions/{session_id}",
-            json={"session_name": new_name}
-        )
-        response.raise_for_status()
+        client.rename_session(session_id, new_name)
         return True
     except requests.exceptions.RequestException:
         return False
 
 def get_session_name(session_id: str):
     """Get the name of a session."""
-    sessions = get_all_sessions()
-    for session in sessions:
-        if session["session_id"] == session_id:
-            return session["session_name"]
-    return "Unknown Session"
+    try:
+        return client.get_session(session_id)["session_name"]
+    except requests.exceptions.RequestException:
+        return "Unknown Session"
+
+HISTORY_PAGE_SIZE = 100
+# Messages drawn per session; older cached ones are drawn on request
+RENDER_WINDOW = 200
+
+def load_history(session_id: str, message_count: int = None):
+    """Return the cached messages for a session, fetching only what is new.
+
+    The first load pulls the most recent page. Later reruns skip the request
+    entirely while the session's ``message_count`` (from the session list)
+    is unchanged, and otherwise ask for messages after the last id we have.
+    """
+    cache = st.session_state.setdefault("history_cache", {})
+    entry = cache.get(session_id)
+
+    if entry is None:
+        data = client.history_page(session_id, limit=HISTORY_PAGE_SIZE)
+        entry = {
+            "messages": data["messages"],
+            "has_older": data["has_more"],
+            "message_count": message_count,
+            "window": RENDER_WINDOW,
+        }
+        cache[session_id] = entry
+        return entry
+
+    if message_count is not None and message_count == entry["message_count"]:
+        return entry
+
+    has_more = True
+    while has_more:
+        params = {"limit": HISTORY_PAGE_SIZE}
+        if entry["messages"]:
+            params["after_id"] = entry["messages"][-1]["id"]
+        data = client.history_page(session_id, **params)
+        entry["messages"].extend(data["messages"])
+        entry["window"] += len(data["messages"])
+        has_more = data["has_more"] and bool(data["messages"])
+    entry["message_count"] = message_count
+    return entry
+
+def load_older_history(session_id: str):
+    """Draw older messages: cached ones first, then the page before the oldest one cached."""
+    entry = st.session_state["history_cache"][session_id]
+    entry["window"] += HISTORY_PAGE_SIZE
+    if entry["window"] <= len(entry["messages"]) or not entry["messages"]:
+        return
+    data = client.history_page(
+        session_id, before_id=entry["messages"][0]["id"], limit=HISTORY_PAGE_SIZE
+    )
+    entry["messages"][:0] = data["messages"]
+    entry["has_older"] = data["has_more"]
+
+def show_recalled(memories):
+    with st.expander("🧠 Recalled Memories"):
+        for m in memories:
+            # Lexical-only matches have no vector distance
+            detail = f"distance {m['distance']:.3f}" if m.get("distance") is not None else "keyword match"
+            st.write("•", m["content"], f"({detail})")
 
 # -------------------------------
 # Sidebar: Session Selector
@@ -150,6 +202,9 @@ if not st.session_state.session_id:
 
 session_id = st.session_state.session_id
 session_name = st.session_state.session_name or get_session_name(session_id)
+message_count = next(
+    (s["message_count"] for s in all_sessions if s["session_id"] == session_id), None
+)
 
 # Display session name instead of UUID
 st.caption(f"💬 {session_name}")
@@ -158,15 +213,23 @@ st.caption(f"💬 {session_name}")
 # Load & render history
 # -------------------------------
 try:
-    history_response = requests.get(f"{api}/sessions/{session_id}/history")
-    history_response.raise_for_status()
-    history_data = history_response.json()
-    for m in history_data["messages"]:
+    history = load_history(session_id, message_count)
+    shown = history["messages"][-history["window"]:]
+    if history["has_older"] or len(shown) < len(history["messages"]):
+        if st.button("⬆️ Load older messages"):
+            load_older_history(session_id)
+            st.rerun()
+    for m in shown:
         with st.chat_message(m["role"]):
             st.write(m["content"])
 except requests.exceptions.RequestException as e:
     st.warning(f"Failed to load history: {e}")
 
+# 🔽 Show memories recalled for the last message
+last_recall = st.session_state.get("last_recall", {}).get(session_id)
+if last_recall:
+    show_recalled(last_recall)
+
 # -------------------------------
 # Chat input
 # -------------------------------
@@ -177,33 +240,28 @@ msg = st.chat_input("Enter a message")
 # -------------------------------
 if msg:
     try:
-        # Call chat endpoint
-        response = requests.post(
-            f"{api}/chat",
-            json={"session_id": session_id, "role": "user", "content": msg}
-        )
-        response.raise_for_status()
-        
-        # Refresh session name in case it was auto-renamed
-        updated_name = get_session_name(session_id)
-        if updated_name != session_name:
-            st.session_state.session_name = updated_name
-
-        # 🔽 Recall memories from backend
-        recall_response = requests.get(
-            f"{api}/debug/recall",
-            params={"q": msg, "session_id": session_id}
-        )
-        recall_response.raise_for_status()
-        recall_data = recall_response.json()
+        with st.chat_message("user"):
+            st.write(msg)
 
-        # 🔽 Show recalled memories
-        if recall_data["memories"]:
-            with st.expander("🧠 Recalled Memories"):
-                for m in recall_data["memories"]:
-                    st.write("•", m)
+        # Stream the reply, rendering tokens as they arrive
+        turn = {}
+        with st.chat_message("assistant"):
+            st.write_stream(client.stream_chat(session_id, msg, turn))
 
-        st.rerun()
+        if turn:
+            # The final event carries the session name, persisted messages and
+            # recalled memories. The new turn is already on screen, so it is
+            # only appended to the cache; no rerun redraws the history.
+            st.session_state.session_name = turn["session_name"]
+            cached = st.session_state.get("history_cache", {}).get(session_id)
+            if cached is not None:
+                cached["messages"].extend([turn["user_message"], turn["assistant_message"]])
+                cached["window"] += 2
+                if cached["message_count"] is not None:
+                    cached["message_count"] += 2
+            st.session_state.setdefault("last_recall", {})[session_id] = turn["memories"]
+            if turn["memories"]:
+                show_recalled(turn["memories"])
 
     except requests.exceptions.RequestException as e:
         st.error(f"Failed to send message: {e}")
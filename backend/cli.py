@@ -0,0 +1,333 @@
+"""Command-line maintenance tools.
+
+Usage: python -m backend.cli <command> [options]
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+from .config import (
+    ARCHIVE_AFTER_DAYS, ARCHIVE_BLOCK_MESSAGES, CHROMA_PARTITION, CHROMA_SHARDS, COMPACT_BLOCK, COMPACT_SIMILARITY, EMBED_MAX_BATCH, EMBED_WORKERS,
+    ONNX_MODEL_DIR, SIDECAR_SOCKET,
+)
+from .db.chroma import PARTITION_STRATEGIES
+from .db.sqlite import init_db
+
+
+def _print_progress(stats: dict) -> None:
+    print(
+        f"\r{stats['imported']:>10,} records  {stats['sessions']:>7,} sessions  "
+        f"{stats['records_per_second']:>8,.0f} rec/s",
+        end="", file=sys.stderr, flush=True,
+    )
+
+
+def cmd_import(args: argparse.Namespace) -> None:
+    from .services.ai import embedding_service
+    from .services.importer import import_archive
+
+    embedding_service.configure(max_batch=args.embed_batch, workers=args.embed_workers)
+    try:
+        for path in args.paths:
+            stats = import_archive(
+                Path(path),
+                fmt=args.format,
+                batch_size=args.batch_size,
+                resume=not args.restart,
+                progress=_print_progress,
+            )
+            print(file=sys.stderr)
+            print(json.dumps(stats, indent=2))
+    finally:
+        embedding_service.close()
+
+
+def cmd_repartition(args: argparse.Namespace) -> None:
+    from .db.chroma import repartition
+
+    def progress(stats: dict) -> None:
+        print(f"\r{stats['copied']:>10,} copied  {stats['target_collections']:>7,} collections",
+              end="", file=sys.stderr, flush=True)
+
+    stats = repartition(
+        args.source,
+        args.target,
+        source_shards=args.source_shards,
+        target_shards=args.target_shards,
+        batch_size=args.batch_size,
+        drop_source=args.drop_source,
+        progress=progress,
+    )
+    print(file=sys.stderr)
+    print(json.dumps(stats, indent=2))
+
+
+def cmd_compact(args: argparse.Namespace) -> None:
+    from .services.compaction import compact, llm_summarizer
+
+    def progress(stats: dict) -> None:
+        print(f"\r{stats['sessions']:>7,} sessions  {stats['duplicates']:>8,} duplicates  "
+              f"{stats['rolled_up']:>8,} rolled up", end="", file=sys.stderr, flush=True)
+
+    stats = compact(
+        session_ids=args.session,
+        only_new=not args.all,
+        threshold=args.similarity,
+        block=args.block,
+        summarize=llm_summarizer if args.rollup else None,
+        progress=progress,
+    )
+    print(file=sys.stderr)
+    print(json.dumps(stats, indent=2))
+
+
+def cmd_export_onnx(args: argparse.Namespace) -> None:
+    from .services.ai import export_onnx_model
+
+    print(json.dumps(export_onnx_model(args.model_dir, quantize=args.quantize), indent=2))
+
+
+def cmd_reembed(args: argparse.Namespace) -> None:
+    from .services.ai import embedding_service
+    from .services.memory import reembed_memories
+
+    def progress(stats: dict) -> None:
+        print(f"\r{stats['memories']:>10,} re-embedded", end="", file=sys.stderr, flush=True)
+
+    embedding_service.configure(max_batch=args.embed_batch, workers=args.embed_workers)
+    try:
+        stats = reembed_memories(batch_size=args.batch_size, progress=progress)
+    finally:
+        embedding_service.close()
+    print(file=sys.stderr)
+    print(json.dumps(stats, indent=2))
+
+
+def _print_reconcile(stats: dict) -> None:
+    print(
+        f"\r{stats['index_scanned']:>10,} in index  {stats['messages_scanned']:>10,} messages  "
+        f"{stats['orphans']:>7,} orphans  {stats['reembedded']:>8,} re-embedded  "
+        f"{stats['reembedded_per_second']:>7,.0f}/s",
+        end="", file=sys.stderr, flush=True,
+    )
+
+
+def cmd_reconcile(args: argparse.Namespace) -> None:
+    from .services.ai import embedding_service
+    from .services.reconcile import reconcile
+
+    embedding_service.configure(max_batch=args.embed_batch, workers=args.embed_workers)
+    try:
+        stats = reconcile(
+            batch_size=args.batch_size,
+            page_size=args.page_size,
+            workers=args.workers,
+            dry_run=args.dry_run,
+            progress=_print_reconcile,
+        )
+    finally:
+        embedding_service.close()
+    print(file=sys.stderr)
+    print(json.dumps(stats, indent=2))
+
+
+def cmd_rebuild(args: argparse.Namespace) -> None:
+    from .services.ai import embedding_service
+    from .services.reconcile import rebuild
+
+    embedding_service.configure(max_batch=args.embed_batch, workers=args.embed_workers)
+    try:
+        stats = rebuild(
+            fresh=args.fresh,
+            swap=args.swap,
+            batch_size=args.batch_size,
+            page_size=args.page_size,
+            workers=args.workers,
+            progress=_print_reconcile,
+        )
+    finally:
+        embedding_service.close()
+    print(file=sys.stderr)
+    print(json.dumps(stats, indent=2))
+
+
+def cmd_archive(args: argparse.Namespace) -> None:
+    from .db.archive import archive_sessions
+
+    def progress(stats: dict) -> None:
+        print(f"\r{stats['sessions']:>7,} sessions  {stats['messages']:>10,} messages  "
+              f"{stats['stored_bytes'] / 1e6:>9,.1f} MB stored", end="", file=sys.stderr, flush=True)
+
+    stats = archive_sessions(
+        session_ids=args.session,
+        older_than_days=args.older_than_days,
+        block_messages=args.block_messages,
+        vacuum=args.vacuum,
+        progress=progress,
+    )
+    print(file=sys.stderr)
+    print(json.dumps(stats, indent=2))
+
+
+def cmd_unarchive(args: argparse.Namespace) -> None:
+    from .db.archive import unarchive_sessions
+
+    def progress(stats: dict) -> None:
+        print(f"\r{stats['sessions']:>7,} sessions  {stats['messages']:>10,} messages",
+              end="", file=sys.stderr, flush=True)
+
+    stats = unarchive_sessions(session_ids=None if args.all else args.session, progress=progress)
+    print(file=sys.stderr)
+    print(json.dumps(stats, indent=2))
+
+
+def cmd_sidecar(args: argparse.Namespace) -> None:
+    import logging
+
+    from .services.ai import embedding_service
+    from .services.sidecar import serve
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    embedding_service.configure(max_batch=args.embed_batch, workers=args.embed_workers)
+    serve(args.socket)
+
+
+# Commands that open Chroma and the encoder in this process. With a sidecar
+# configured, their reads and deletes would go to a local client while their
+# writes went through the sidecar, so they always run locally instead.
+_LOCAL_COMMANDS = ("reconcile", "rebuild", "repartition", "compact", "reembed", "archive", "unarchive")
+
+
+def _writes_live_index(args: argparse.Namespace) -> bool:
+    if args.command == "rebuild":
+        return args.swap  # a plain rebuild only fills the green directory
+    return args.command in ("reconcile", "repartition", "compact", "reembed")
+
+
+def _run_locally(args: argparse.Namespace) -> None:
+    """Detach from JOURNAL_SIDECAR_SOCKET; refuse if a running sidecar also writes the live index."""
+    from .services.sidecar import SidecarError, sidecar
+
+    if not sidecar.enabled:
+        return
+    if _writes_live_index(args):
+        try:
+            sidecar.ping()
+        except SidecarError:
+            pass
+        else:
+            sys.exit(f"A sidecar is serving {sidecar.socket_path}; stop it before running `{args.command}`.")
+    sidecar.close()
+    sidecar.socket_path = ""
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m backend.cli", description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("import", help="Bulk-import NDJSON or Markdown journal archives")
+    p.add_argument("paths", nargs="+", help="Archive files (.ndjson/.jsonl or .md)")
+    p.add_argument("--format", choices=["ndjson", "markdown"], help="Override format detection")
+    p.add_argument("--batch-size", type=int, default=2000, help="Records per transaction")
+    p.add_argument("--embed-batch", type=int, default=256, help="Texts per encode call")
+    p.add_argument("--embed-workers", type=int, default=2, help="Parallel embedding workers")
+    p.add_argument("--restart", action="store_true", help="Ignore any saved checkpoint")
+    p.set_defaults(func=cmd_import)
+
+    p = sub.add_parser(
+        "repartition",
+        help="Copy the Chroma index into another partition layout (stop the server first)",
+    )
+    p.add_argument("--from", dest="source", choices=PARTITION_STRATEGIES, default="global",
+                   help="Layout the memories are in now")
+    p.add_argument("--to", dest="target", choices=PARTITION_STRATEGIES, default=CHROMA_PARTITION,
+                   help="Layout to copy into (default: JOURNAL_CHROMA_PARTITION)")
+    p.add_argument("--source-shards", type=int, default=CHROMA_SHARDS)
+    p.add_argument("--target-shards", type=int, default=CHROMA_SHARDS)
+    p.add_argument("--batch-size", type=int, default=1000, help="Records read per page")
+    p.add_argument("--drop-source", action="store_true", help="Delete the old collections after copying")
+    p.set_defaults(func=cmd_repartition)
+
+    p = sub.add_parser("compact", help="Merge near-duplicate memories and roll up old short turns")
+    p.add_argument("--session", action="append", help="Compact only this session (repeatable)")
+    p.add_argument("--all", action="store_true",
+                   help="Rescan every session, not just those with memories added since the last run")
+    p.add_argument("--similarity", type=float, default=COMPACT_SIMILARITY,
+                   help="Cosine similarity at which two memories count as duplicates")
+    p.add_argument("--block", type=int, default=COMPACT_BLOCK, help="Rows compared per matrix block")
+    p.add_argument("--rollup", action="store_true",
+                   help="Also summarize runs of old short messages into single memories (needs Ollama)")
+    p.set_defaults(func=cmd_compact)
+
+    p = sub.add_parser("export-onnx", help="Fetch the ONNX embedding model for JOURNAL_EMBEDDING_BACKEND=onnx")
+    p.add_argument("--model-dir", type=Path, default=ONNX_MODEL_DIR)
+    p.add_argument("--quantize", action="store_true", help="Also write int8 dynamically quantized weights")
+    p.set_defaults(func=cmd_export_onnx)
+
+    p = sub.add_parser(
+        "reembed",
+        help="Recompute every stored memory vector with the configured encoder (stop the server first)",
+    )
+    p.add_argument("--batch-size", type=int, default=512, help="Memories read per page")
+    p.add_argument("--embed-batch", type=int, default=256, help="Texts per encode call")
+    p.add_argument("--embed-workers", type=int, default=2, help="Parallel embedding workers")
+    p.set_defaults(func=cmd_reembed)
+
+    p = sub.add_parser("reconcile", help="Repair drift between SQLite messages and the Chroma index")
+    p.add_argument("--dry-run", action="store_true", help="Only report what would change")
+    p.set_defaults(func=cmd_reconcile)
+
+    p = sub.add_parser(
+        "rebuild",
+        help="Build a fresh index beside the live one; --swap replaces it (stop the server first)",
+    )
+    p.add_argument("--fresh", action="store_true", help="Discard a partly built index and start over")
+    p.add_argument("--swap", action="store_true", help="Catch up and make the new index the live one")
+    p.set_defaults(func=cmd_rebuild)
+
+    p = sub.add_parser("archive", help="Move inactive sessions' messages into compressed archive segments")
+    p.add_argument("--session", action="append", help="Archive this session regardless of activity (repeatable)")
+    p.add_argument("--older-than-days", type=float, default=ARCHIVE_AFTER_DAYS,
+                   help="Archive sessions inactive this long (default: JOURNAL_ARCHIVE_AFTER_DAYS)")
+    p.add_argument("--block-messages", type=int, default=ARCHIVE_BLOCK_MESSAGES, help="Messages per compressed block")
+    p.add_argument("--vacuum", action="store_true",
+                   help="Shrink journal.db afterwards (rewrites the file; best with the server stopped)")
+    p.set_defaults(func=cmd_archive)
+
+    p = sub.add_parser("unarchive", help="Move archived sessions back into the database")
+    group = p.add_mutually_exclusive_group(required=True)
+    group.add_argument("--session", action="append", help="Session to restore (repeatable)")
+    group.add_argument("--all", action="store_true", help="Restore every archived session")
+    p.set_defaults(func=cmd_unarchive)
+
+    p = sub.add_parser(
+        "sidecar",
+        help="Serve embeddings and the Chroma index to server workers over a Unix socket",
+    )
+    p.add_argument("--socket", default=SIDECAR_SOCKET, help="Socket path (default: JOURNAL_SIDECAR_SOCKET)")
+    p.add_argument("--embed-batch", type=int, default=EMBED_MAX_BATCH, help="Texts per encode call")
+    p.add_argument("--embed-workers", type=int, default=EMBED_WORKERS, help="Parallel embedding workers")
+    p.set_defaults(func=cmd_sidecar)
+
+    for name in ("reconcile", "rebuild"):
+        p = sub.choices[name]
+        p.add_argument("--batch-size", type=int, default=256, help="Messages embedded per upsert")
+        p.add_argument("--page-size", type=int, default=1000, help="Index records read per page")
+        p.add_argument("--workers", type=int, default=2, help="Batches re-embedded in parallel")
+        p.add_argument("--embed-batch", type=int, default=256, help="Texts per encode call")
+        p.add_argument("--embed-workers", type=int, default=2, help="Parallel embedding workers")
+
+    return parser
+
+
+def main(argv=None) -> None:
+    args = build_parser().parse_args(argv)
+    if args.command in _LOCAL_COMMANDS:
+        _run_locally(args)
+    init_db()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
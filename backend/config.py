@@ -0,0 +1,132 @@
+"""Runtime configuration, read once from environment variables."""
+import os
+from pathlib import Path
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    return value.lower() in ("1", "true", "yes", "on") if value else default
+
+
+# Storage locations (default: data/ and chroma_data/ at the project root)
+PROJECT_ROOT = Path(__file__).parent.parent
+DATA_DIR = Path(os.getenv("JOURNAL_DATA_DIR") or PROJECT_ROOT / "data")
+CHROMA_DIR = Path(os.getenv("JOURNAL_CHROMA_DIR") or PROJECT_ROOT / "chroma_data")
+
+# Chroma layout: "global" (one collection filtered by session), "session" (one
+# collection per session) or "shard" (sessions hashed into CHROMA_SHARDS
+# collections). Switch layouts with `python -m backend.cli repartition`.
+CHROMA_PARTITION = os.getenv("JOURNAL_CHROMA_PARTITION", "global")
+CHROMA_SHARDS = _env_int("JOURNAL_CHROMA_SHARDS", 16)
+# Open collection handles kept in the LRU
+CHROMA_HANDLE_CACHE = _env_int("JOURNAL_CHROMA_HANDLE_CACHE", 256)
+
+# Load Chroma and the embedding model in the background at startup (gates /readyz)
+WARMUP = _env_bool("JOURNAL_WARMUP", True)
+
+# Thread pools used to keep blocking work off the event loop
+IO_WORKERS = _env_int("JOURNAL_IO_WORKERS", 16)
+
+# Embeddings
+EMBEDDING_MODEL = os.getenv("JOURNAL_EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+# "sentence-transformers" (PyTorch), "onnx" (ONNX Runtime, no torch import), or
+# "hash" for a deterministic, model-free stand-in (benchmarks, offline runs)
+EMBEDDING_BACKEND = os.getenv("JOURNAL_EMBEDDING_BACKEND", "sentence-transformers")
+# ONNX backend: model files written by `python -m backend.cli export-onnx`, int8
+# dynamic quantization, and ONNX Runtime intra-op threads (0: one per core)
+ONNX_MODEL_DIR = Path(os.getenv("JOURNAL_ONNX_MODEL_DIR") or DATA_DIR / "onnx" / EMBEDDING_MODEL.replace("/", "--"))
+ONNX_QUANTIZE = _env_bool("JOURNAL_ONNX_QUANTIZE", False)
+ONNX_THREADS = _env_int("JOURNAL_ONNX_THREADS", 0)
+# Micro-batching: flush when a batch is full or its oldest request has waited this long
+EMBED_MAX_BATCH = _env_int("JOURNAL_EMBED_MAX_BATCH", 32)
+EMBED_MAX_WAIT_MS = _env_int("JOURNAL_EMBED_MAX_WAIT_MS", 5)
+EMBED_WORKERS = _env_int("JOURNAL_EMBED_WORKERS", 1)
+# Embedding cache: in-memory LRU size, plus optional write-through to data/embedding_cache.db
+EMBED_CACHE_SIZE = _env_int("JOURNAL_EMBED_CACHE_SIZE", 10_000)
+EMBED_CACHE_PERSIST = _env_bool("JOURNAL_EMBED_CACHE_PERSIST", False)
+EMBED_CACHE_DISK_SIZE = _env_int("JOURNAL_EMBED_CACHE_DISK_SIZE", 200_000)
+
+# Embedding/index sidecar (`python -m backend.cli sidecar`): when set, the server
+# sends embeds, vector queries and upserts to the process listening on this Unix
+# socket instead of loading the model and opening Chroma itself. Each server
+# process keeps up to SIDECAR_POOL connections.
+SIDECAR_SOCKET = os.getenv("JOURNAL_SIDECAR_SOCKET", "")
+SIDECAR_POOL = _env_int("JOURNAL_SIDECAR_POOL", 8)
+SIDECAR_TIMEOUT = _env_float("JOURNAL_SIDECAR_TIMEOUT", 30.0)
+
+# Recall: "hybrid" fuses BM25 (SQLite FTS5) and vector results, "lexical" skips
+# embedding and Chroma entirely, "vector" is Chroma only
+RECALL_MODE = os.getenv("JOURNAL_RECALL_MODE", "hybrid")
+# Reciprocal-rank fusion constant: larger values flatten the advantage of top ranks
+RECALL_RRF_K = _env_int("JOURNAL_RECALL_RRF_K", 60)
+# Recall result cache, invalidated per session on write (0 entries disables it;
+# always off with SIDECAR_SOCKET, since other processes' writes are not seen)
+RECALL_CACHE_SIZE = _env_int("JOURNAL_RECALL_CACHE_SIZE", 2048)
+RECALL_CACHE_TTL = _env_int("JOURNAL_RECALL_CACHE_TTL", 300)
+# Newest outbox rows (not yet indexed) embedded into each vector recall
+RECALL_PENDING_LIMIT = _env_int("JOURNAL_RECALL_PENDING_LIMIT", 32)
+
+# Memory compaction: memories of the same role whose embeddings have cosine
+# similarity >= COMPACT_SIMILARITY are merged into one, compared in blocks of
+# COMPACT_BLOCK rows. COMPACT_INTERVAL > 0 runs it in the server every that
+# many seconds.
+COMPACT_SIMILARITY = _env_float("JOURNAL_COMPACT_SIMILARITY", 0.95)
+COMPACT_BLOCK = _env_int("JOURNAL_COMPACT_BLOCK", 1024)
+COMPACT_INTERVAL = _env_int("JOURNAL_COMPACT_INTERVAL", 0)
+# Roll-ups (`backend.cli compact --rollup`, needs the LLM): runs of up to
+# ROLLUP_BATCH messages of at most ROLLUP_MAX_CHARS, older than ROLLUP_AGE_DAYS,
+# become one summary memory
+COMPACT_ROLLUP_AGE_DAYS = _env_float("JOURNAL_COMPACT_ROLLUP_AGE_DAYS", 30.0)
+COMPACT_ROLLUP_MAX_CHARS = _env_int("JOURNAL_COMPACT_ROLLUP_MAX_CHARS", 160)
+COMPACT_ROLLUP_BATCH = _env_int("JOURNAL_COMPACT_ROLLUP_BATCH", 40)
+
+# Archive tier (`python -m backend.cli archive`): sessions inactive for
+# ARCHIVE_AFTER_DAYS move into zlib blocks of up to ARCHIVE_BLOCK_MESSAGES
+# messages, appended to segment files of about ARCHIVE_SEGMENT_MB under
+# ARCHIVE_DIR. Reads keep ARCHIVE_CACHE_BLOCKS decoded blocks in an LRU.
+ARCHIVE_DIR = Path(os.getenv("JOURNAL_ARCHIVE_DIR") or DATA_DIR / "archive")
+ARCHIVE_AFTER_DAYS = _env_float("JOURNAL_ARCHIVE_AFTER_DAYS", 180.0)
+ARCHIVE_BLOCK_MESSAGES = _env_int("JOURNAL_ARCHIVE_BLOCK_MESSAGES", 256)
+ARCHIVE_SEGMENT_MB = _env_int("JOURNAL_ARCHIVE_SEGMENT_MB", 64)
+ARCHIVE_CACHE_BLOCKS = _env_int("JOURNAL_ARCHIVE_CACHE_BLOCKS", 64)
+ARCHIVE_COMPRESSION_LEVEL = _env_int("JOURNAL_ARCHIVE_COMPRESSION_LEVEL", 9)
+
+# History
+HISTORY_PAGE_MAX = _env_int("JOURNAL_HISTORY_PAGE_MAX", 1000)
+SESSIONS_PAGE_MAX = _env_int("JOURNAL_SESSIONS_PAGE_MAX", 500)
+# Most recent messages loaded into each /chat turn
+CHAT_HISTORY_LIMIT = _env_int("JOURNAL_CHAT_HISTORY_LIMIT", 50)
+
+# Prompt assembly (token counts are approximate, see services.context.count_tokens)
+PROMPT_TOKEN_BUDGET = _env_int("JOURNAL_PROMPT_TOKEN_BUDGET", 3000)
+PROMPT_RECENT_MESSAGES = _env_int("JOURNAL_PROMPT_RECENT_MESSAGES", 12)
+PROMPT_MEMORY_BUDGET = _env_int("JOURNAL_PROMPT_MEMORY_BUDGET", 600)
+PROMPT_SUMMARY_BUDGET = _env_int("JOURNAL_PROMPT_SUMMARY_BUDGET", 400)
+# Messages folded into the summary per refresh
+SUMMARY_BATCH_MESSAGES = _env_int("JOURNAL_SUMMARY_BATCH_MESSAGES", 100)
+
+# LLM
+OLLAMA_MODEL = os.getenv("JOURNAL_OLLAMA_MODEL", "llama3.1")
+# Scheduler: concurrent generations, turns allowed to wait (beyond that: 429),
+# and prompts up to LLM_SHORT_PROMPT_TOKENS jump ahead of longer ones queued
+# up to LLM_SHORT_PROMPT_BOOST seconds earlier
+LLM_MAX_CONCURRENT = _env_int("JOURNAL_LLM_MAX_CONCURRENT", 2)
+LLM_MAX_QUEUE = _env_int("JOURNAL_LLM_MAX_QUEUE", 32)
+LLM_SHORT_PROMPT_TOKENS = _env_int("JOURNAL_LLM_SHORT_PROMPT_TOKENS", 500)
+LLM_SHORT_PROMPT_BOOST = _env_float("JOURNAL_LLM_SHORT_PROMPT_BOOST", 5.0)
+
+# Profiling: sample this fraction of requests with pyinstrument and write flame
+# graphs of those slower than PROFILE_MIN_MS to PROFILE_DIR (unset disables it)
+PROFILE_DIR = os.getenv("JOURNAL_PROFILE_DIR", "")
+PROFILE_SAMPLE_RATE = _env_float("JOURNAL_PROFILE_SAMPLE_RATE", 0.1)
+PROFILE_MIN_MS = _env_int("JOURNAL_PROFILE_MIN_MS", 500)
@@ -0,0 +1,494 @@
+"""Archive tier: message text of inactive sessions in compressed, append-only segments.
+
+Archiving a session moves its messages out of the hot ``messages`` table
+into zlib-compressed blocks of up to ARCHIVE_BLOCK_MESSAGES messages,
+appended to ``segment-NNNNNN.seg`` files in ARCHIVE_DIR.
+``archive_blocks`` records where each block lives and ``archived_messages``
+keeps every message's id, ordering key and block, so history pages are still
+keyset queries and only the blocks a page touches are read and decompressed.
+Memories in Chroma are untouched, so vector recall keeps working, and the
+text moves from ``messages_fts`` to the contentless ``archived_fts`` keyword
+index, so lexical recall does too. New messages in an archived session go to the hot table as
+usual and history reads merge both tiers.
+
+Segments are never rewritten: unarchiving leaves its blocks behind as dead
+bytes (see archive_stats) until no block in the segment is live, when the
+file is deleted.
+"""
+import json
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ..config import (
+    ARCHIVE_AFTER_DAYS, ARCHIVE_BLOCK_MESSAGES, ARCHIVE_CACHE_BLOCKS, ARCHIVE_COMPRESSION_LEVEL, ARCHIVE_DIR,
+    ARCHIVE_SEGMENT_MB,
+)
+from ..metrics import stage, timed
+from .sqlite import DB_PATH, get_conn, transaction
+
+_SEGMENT_PREFIX = "segment-"
+_SEGMENT_SUFFIX = ".seg"
+_BLOCK_COLUMNS = "block_id, session_id, segment, offset, length, crc32"
+
+
+class ArchiveError(RuntimeError):
+    """A block could not be read back intact."""
+
+
+# -------------------------------
+# Decoded block cache
+# -------------------------------
+BlockKey = Tuple[str, int, int, int]
+
+
+def _block_key(block: Dict[str, Any]) -> BlockKey:
+    return block["segment"], block["offset"], block["length"], block["crc32"]
+
+
+class BlockCache:
+    """LRU of decoded blocks, so paging through a session decompresses each block once.
+
+    Blocks are keyed by where they live and their checksum, not by block_id:
+    ids are reused once a session is unarchived, and another process (the
+    CLI) may have moved blocks without this process seeing ``discard``.
+    """
+
+    def __init__(self, max_entries: int = ARCHIVE_CACHE_BLOCKS) -> None:
+        self.max_entries = max_entries
+        self._blocks: "OrderedDict[BlockKey, List[Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: BlockKey) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            messages = self._blocks.get(key)
+            if messages is None:
+                self.misses += 1
+                return None
+            self._blocks.move_to_end(key)
+            self.hits += 1
+            return messages
+
+    def put(self, key: BlockKey, messages: List[Dict[str, Any]]) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._blocks[key] = messages
+            self._blocks.move_to_end(key)
+            while len(self._blocks) > self.max_entries:
+                self._blocks.popitem(last=False)
+
+    def discard(self, keys: List[BlockKey]) -> None:
+        with self._lock:
+            for key in keys:
+                self._blocks.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._blocks),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+block_cache = BlockCache()
+
+
+# -------------------------------
+# Segment files
+# -------------------------------
+def _segments() -> List[Path]:
+    if not ARCHIVE_DIR.exists():
+        return []
+    return sorted(ARCHIVE_DIR.glob(f"{_SEGMENT_PREFIX}*{_SEGMENT_SUFFIX}"))
+
+
+class _SegmentWriter:
+    """Appends blocks to the newest segment, starting a new one once it is full.
+
+    Data is fsynced on close, before the index rows pointing at it commit.
+    """
+
+    def __init__(self) -> None:
+        ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+        segments = _segments()
+        self._number = int(segments[-1].stem[len(_SEGMENT_PREFIX):]) if segments else 1
+        self._file = None
+
+    def _open(self, incoming: int):
+        limit = ARCHIVE_SEGMENT_MB * 1024 * 1024
+        while True:
+            if self._file is None:
+                path = ARCHIVE_DIR / f"{_SEGMENT_PREFIX}{self._number:06d}{_SEGMENT_SUFFIX}"
+                self._file = open(path, "ab")
+                self._file.seek(0, os.SEEK_END)
+            offset = self._file.tell()
+            if offset == 0 or offset + incoming <= limit:
+                return self._file, offset
+            self._close_file()
+            self._number += 1
+
+    def append(self, data: bytes) -> tuple[str, int]:
+        f, offset = self._open(len(data))
+        f.write(data)
+        return Path(f.name).name, offset
+
+    def _close_file(self) -> None:
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+
+    def close(self) -> None:
+        self._close_file()
+
+
+def _encode_block(messages: List[Dict[str, Any]]) -> tuple[bytes, int]:
+    raw = json.dumps(
+        [[m["id"], m["role"], m["content"], m["created_at"]] for m in messages],
+        ensure_ascii=False, separators=(",", ":"),
+    ).encode("utf-8")
+    return zlib.compress(raw, ARCHIVE_COMPRESSION_LEVEL), len(raw)
+
+
+def _read_block(block: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Messages of one block, oldest first, decoded on first use."""
+    key = _block_key(block)
+    messages = block_cache.get(key)
+    if messages is not None:
+        return messages
+    with stage("archive.read_block"):
+        with open(ARCHIVE_DIR / block["segment"], "rb") as f:
+            f.seek(block["offset"])
+            data = f.read(block["length"])
+        if len(data) != block["length"] or zlib.crc32(data) != block["crc32"]:
+            raise ArchiveError(f"Archive block {block['block_id']} in {block['segment']} is damaged")
+        rows = json.loads(zlib.decompress(data))
+    messages = [
+        {"id": id_, "session_id": block["session_id"], "role": role, "content": content, "created_at": created_at}
+        for id_, role, content, created_at in rows
+    ]
+    block_cache.put(key, messages)
+    return messages
+
+
+def _blocks(block_ids: List[int]) -> List[Dict[str, Any]]:
+    if not block_ids:
+        return []
+    placeholders = ",".join("?" * len(block_ids))
+    rows = get_conn().execute(
+        f"SELECT {_BLOCK_COLUMNS} FROM archive_blocks WHERE block_id IN ({placeholders})", block_ids
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+
+# -------------------------------
+# Reads
+# -------------------------------
+@timed("archive.read_messages")
+def read_archived_messages(message_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    """Archived messages among ``message_ids``, by id."""
+    if not message_ids:
+        return {}
+    conn = get_conn()
+    placeholders = ",".join("?" * len(message_ids))
+    rows = conn.execute(
+        f"SELECT id, block_id FROM archived_messages WHERE id IN ({placeholders})", message_ids
+    ).fetchall()
+    wanted = {row["id"] for row in rows}
+    found: Dict[int, Dict[str, Any]] = {}
+    for block in _blocks(sorted({row["block_id"] for row in rows})):
+        for message in _read_block(block):
+            if message["id"] in wanted:
+                found[message["id"]] = dict(message)
+    return found
+
+
+@timed("archive.get_history")
+def get_archived_history(
+    session_id: str,
+    *,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None,
+    oldest_first: bool = False,
+) -> List[Dict[str, Any]]:
+    """sqlite.get_history over both tiers of a session that has archived messages.
+
+    The page is chosen from the ordering keys alone; then hot rows are
+    fetched and only the archived blocks the page touches are decoded.
+    """
+    conn = get_conn()
+    query = """
+        SELECT id, block_id FROM (
+            SELECT id, created_at, NULL AS block_id FROM messages WHERE session_id = :session_id
+            UNION ALL
+            SELECT id, created_at, block_id FROM archived_messages WHERE session_id = :session_id
+        ) WHERE 1
+    """
+    params: Dict[str, Any] = {"session_id": session_id}
+    anchor = """(
+        SELECT created_at, id FROM messages WHERE id = :{0}
+        UNION ALL SELECT created_at, id FROM archived_messages WHERE id = :{0}
+    )"""
+    if after_id is not None:
+        query += f" AND (created_at, id) > {anchor.format('after_id')}"
+        params["after_id"] = after_id
+    if before_id is not None:
+        query += f" AND (created_at, id) < {anchor.format('before_id')}"
+        params["before_id"] = before_id
+
+    newest_first = limit is not None and after_id is None and not oldest_first
+    query += " ORDER BY created_at DESC, id DESC" if newest_first else " ORDER BY created_at ASC, id ASC"
+    if limit is not None:
+        query += " LIMIT :limit"
+        params["limit"] = limit
+
+    keys = conn.execute(query, params).fetchall()
+    if newest_first:
+        keys.reverse()
+
+    hot_ids = [row["id"] for row in keys if row["block_id"] is None]
+    found: Dict[int, Dict[str, Any]] = {}
+    if hot_ids:
+        placeholders = ",".join("?" * len(hot_ids))
+        for row in conn.execute(
+            f"SELECT id, session_id, role, content, created_at FROM messages WHERE id IN ({placeholders})", hot_ids
+        ):
+            found[row["id"]] = dict(row)
+    wanted = {row["id"] for row in keys if row["block_id"] is not None}
+    for block in _blocks(sorted({row["block_id"] for row in keys if row["block_id"] is not None})):
+        for message in _read_block(block):
+            if message["id"] in wanted:
+                found[message["id"]] = dict(message)
+    return [found[row["id"]] for row in keys if row["id"] in found]
+
+
+# -------------------------------
+# Moving sessions between tiers
+# -------------------------------
+def get_archive_candidates(older_than_days: float = ARCHIVE_AFTER_DAYS) -> List[str]:
+    """Sessions inactive for ``older_than_days`` that still have hot messages, least recent first.
+
+    Sessions with messages waiting in the memory outbox are left for a later
+    run, so every archived message already has its memory.
+    """
+    rows = get_conn().execute("""
+        SELECT s.session_id FROM sessions s
+        WHERE datetime(s.last_activity) < datetime('now', ?)
+          AND EXISTS (SELECT 1 FROM messages m WHERE m.session_id = s.session_id)
+          AND NOT EXISTS (SELECT 1 FROM memory_outbox o WHERE o.session_id = s.session_id)
+        ORDER BY s.last_activity, s.session_id
+    """, (f"-{older_than_days} days",)).fetchall()
+    return [row["session_id"] for row in rows]
+
+
+@timed("archive.session")
+def archive_session(session_id: str, *, block_messages: int = ARCHIVE_BLOCK_MESSAGES) -> Dict[str, Any]:
+    """Move a session's hot messages into the archive in one transaction.
+
+    Blocks are appended and fsynced before the transaction that indexes them
+    and deletes the hot rows commits; if it never does, they are dead bytes.
+    """
+    stats = {"session_id": session_id, "messages": 0, "blocks": 0, "text_bytes": 0, "raw_bytes": 0, "stored_bytes": 0}
+    with transaction() as conn:
+        if conn.execute("SELECT 1 FROM memory_outbox WHERE session_id = ? LIMIT 1", (session_id,)).fetchone():
+            stats["skipped"] = "messages waiting to be indexed"
+            return stats
+        messages = [dict(row) for row in conn.execute("""
+            SELECT id, role, content, created_at FROM messages WHERE session_id = ? ORDER BY created_at, id
+        """, (session_id,))]
+        if not messages:
+            return stats
+
+        writer = _SegmentWriter()
+        try:
+            blocks = []
+            for start in range(0, len(messages), max(1, block_messages)):
+                chunk = messages[start:start + max(1, block_messages)]
+                data, raw_length = _encode_block(chunk)
+                segment, offset = writer.append(data)
+                blocks.append((chunk, segment, offset, data, raw_length))
+        finally:
+            writer.close()
+
+        for chunk, segment, offset, data, raw_length in blocks:
+            cursor = conn.execute("""
+                INSERT INTO archive_blocks (session_id, segment, offset, length, raw_length, crc32, message_count)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (session_id, segment, offset, len(data), raw_length, zlib.crc32(data), len(chunk)))
+            conn.executemany(
+                "INSERT INTO archived_messages (id, session_id, created_at, block_id) VALUES (?, ?, ?, ?)",
+                [(m["id"], session_id, m["created_at"], cursor.lastrowid) for m in chunk],
+            )
+            conn.executemany(
+                "INSERT INTO archived_fts (rowid, content, session_id) VALUES (?, ?, ?)",
+                [(m["id"], m["content"], session_id) for m in chunk],
+            )
+            stats["raw_bytes"] += raw_length
+            stats["stored_bytes"] += len(data)
+        conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+        stats["messages"] = len(messages)
+        stats["blocks"] = len(blocks)
+        stats["text_bytes"] = sum(len(m["content"].encode("utf-8")) for m in messages)
+
+        conn.execute("""
+            INSERT INTO archived_sessions (session_id, message_count, raw_bytes, stored_bytes, archived_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(session_id) DO UPDATE SET
+                message_count = message_count + excluded.message_count,
+                raw_bytes = raw_bytes + excluded.raw_bytes,
+                stored_bytes = stored_bytes + excluded.stored_bytes,
+                archived_at = excluded.archived_at
+        """, (session_id, stats["messages"], stats["raw_bytes"], stats["stored_bytes"], time.time()))
+    return stats
+
+
+@timed("archive.unarchive_session")
+def unarchive_session(session_id: str) -> Dict[str, Any]:
+    """Move a session's archived messages back into the hot table (and messages_fts)."""
+    stats = {"session_id": session_id, "messages": 0, "blocks": 0, "stored_bytes": 0}
+    with transaction() as conn:
+        blocks = [dict(row) for row in conn.execute(
+            f"SELECT {_BLOCK_COLUMNS} FROM archive_blocks WHERE session_id = ? ORDER BY block_id", (session_id,)
+        )]
+        if not blocks:
+            return stats
+        messages = [m for block in blocks for m in _read_block(block)]
+        conn.executemany("""
+            INSERT INTO messages (id, session_id, role, content, created_at) VALUES (?, ?, ?, ?, ?)
+        """, [(m["id"], session_id, m["role"], m["content"], m["created_at"]) for m in messages])
+        # Contentless FTS rows are deleted by restating the text they indexed
+        conn.executemany(
+            "INSERT INTO archived_fts (archived_fts, rowid, content, session_id) VALUES ('delete', ?, ?, ?)",
+            [(m["id"], m["content"], session_id) for m in messages],
+        )
+        conn.execute("DELETE FROM archived_messages WHERE session_id = ?", (session_id,))
+        conn.execute("DELETE FROM archive_blocks WHERE session_id = ?", (session_id,))
+        conn.execute("DELETE FROM archived_sessions WHERE session_id = ?", (session_id,))
+        stats["messages"] = len(messages)
+        stats["blocks"] = len(blocks)
+        stats["stored_bytes"] = sum(block["length"] for block in blocks)
+    block_cache.discard([_block_key(block) for block in blocks])
+    return stats
+
+
+def _drop_dead_segments() -> int:
+    """Delete segment files no block points at any more; returns the bytes freed."""
+    freed = 0
+    # Under the write lock, so no archiver is appending to a segment meanwhile
+    with transaction() as conn:
+        live = {row["segment"] for row in conn.execute("SELECT DISTINCT segment FROM archive_blocks")}
+        for path in _segments():
+            if path.name not in live:
+                freed += path.stat().st_size
+                path.unlink()
+    return freed
+
+
+def _db_bytes() -> int:
+    return sum(p.stat().st_size for p in (DB_PATH, Path(f"{DB_PATH}-wal")) if p.exists())
+
+
+def _reclaimable_bytes() -> int:
+    conn = get_conn()
+    return conn.execute("PRAGMA freelist_count").fetchone()[0] * conn.execute("PRAGMA page_size").fetchone()[0]
+
+
+def _vacuum() -> None:
+    conn = get_conn()
+    conn.execute("VACUUM")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def archive_sessions(
+    *,
+    session_ids: Optional[List[str]] = None,
+    older_than_days: float = ARCHIVE_AFTER_DAYS,
+    block_messages: int = ARCHIVE_BLOCK_MESSAGES,
+    vacuum: bool = False,
+    progress: Optional[Callable[[dict], None]] = None,
+) -> Dict[str, Any]:
+    """Archive ``session_ids``, or every session inactive for ``older_than_days``.
+
+    Deleted rows leave free pages in journal.db that new messages reuse;
+    ``vacuum`` rewrites the file to return them to the filesystem.
+    """
+    started = time.perf_counter()
+    targets = session_ids if session_ids is not None else get_archive_candidates(older_than_days)
+    stats: Dict[str, Any] = {
+        "db_bytes_before": _db_bytes(),
+        "sessions": 0, "skipped": 0, "messages": 0, "blocks": 0,
+        "text_bytes": 0, "raw_bytes": 0, "stored_bytes": 0,
+    }
+    for session_id in targets:
+        result = archive_session(session_id, block_messages=block_messages)
+        if result.get("skipped"):
+            stats["skipped"] += 1
+        elif result["messages"]:
+            stats["sessions"] += 1
+            for key in ("messages", "blocks", "text_bytes", "raw_bytes", "stored_bytes"):
+                stats[key] += result[key]
+        if progress is not None:
+            progress(stats)
+
+    stats["compression_ratio"] = stats["raw_bytes"] / stats["stored_bytes"] if stats["stored_bytes"] else 0.0
+    stats["db_reclaimable_bytes"] = _reclaimable_bytes()
+    if vacuum:
+        _vacuum()
+    stats["db_bytes_after"] = _db_bytes()
+    stats["seconds"] = time.perf_counter() - started
+    return stats
+
+
+def unarchive_sessions(
+    *, session_ids: Optional[List[str]] = None, progress: Optional[Callable[[dict], None]] = None,
+) -> Dict[str, Any]:
+    """Bring ``session_ids`` (default: every archived session) back to the hot table."""
+    started = time.perf_counter()
+    if session_ids is None:
+        session_ids = [row["session_id"] for row in get_conn().execute(
+            "SELECT session_id FROM archived_sessions ORDER BY session_id"
+        )]
+    stats: Dict[str, Any] = {"db_bytes_before": _db_bytes(), "sessions": 0, "messages": 0, "blocks": 0, "stored_bytes": 0}
+    for session_id in session_ids:
+        result = unarchive_session(session_id)
+        if result["messages"]:
+            stats["sessions"] += 1
+            for key in ("messages", "blocks", "stored_bytes"):
+                stats[key] += result[key]
+        if progress is not None:
+            progress(stats)
+    stats["segment_bytes_freed"] = _drop_dead_segments()
+    stats["db_bytes_after"] = _db_bytes()
+    stats["seconds"] = time.perf_counter() - started
+    return stats
+
+
+def archive_stats() -> Dict[str, Any]:
+    """Size of the archive tier, including bytes left behind by unarchived sessions."""
+    conn = get_conn()
+    row = conn.execute("""
+        SELECT COUNT(*) AS sessions, COALESCE(SUM(message_count), 0) AS messages,
+               COALESCE(SUM(raw_bytes), 0) AS raw_bytes, COALESCE(SUM(stored_bytes), 0) AS stored_bytes
+        FROM archived_sessions
+    """).fetchone()
+    segment_bytes = sum(p.stat().st_size for p in _segments())
+    return {
+        **dict(row),
+        "segments": len(_segments()),
+        "segment_bytes": segment_bytes,
+        "dead_bytes": segment_bytes - row["stored_bytes"],
+        "block_cache": block_cache.stats(),
+    }
@@ -1,16 +1,290 @@
-import chromadb
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
 from pathlib import Path
+import chromadb
+from chromadb import Collection, Documents, EmbeddingFunction, Embeddings
+from chromadb.api import ClientAPI
+from chromadb.errors import NotFoundError
+from chromadb.utils.embedding_functions import register_embedding_function
+from typing import Any, Callable, Dict, List, Optional
+
+from ..config import CHROMA_DIR, CHROMA_HANDLE_CACHE, CHROMA_PARTITION, CHROMA_SHARDS, EMBEDDING_MODEL
+
+logger = logging.getLogger(__name__)
+
+
+@register_embedding_function
+class JournalEmbeddingFunction(EmbeddingFunction[Documents]):
+    """Chroma embedding function backed by the app's own encoder.
+
+    Binding the collection to this function means Chroma never loads its
+    default model, and anything it embeds comes from the same encoder as the
+    vectors we pass in explicitly.
+    """
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL) -> None:
+        self.model_name = model_name
+
+    def __call__(self, input: Documents) -> Embeddings:
+        # Imported lazily: services.memory imports this module
+        from ..services.ai import embed_texts
+        return embed_texts(list(input))
+
+    @staticmethod
+    def name() -> str:
+        return "journal-encoder"
+
+    def get_config(self) -> Dict[str, Any]:
+        return {"model_name": self.model_name}
+
+    @staticmethod
+    def build_from_config(config: Dict[str, Any]) -> "JournalEmbeddingFunction":
+        return JournalEmbeddingFunction(config.get("model_name", EMBEDDING_MODEL))
+
+
+embedding_function = JournalEmbeddingFunction()
+
+# -------------------------------
+# Partitioning
+# -------------------------------
+# "global": one collection, filtered by session_id metadata at query time.
+# "session": one collection per session, so a query only walks that session's graph.
+# "shard": sessions hashed into CHROMA_SHARDS collections, still filtered by session_id.
+PARTITION_STRATEGIES = ("global", "session", "shard")
+GLOBAL_COLLECTION = "journal_memories"
+_SESSION_PREFIX = "journal_session_"
+
+if CHROMA_PARTITION not in PARTITION_STRATEGIES:
+    raise ValueError(f"Unknown JOURNAL_CHROMA_PARTITION {CHROMA_PARTITION!r}; expected one of {PARTITION_STRATEGIES}")
+
+
+def _shard_prefix(shards: int) -> str:
+    # The shard count is part of the name, so layouts with different counts never mix
+    return f"journal_shards{shards}_"
+
+
+def _stable_hash(session_id: str) -> bytes:
+    return hashlib.blake2b(session_id.encode("utf-8"), digest_size=16).digest()
+
+
+def collection_name(session_id: str, strategy: str = CHROMA_PARTITION, shards: int = CHROMA_SHARDS) -> str:
+    """Name of the collection holding ``session_id``'s memories under ``strategy``."""
+    if strategy == "global":
+        return GLOBAL_COLLECTION
+    if strategy == "session":
+        # Hashed: session ids are arbitrary strings, collection names are not
+        return _SESSION_PREFIX + _stable_hash(session_id).hex()
+    if strategy == "shard":
+        return f"{_shard_prefix(shards)}{int.from_bytes(_stable_hash(session_id)[:8], 'little') % shards:04d}"
+    raise ValueError(f"Unknown partition strategy {strategy!r}")
+
+
+def _in_layout(name: str, strategy: str, shards: int) -> bool:
+    if strategy == "global":
+        return name == GLOBAL_COLLECTION
+    if strategy == "session":
+        return name.startswith(_SESSION_PREFIX)
+    return name.startswith(_shard_prefix(shards))
+
+
+def session_filter(session_id: str) -> Optional[Dict[str, Any]]:
+    """Metadata filter for a session's query; unneeded when it has its own collection."""
+    return None if CHROMA_PARTITION == "session" else {"session_id": session_id}
+
+
+# -------------------------------
+# Client and collection handles
+# -------------------------------
+_client: Optional[ClientAPI] = None
+_lock = threading.Lock()
+# Open collection handles, least recently used first
+_handles: "OrderedDict[str, Collection]" = OrderedDict()
+_handles_lock = threading.Lock()
+
+
+# Directory the client opens; maintenance tools can point it elsewhere (use_directory)
+_directory = CHROMA_DIR
+
+
+def get_client() -> ClientAPI:
+    """Open the PersistentClient on first use."""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = chromadb.PersistentClient(
+                    path=str(_directory),
+                    settings=chromadb.Settings(anonymized_telemetry=False)
+                )
+    return _client
+
+
+def use_directory(path: Path) -> None:
+    """Drop the open client and handles; the next use opens the index at ``path``.
+
+    For maintenance tools building or swapping an index (services.reconcile);
+    the server always uses CHROMA_DIR.
+    """
+    global _client, _directory
+    with _lock, _handles_lock:
+        _handles.clear()
+        _client = None
+        _directory = Path(path)
+    # Chroma caches one system per path; forget it so files can be moved
+    from chromadb.api.client import SharedSystemClient
+    SharedSystemClient.clear_system_cache()
+
+
+def get_collection(name: str = GLOBAL_COLLECTION, create: bool = True) -> Optional[Collection]:
+    """Get a collection by name, opening it on first use.
+
+    A missing collection is created, or with ``create=False`` None is returned.
+    Handles are kept in an LRU of CHROMA_HANDLE_CACHE entries so per-session
+    layouts don't hold every collection open at once.
+    """
+    with _handles_lock:
+        collection = _handles.get(name)
+        if collection is not None:
+            _handles.move_to_end(name)
+            return collection
+
+    client = get_client()
+    with _handles_lock:
+        collection = _handles.get(name)
+        if collection is None:
+            collection = _open_collection(client, name, create)
+            if collection is None:
+                return None
+            _handles[name] = collection
+            while len(_handles) > CHROMA_HANDLE_CACHE:
+                _handles.popitem(last=False)
+        return collection
+
+
+def collection_for(session_id: str, create: bool = True) -> Optional[Collection]:
+    """The collection that stores ``session_id``'s memories under the configured strategy."""
+    return get_collection(collection_name(session_id), create)
+
+
+def _open_collection(client: ClientAPI, name: str, create: bool) -> Optional[Collection]:
+    if not create:
+        try:
+            return client.get_collection(name=name, embedding_function=embedding_function)
+        except NotFoundError:
+            return None
+        except ValueError:
+            return client.get_collection(name=name)
+    try:
+        return client.get_or_create_collection(
+            name=name,
+            embedding_function=embedding_function
+        )
+    except ValueError:
+        # Collections created before the encoder was bound carry Chroma's default
+        # embedding function, which cannot be swapped in place. Our code always
+        # passes vectors explicitly, so the default model is never loaded.
+        logger.warning("%s has a different persisted embedding function; "
+                       "using explicit embeddings only", name)
+        return client.get_collection(name=name)
+
+
+def warm_up() -> None:
+    """Open the client, plus the collection itself when there is only one."""
+    get_client()
+    if CHROMA_PARTITION == "global":
+        get_collection()
+
+
+def is_open() -> bool:
+    return _client is not None
+
+
+def open_handles() -> int:
+    with _handles_lock:
+        return len(_handles)
+
+
+def list_collections(strategy: str = CHROMA_PARTITION, shards: int = CHROMA_SHARDS) -> List[str]:
+    """Names of the existing memory collections that belong to a layout."""
+    # Chroma 1.x returns Collection objects, older releases returned names
+    names = [getattr(c, "name", c) for c in get_client().list_collections()]
+    return sorted(n for n in names if _in_layout(n, strategy, shards))
+
+
+def count_memories(open_only: bool = False) -> int:
+    """Documents across the configured layout (or just the open collections)."""
+    if open_only:
+        with _handles_lock:
+            collections = list(_handles.values())
+        return sum(c.count() for c in collections)
+    return sum(get_collection(name).count() for name in list_collections())
+
+
+# -------------------------------
+# Migration between layouts
+# -------------------------------
+def repartition(
+    source: str,
+    target: str = CHROMA_PARTITION,
+    *,
+    source_shards: int = CHROMA_SHARDS,
+    target_shards: int = CHROMA_SHARDS,
+    batch_size: int = 1000,
+    drop_source: bool = False,
+    progress: Optional[Callable[[dict], None]] = None,
+) -> Dict[str, Any]:
+    """Copy every memory from the ``source`` layout into the ``target`` layout.
+
+    Stored vectors are copied as-is, nothing is re-embedded. Upserts make it
+    safe to re-run after an interruption. Source collections are only
+    deleted, with ``drop_source``, once all of them have been copied. Run it
+    while the server is stopped, then switch JOURNAL_CHROMA_PARTITION.
+    """
+    client = get_client()
+    sources = list_collections(source, source_shards)
+    stats = {"source_collections": len(sources), "copied": 0, "skipped": 0, "target_collections": set()}
+
+    for name in sources:
+        collection = client.get_collection(name=name)
+        offset = 0
+        while True:
+            batch = collection.get(
+                include=["documents", "metadatas", "embeddings"], limit=batch_size, offset=offset
+            )
+            if not batch["ids"]:
+                break
+            offset += len(batch["ids"])
+
+            groups: Dict[str, List[int]] = {}
+            for i, metadata in enumerate(batch["metadatas"]):
+                if not metadata or "session_id" not in metadata:
+                    stats["skipped"] += 1
+                    continue
+                groups.setdefault(collection_name(metadata["session_id"], target, target_shards), []).append(i)
 
-# Get the project root directory (backend's parent)
-PROJECT_ROOT = Path(__file__).parent.parent.parent
-CHROMA_DIR = PROJECT_ROOT / "chroma_data"
+            for target_name, rows in groups.items():
+                stats["target_collections"].add(target_name)
+                if target_name == name:
+                    continue
+                get_collection(target_name).upsert(
+                    ids=[batch["ids"][i] for i in rows],
+                    documents=[batch["documents"][i] for i in rows],
+                    embeddings=[batch["embeddings"][i] for i in rows],
+                    metadatas=[batch["metadatas"][i] for i in rows],
+                )
+                stats["copied"] += len(rows)
+            if progress:
+                progress({**stats, "target_collections": len(stats["target_collections"]), "current": name})
 
-# Create PersistentClient for persistent storage
-client = chromadb.PersistentClient(
-    path=str(CHROMA_DIR),
-    settings=chromadb.Settings(anonymized_telemetry=False)
-)
+    if drop_source:
+        for name in sources:
+            if name in stats["target_collections"]:
+                continue
+            with _handles_lock:
+                _handles.pop(name, None)
+            client.delete_collection(name=name)
 
-collection = client.get_or_create_collection(
-    name="journal_memories"
-)
+    stats["target_collections"] = len(stats["target_collections"])
+    return stats
@@ -1,43 +1,129 @@
+import re
 import sqlite3
-from pathlib import Path
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
-from typing import List, Optional, Dict, Any
+from typing import Callable, Iterator, List, Optional, Dict, Any
+from ..config import DATA_DIR
+from ..metrics import timed
 from ..schemas import Role
 
-# Database file in data/ directory at project root
-PROJECT_ROOT = Path(__file__).parent.parent.parent
-DB_PATH = PROJECT_ROOT / "data" / "journal.db"
+# Database file in the data directory (data/ at project root by default)
+DB_PATH = DATA_DIR / "journal.db"
 
-_conn: Optional[sqlite3.Connection] = None
+# One connection per thread: WAL lets readers run concurrently with a writer,
+# and sqlite3 connections should not be shared between threads.
+_local = threading.local()
+_all_conns: List[sqlite3.Connection] = []
+_all_conns_lock = threading.Lock()
+# Bumped by close_all; threads holding a connection from an older generation reconnect
+_generation = 0
+
+def _connect() -> sqlite3.Connection:
+    # isolation_level=None: statements autocommit unless inside transaction()
+    conn = sqlite3.connect(DB_PATH, isolation_level=None, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA busy_timeout = 5000")
+    conn.execute("PRAGMA synchronous = NORMAL")  # durable across app crashes in WAL mode
+    conn.execute("PRAGMA cache_size = -16000")   # ~16 MB page cache per connection
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("PRAGMA mmap_size = 268435456")
+    return conn
 
 def get_conn() -> sqlite3.Connection:
-    global _conn
-    if _conn is None:
-        _conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-        _conn.row_factory = sqlite3.Row
-    return _conn
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.generation != _generation:
+        conn = _connect()
+        _local.conn = conn
+        _local.generation = _generation
+        _local.tx_depth = 0
+        _local.on_commit = []
+        with _all_conns_lock:
+            _all_conns.append(conn)
+    return conn
 
-def init_db() -> None:
+def close_all() -> None:
+    """Close every thread's connection (call on shutdown); later calls to get_conn open new ones."""
+    global _generation
+    with _all_conns_lock:
+        _generation += 1
+        for conn in _all_conns:
+            try:
+                conn.execute("PRAGMA optimize")
+                conn.close()
+            except sqlite3.Error:
+                pass
+        _all_conns.clear()
+    _local.__dict__.clear()
+
+@contextmanager
+def transaction() -> Iterator[sqlite3.Connection]:
+    """Run the enclosed statements in one write transaction.
+
+    Nested uses join the outermost transaction, so helpers can be composed
+    into a single commit (e.g. everything persisted for one chat turn).
+    """
     conn = get_conn()
-    cursor = conn.cursor()
+    depth = _local.tx_depth
+    if depth == 0:
+        conn.execute("BEGIN IMMEDIATE")
+    _local.tx_depth = depth + 1
+    try:
+        yield conn
+    except BaseException:
+        _local.tx_depth = depth
+        if depth == 0:
+            _local.on_commit.clear()
+            conn.execute("ROLLBACK")
+        raise
+    _local.tx_depth = depth
+    if depth == 0:
+        conn.execute("COMMIT")
+        callbacks, _local.on_commit = _local.on_commit, []
+        for callback in callbacks:
+            callback()
 
-    cursor.execute("""
+def after_commit(callback: Callable[[], None]) -> None:
+    """Run ``callback`` once the current outermost transaction commits (now if none is open)."""
+    get_conn()
+    if _local.tx_depth:
+        _local.on_commit.append(callback)
+    else:
+        callback()
+
+# -------------------------------
+# Session list version (ETags)
+# -------------------------------
+@timed("sqlite.sessions_version")
+def sessions_version() -> str:
+    """Token that changes with every committed change to the sessions table.
+
+    Triggers bump it inside the writing transaction, so writes from any
+    process (other workers, CLI tools) are seen. The epoch is random per
+    database file, so a recreated database never reuses a token.
+    """
+    row = get_conn().execute("SELECT epoch, version FROM sessions_version").fetchone()
+    return f"{row['epoch']}-{row['version']}"
+
+# -------------------------------
+# Schema migrations (tracked in PRAGMA user_version)
+# -------------------------------
+def _migrate_base_tables(conn: sqlite3.Connection) -> None:
+    conn.execute("""
         CREATE TABLE IF NOT EXISTS sessions (
             session_id TEXT PRIMARY KEY,
             session_name TEXT DEFAULT 'New Conversation',
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     """)
-    
+
     # Add session_name column if it doesn't exist (for existing databases)
-    try:
-        cursor.execute("ALTER TABLE sessions ADD COLUMN session_name TEXT DEFAULT 'New Conversation'")
-        conn.commit()
-    except sqlite3.OperationalError:
-        # Column already exists, ignore
-        pass
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(sessions)")}
+    if "session_name" not in columns:
+        conn.execute("ALTER TABLE sessions ADD COLUMN session_name TEXT DEFAULT 'New Conversation'")
 
-    cursor.execute("""
+    conn.execute("""
         CREATE TABLE IF NOT EXISTS messages (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             session_id TEXT NOT NULL,
@@ -48,100 +134,430 @@ def init_db() -> None:
         )
     """)
 
-    conn.commit()
+def _migrate_memory_outbox(conn: sqlite3.Connection) -> None:
+    # Messages waiting to be indexed into Chroma (drained by services.indexer)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS memory_outbox (
+            message_id INTEGER PRIMARY KEY,
+            session_id TEXT NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL DEFAULT 0,
+            last_error TEXT,
+            created_at REAL NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_session ON memory_outbox(session_id)")
+
+def _migrate_message_index(conn: sqlite3.Connection) -> None:
+    # Serves history reads and per-session counts without scanning messages
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_messages_session_created
+        ON messages(session_id, created_at, id)
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_created ON sessions(created_at)")
+
+def _migrate_session_summaries(conn: sqlite3.Connection) -> None:
+    # Rolling summary of turns that have left the prompt window (services.context)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS session_summaries (
+            session_id TEXT PRIMARY KEY,
+            summary TEXT NOT NULL,
+            summarized_through_id INTEGER NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (session_id) REFERENCES sessions(session_id)
+        )
+    """)
+
+def _migrate_import_checkpoints(conn: sqlite3.Connection) -> None:
+    # Progress of bulk imports, so an interrupted import can resume (services.importer)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS import_checkpoints (
+            source TEXT PRIMARY KEY,
+            records_done INTEGER NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+def _migrate_message_fts(conn: sqlite3.Connection) -> None:
+    # Full-text index over message content for lexical recall (services.memory).
+    # External-content table: the text lives only in messages, triggers keep it in sync.
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+            content, session_id,
+            content='messages', content_rowid='id',
+            tokenize='porter unicode61 remove_diacritics 2'
+        )
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts (rowid, content, session_id) VALUES (new.id, new.content, new.session_id);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content, session_id)
+            VALUES ('delete', old.id, old.content, old.session_id);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content, session_id ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content, session_id)
+            VALUES ('delete', old.id, old.content, old.session_id);
+            INSERT INTO messages_fts (rowid, content, session_id) VALUES (new.id, new.content, new.session_id);
+        END
+    """)
+    # Index the messages that already exist
+    conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+
+def _migrate_memory_compaction(conn: sqlite3.Connection) -> None:
+    # Messages whose memory was merged into another memory or rolled up into a
+    # summary memory (services.compaction); the message itself is kept
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS compacted_memories (
+            message_id INTEGER PRIMARY KEY,
+            memory_id TEXT NOT NULL,
+            session_id TEXT NOT NULL,
+            reason TEXT NOT NULL,
+            compacted_at REAL NOT NULL,
+            FOREIGN KEY (message_id) REFERENCES messages(id)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_compacted_memory ON compacted_memories(memory_id)")
+    # Highest message id each session's memories were last compacted through
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS session_compaction (
+            session_id TEXT PRIMARY KEY,
+            compacted_through_id INTEGER NOT NULL,
+            compacted_at REAL NOT NULL,
+            FOREIGN KEY (session_id) REFERENCES sessions(session_id)
+        )
+    """)
+
+def _migrate_index_meta(conn: sqlite3.Connection) -> None:
+    # Facts about the vector index, e.g. which encoder produced it (services.memory)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS index_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+def _migrate_session_counters(conn: sqlite3.Connection) -> None:
+    # Denormalized per-session counters, maintained by add_message/import_batch,
+    # so listing sessions never aggregates the messages table
+    conn.execute("ALTER TABLE sessions ADD COLUMN message_count INTEGER NOT NULL DEFAULT 0")
+    conn.execute("ALTER TABLE sessions ADD COLUMN last_activity TIMESTAMP")
+    conn.execute("""
+        UPDATE sessions SET
+            message_count = (SELECT COUNT(*) FROM messages m WHERE m.session_id = sessions.session_id),
+            last_activity = COALESCE(
+                (SELECT MAX(m.created_at) FROM messages m WHERE m.session_id = sessions.session_id),
+                created_at
+            )
+    """)
+    # Recency order for keyset pages of /sessions
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_activity ON sessions(last_activity, session_id)")
 
+def _migrate_rollup_memories(conn: sqlite3.Connection) -> None:
+    # Text of roll-up memories written by compaction, so the vector index can be
+    # rebuilt from SQLite alone (services.reconcile)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS rollup_memories (
+            memory_id TEXT PRIMARY KEY,
+            session_id TEXT NOT NULL,
+            content TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+    """)
+
+def _migrate_message_archive(conn: sqlite3.Connection) -> None:
+    # Cold tier (db.archive): message text moved into compressed blocks in
+    # segment files under DATA_DIR/archive. archived_messages keeps each
+    # message's ordering key and block so history pages stay keyset queries.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS archive_blocks (
+            block_id INTEGER PRIMARY KEY,
+            session_id TEXT NOT NULL,
+            segment TEXT NOT NULL,
+            offset INTEGER NOT NULL,
+            length INTEGER NOT NULL,
+            raw_length INTEGER NOT NULL,
+            crc32 INTEGER NOT NULL,
+            message_count INTEGER NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_archive_blocks_session ON archive_blocks(session_id)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS archived_messages (
+            id INTEGER PRIMARY KEY,
+            session_id TEXT NOT NULL,
+            created_at TIMESTAMP NOT NULL,
+            block_id INTEGER NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_archived_messages_session_created
+        ON archived_messages(session_id, created_at, id)
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS archived_sessions (
+            session_id TEXT PRIMARY KEY,
+            message_count INTEGER NOT NULL,
+            raw_bytes INTEGER NOT NULL,
+            stored_bytes INTEGER NOT NULL,
+            archived_at REAL NOT NULL
+        )
+    """)
+
+def _migrate_archive_fts(conn: sqlite3.Connection) -> None:
+    # Keyword index over archived text, so lexical recall still finds it. Contentless:
+    # the text lives only in the compressed blocks, so db.archive adds and deletes rows.
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS archived_fts USING fts5(
+            content, session_id,
+            content='',
+            tokenize='porter unicode61 remove_diacritics 2'
+        )
+    """)
+    # Index what was archived before this step
+    from .archive import _read_block
+
+    blocks = conn.execute("SELECT block_id, session_id, segment, offset, length, crc32 FROM archive_blocks").fetchall()
+    for block in blocks:
+        conn.executemany(
+            "INSERT INTO archived_fts (rowid, content, session_id) VALUES (?, ?, ?)",
+            [(m["id"], m["content"], m["session_id"]) for m in _read_block(dict(block))],
+        )
+
+def _migrate_sessions_version(conn: sqlite3.Connection) -> None:
+    # Shared version of the session list (ETags of /sessions): bumped by triggers
+    # in the writing transaction, whichever process writes
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sessions_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            epoch TEXT NOT NULL,
+            version INTEGER NOT NULL
+        )
+    """)
+    conn.execute("INSERT OR IGNORE INTO sessions_version (id, epoch, version) VALUES (1, lower(hex(randomblob(4))), 0)")
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS sessions_version_{event.lower()} AFTER {event} ON sessions BEGIN
+                UPDATE sessions_version SET version = version + 1;
+            END
+        """)
+
+# Append new steps here; never reorder or edit shipped ones.
+MIGRATIONS: List[Callable[[sqlite3.Connection], None]] = [
+    _migrate_base_tables,
+    _migrate_memory_outbox,
+    _migrate_message_index,
+    _migrate_session_summaries,
+    _migrate_import_checkpoints,
+    _migrate_message_fts,
+    _migrate_memory_compaction,
+    _migrate_index_meta,
+    _migrate_session_counters,
+    _migrate_rollup_memories,
+    _migrate_message_archive,
+    _migrate_archive_fts,
+    _migrate_sessions_version,
+]
+
+def init_db() -> None:
+    """Open the database, switch it to WAL and apply pending migrations in place."""
+    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+    conn = get_conn()
+    conn.execute("PRAGMA journal_mode = WAL")
+
+    # Each step re-reads the version under the write lock, so processes starting
+    # together (several uvicorn workers, a CLI tool) never apply a step twice
+    while True:
+        with transaction():
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version >= len(MIGRATIONS):
+                break
+            migrate = MIGRATIONS[version]
+            migrate(conn)
+            conn.execute(f"PRAGMA user_version = {version + 1}")
+        if migrate is _migrate_message_index:
+            conn.execute("ANALYZE")
+
+@timed("sqlite.create_session")
 def create_session(session_id: str, session_name: Optional[str] = None) -> None:
     """Create a new session with optional name."""
-    conn = get_conn()
-    
     if session_name is None:
         # Generate default name based on timestamp
         from datetime import datetime
         now = datetime.now()
         session_name = f"Chat - {now.strftime('%b %d, %I:%M %p')}"
     
-    conn.execute("""
-        INSERT OR IGNORE INTO sessions (session_id, session_name, created_at) 
-        VALUES (?, ?, CURRENT_TIMESTAMP)
-    """, (session_id, session_name))
-    conn.commit()
+    with transaction() as conn:
+        conn.execute("""
+            INSERT OR IGNORE INTO sessions (session_id, session_name, created_at, last_activity)
+            VALUES (?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+        """, (session_id, session_name))
+
+@timed("sqlite.add_message")
+def add_message(session_id: str, role: Role, content: str, index: bool = True) -> int:
+    """Insert a message and, if ``index``, queue it for memory indexing in the same transaction."""
+    with transaction() as conn:
+        cursor = conn.execute("""
+            INSERT INTO messages (session_id, role, content, created_at) VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+        """, (session_id, role, content))
+        message_id = int(cursor.lastrowid)
+        conn.execute("""
+            UPDATE sessions SET message_count = message_count + 1, last_activity = CURRENT_TIMESTAMP
+            WHERE session_id = ?
+        """, (session_id,))
+
+        if index:
+            conn.execute("""
+                INSERT INTO memory_outbox (message_id, session_id, role, content, created_at) VALUES (?, ?, ?, ?, ?)
+            """, (message_id, session_id, role, content, time.time()))
 
-def add_message(session_id: str, role: Role, content: str) -> int:
+    return message_id
+
+@timed("sqlite.get_message")
+def get_message(message_id: int) -> Optional[Dict[str, Any]]:
     conn = get_conn()
-    cursor = conn.cursor()
+    row = conn.execute("""
+        SELECT id, session_id, role, content, created_at FROM messages WHERE id = ?
+    """, (message_id,)).fetchone()
+    if row is None:
+        # Imported lazily: the archive module builds on this one
+        from .archive import read_archived_messages
+        return read_archived_messages([message_id]).get(message_id)
+    return dict(row)
 
-    cursor.execute("""
-        INSERT INTO messages (session_id, role, content, created_at) VALUES (?, ?, ?, CURRENT_TIMESTAMP)
-    """, (session_id, role, content))
-    conn.commit()
-    return int(cursor.lastrowid)
+@timed("sqlite.session_has_messages")
+def session_has_messages(session_id: str) -> bool:
+    conn = get_conn()
+    row = conn.execute("""
+        SELECT 1 FROM messages WHERE session_id = ?
+        UNION ALL SELECT 1 FROM archived_messages WHERE session_id = ?
+        LIMIT 1
+    """, (session_id, session_id)).fetchone()
+    return row is not None
 
-def get_history(session_id: str) -> List[Dict[str, Any]]:
+def is_archived(session_id: str) -> bool:
+    """Whether some of the session's messages live in the archive tier."""
     conn = get_conn()
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT id, session_id, role, content, created_at FROM messages WHERE session_id = ? ORDER BY created_at ASC
-    """, (session_id,))
+    row = conn.execute("SELECT 1 FROM archived_sessions WHERE session_id = ?", (session_id,)).fetchone()
+    return row is not None
 
-    rows = cursor.fetchall()
+@timed("sqlite.get_history")
+def get_history(
+    session_id: str,
+    *,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None,
+    oldest_first: bool = False,
+) -> List[Dict[str, Any]]:
+    """Get a session's messages in (created_at, id) order.
 
-    out: List[Dict[str, Any]] = []
+    Keyset pagination: ``after_id`` returns the oldest ``limit`` messages after
+    that message, ``before_id`` the newest ``limit`` messages before it. With
+    only ``limit``, the newest ``limit`` messages are returned; pass
+    ``oldest_first`` to take the oldest ones instead. Results are always
+    oldest first. Archived sessions are read through the archive tier.
+    """
+    if is_archived(session_id):
+        from .archive import get_archived_history
+        return get_archived_history(
+            session_id, before_id=before_id, after_id=after_id, limit=limit, oldest_first=oldest_first
+        )
 
-    for row in rows:
-        out.append({
-            "id": row["id"],
-            "session_id": row["session_id"],
-            "role": row["role"],
-            "content": row["content"],
-            "created_at": row["created_at"]
-        })
-    
-    return out
+    conn = get_conn()
+    query = "SELECT id, session_id, role, content, created_at FROM messages WHERE session_id = ?"
+    params: List[Any] = [session_id]
 
-def get_all_sessions() -> List[Dict[str, Any]]:
-    """Get all sessions with metadata including message counts."""
+    if after_id is not None:
+        query += " AND (created_at, id) > (SELECT created_at, id FROM messages WHERE id = ?)"
+        params.append(after_id)
+    if before_id is not None:
+        query += " AND (created_at, id) < (SELECT created_at, id FROM messages WHERE id = ?)"
+        params.append(before_id)
+
+    # Walk backwards from the newest end unless paging forward from after_id
+    newest_first = limit is not None and after_id is None and not oldest_first
+    query += " ORDER BY created_at DESC, id DESC" if newest_first else " ORDER BY created_at ASC, id ASC"
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
+
+    rows = conn.execute(query, params).fetchall()
+    if newest_first:
+        rows.reverse()
+
+    return [dict(row) for row in rows]
+
+@timed("sqlite.get_summary")
+def get_summary(session_id: str) -> Optional[Dict[str, Any]]:
+    """Get a session's rolling summary and the last message id it covers."""
     conn = get_conn()
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT 
-            s.session_id,
-            s.session_name,
-            s.created_at,
-            COUNT(m.id) as message_count
-        FROM sessions s
-        LEFT JOIN messages m ON s.session_id = m.session_id
-        GROUP BY s.session_id, s.session_name, s.created_at
-        ORDER BY s.created_at DESC
-    """)
-    
-    rows = cursor.fetchall()
-    
-    out: List[Dict[str, Any]] = []
-    for row in rows:
-        out.append({
-            "session_id": row["session_id"],
-            "session_name": row["session_name"],
-            "created_at": row["created_at"],
-            "message_count": row["message_count"]
-        })
-    
-    return out
+    row = conn.execute("""
+        SELECT summary, summarized_through_id FROM session_summaries WHERE session_id = ?
+    """, (session_id,)).fetchone()
+    return dict(row) if row else None
+
+@timed("sqlite.save_summary")
+def save_summary(session_id: str, summary: str, summarized_through_id: int) -> None:
+    with transaction() as conn:
+        conn.execute("""
+            INSERT INTO session_summaries (session_id, summary, summarized_through_id, updated_at)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(session_id) DO UPDATE SET
+                summary = excluded.summary,
+                summarized_through_id = excluded.summarized_through_id,
+                updated_at = excluded.updated_at
+        """, (session_id, summary, summarized_through_id))
+
+_SESSION_COLUMNS = "session_id, session_name, created_at, message_count, last_activity"
+
+@timed("sqlite.get_all_sessions")
+def get_all_sessions(*, before: Optional[str] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Sessions with their counters, most recently active first.
 
+    Keyset pagination: ``before`` is the id of the last session on the
+    previous page. Reads the denormalized counters, never the messages table.
+    """
+    conn = get_conn()
+    query = f"SELECT {_SESSION_COLUMNS} FROM sessions"
+    params: List[Any] = []
+    if before is not None:
+        query += """ WHERE (last_activity, session_id) <
+            (SELECT last_activity, session_id FROM sessions WHERE session_id = ?)"""
+        params.append(before)
+    query += " ORDER BY last_activity DESC, session_id DESC"
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
+    return [dict(row) for row in conn.execute(query, params).fetchall()]
+
+@timed("sqlite.get_session")
+def get_session(session_id: str) -> Optional[Dict[str, Any]]:
+    conn = get_conn()
+    row = conn.execute(f"SELECT {_SESSION_COLUMNS} FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+    return dict(row) if row else None
+
+@timed("sqlite.update_session_name")
 def update_session_name(session_id: str, new_name: str) -> bool:
     """Update the name of a session."""
-    conn = get_conn()
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        UPDATE sessions 
-        SET session_name = ? 
-        WHERE session_id = ?
-    """, (new_name, session_id))
-    
-    conn.commit()
+    with transaction() as conn:
+        cursor = conn.execute("""
+            UPDATE sessions 
+            SET session_name = ? 
+            WHERE session_id = ?
+        """, (new_name, session_id))
+
     return cursor.rowcount > 0
 
+@timed("sqlite.get_session_name")
 def get_session_name(session_id: str) -> Optional[str]:
     """Get the name of a session."""
     conn = get_conn()
@@ -153,3 +569,399 @@ def get_session_name(session_id: str) -> Optional[str]:
     
     row = cursor.fetchone()
     return row["session_name"] if row else None
+
+_FTS_TERM_RE = re.compile(r"\w+")
+# Longer queries add little to ranking but make every search slower
+_FTS_MAX_TERMS = 32
+
+def _fts_query(text: str, session_id: str) -> Optional[str]:
+    """Turn free text into an FTS5 query matching any of its terms within one session.
+
+    Every term is quoted, so user input can never be parsed as FTS syntax.
+    """
+    terms = list(dict.fromkeys(t.lower() for t in _FTS_TERM_RE.findall(text)))[:_FTS_MAX_TERMS]
+    if not terms:
+        return None
+    query = "(" + " OR ".join(f'"{t}"' for t in terms) + ")"
+    # Narrow by session inside the index; the exact match is enforced by the join
+    if _FTS_TERM_RE.search(session_id):
+        query = 'session_id : "' + session_id.replace('"', '""') + '" AND ' + query
+    return query
+
+@timed("sqlite.search_messages")
+def search_messages(session_id: str, text: str, limit: int) -> List[Dict[str, Any]]:
+    """Rank a session's messages against ``text`` with BM25, best match first.
+
+    ``score`` is FTS5's bm25(), where lower (more negative) is better.
+    Archived messages are searched in archived_fts and their text read back
+    from the archive; the two indexes score against their own statistics,
+    so the merged order is approximate.
+    """
+    query = _fts_query(text, session_id)
+    if query is None:
+        return []
+
+    conn = get_conn()
+    rows = [dict(row) for row in conn.execute("""
+        SELECT m.id AS message_id, m.content, bm25(messages_fts, 1.0, 0.0) AS score
+        FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid
+        WHERE messages_fts MATCH ? AND m.session_id = ?
+        ORDER BY score
+        LIMIT ?
+    """, (query, session_id, limit))]
+
+    if is_archived(session_id):
+        from .archive import read_archived_messages
+
+        archived = conn.execute("""
+            SELECT a.id AS message_id, bm25(archived_fts, 1.0, 0.0) AS score
+            FROM archived_fts JOIN archived_messages a ON a.id = archived_fts.rowid
+            WHERE archived_fts MATCH ? AND a.session_id = ?
+            ORDER BY score
+            LIMIT ?
+        """, (query, session_id, limit)).fetchall()
+        messages = read_archived_messages([row["message_id"] for row in archived])
+        rows.extend(
+            {"message_id": row["message_id"], "content": messages[row["message_id"]]["content"], "score": row["score"]}
+            for row in archived if row["message_id"] in messages
+        )
+        rows.sort(key=lambda row: row["score"])
+    return rows[:limit]
+
+@timed("sqlite.claim_outbox_batch")
+def claim_outbox_batch(limit: int, lease_seconds: float) -> List[Dict[str, Any]]:
+    """Claim up to ``limit`` outbox rows that are due for an indexing attempt.
+
+    Claimed rows are pushed ``lease_seconds`` into the future, so indexers in
+    other processes skip them. complete_outbox or fail_outbox settles them;
+    if the claimer dies, they fall due again when the lease runs out.
+    """
+    now = time.time()
+    with transaction() as conn:
+        rows = conn.execute("""
+            UPDATE memory_outbox SET next_attempt_at = ?
+            WHERE message_id IN (
+                SELECT message_id FROM memory_outbox
+                WHERE next_attempt_at <= ? ORDER BY message_id ASC LIMIT ?
+            )
+            RETURNING message_id, session_id, role, content, attempts
+        """, (now + lease_seconds, now, limit)).fetchall()
+
+    return sorted((dict(row) for row in rows), key=lambda row: row["message_id"])
+
+@timed("sqlite.complete_outbox")
+def complete_outbox(message_ids: List[int]) -> None:
+    """Remove rows that have been indexed."""
+    with transaction() as conn:
+        conn.executemany("DELETE FROM memory_outbox WHERE message_id = ?", [(i,) for i in message_ids])
+
+@timed("sqlite.fail_outbox")
+def fail_outbox(message_ids: List[int], error: str, base_delay: float = 1.0, max_delay: float = 300.0) -> None:
+    """Record a failed indexing attempt and back off exponentially before the next one."""
+    now = time.time()
+    with transaction() as conn:
+        conn.executemany("""
+            UPDATE memory_outbox
+            SET attempts = attempts + 1,
+                last_error = ?,
+                next_attempt_at = ? + MIN(? * (1 << MIN(attempts, 16)), ?)
+            WHERE message_id = ?
+        """, [(error, now, base_delay, max_delay, message_id) for message_id in message_ids])
+
+@timed("sqlite.get_pending_memories")
+def get_pending_memories(session_id: str, limit: int) -> List[Dict[str, Any]]:
+    """Get a session's newest ``limit`` messages that are stored but not yet indexed."""
+    conn = get_conn()
+    cursor = conn.cursor()
+
+    cursor.execute("""
+        SELECT message_id, session_id, role, content FROM memory_outbox
+        WHERE session_id = ? ORDER BY message_id DESC LIMIT ?
+    """, (session_id, limit))
+
+    return [dict(row) for row in cursor.fetchall()]
+
+def get_outbox_lag() -> Dict[str, Any]:
+    """Summarize the indexing backlog."""
+    conn = get_conn()
+    cursor = conn.cursor()
+
+    cursor.execute("""
+        SELECT COUNT(*) AS pending, MIN(created_at) AS oldest, SUM(attempts > 0) AS retrying
+        FROM memory_outbox
+    """)
+    row = cursor.fetchone()
+
+    return {
+        "pending": row["pending"],
+        "retrying": row["retrying"] or 0,
+        "oldest_age_seconds": time.time() - row["oldest"] if row["oldest"] is not None else 0.0,
+    }
+
+def get_index_meta(key: str) -> Optional[str]:
+    conn = get_conn()
+    row = conn.execute("SELECT value FROM index_meta WHERE key = ?", (key,)).fetchone()
+    return row["value"] if row else None
+
+def set_index_meta(values: Dict[str, str]) -> None:
+    with transaction() as conn:
+        conn.executemany("""
+            INSERT INTO index_meta (key, value, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at
+        """, list(values.items()))
+
+def get_import_checkpoint(source: str) -> int:
+    """Number of records of ``source`` already imported."""
+    conn = get_conn()
+    row = conn.execute("SELECT records_done FROM import_checkpoints WHERE source = ?", (source,)).fetchone()
+    return row["records_done"] if row else 0
+
+def clear_import_checkpoint(source: str) -> None:
+    with transaction() as conn:
+        conn.execute("DELETE FROM import_checkpoints WHERE source = ?", (source,))
+
+@timed("sqlite.import_batch")
+def import_batch(
+    sessions: List[Dict[str, Any]],
+    messages: List[Dict[str, Any]],
+    *,
+    source: str,
+    records_done: int,
+    lease_seconds: float = 0.0,
+) -> List[int]:
+    """Insert a batch of imported sessions and messages in one transaction.
+
+    Messages get consecutive ids allocated up front so the whole batch can go
+    through ``executemany``; each is also queued in the memory outbox, and the
+    import checkpoint advances in the same commit. The outbox rows start out
+    claimed for ``lease_seconds`` (see claim_outbox_batch), so the background
+    indexer leaves them to the importer. Returns the message ids in input
+    order.
+    """
+    with transaction() as conn:
+        conn.executemany("""
+            INSERT OR IGNORE INTO sessions (session_id, session_name, created_at, last_activity) VALUES (?, ?, ?, ?)
+        """, [(s["session_id"], s["session_name"], s["created_at"], s["created_at"]) for s in sessions])
+
+        # AUTOINCREMENT never reuses ids, so start past both the table and the sequence
+        row = conn.execute("""
+            SELECT MAX(COALESCE((SELECT MAX(id) FROM messages), 0),
+                       COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'messages'), 0))
+        """).fetchone()
+        first_id = row[0] + 1
+        ids = list(range(first_id, first_id + len(messages)))
+
+        conn.executemany("""
+            INSERT INTO messages (id, session_id, role, content, created_at) VALUES (?, ?, ?, ?, ?)
+        """, [(i, m["session_id"], m["role"], m["content"], m["created_at"]) for i, m in zip(ids, messages)])
+
+        counters: Dict[str, List[Any]] = {}
+        for m in messages:
+            counter = counters.setdefault(m["session_id"], [0, m["created_at"]])
+            counter[0] += 1
+            counter[1] = max(counter[1], m["created_at"])
+        conn.executemany("""
+            UPDATE sessions SET
+                message_count = message_count + ?,
+                last_activity = MAX(COALESCE(last_activity, ''), ?)
+            WHERE session_id = ?
+        """, [(count, latest, session_id) for session_id, (count, latest) in counters.items()])
+
+        now = time.time()
+        conn.executemany("""
+            INSERT INTO memory_outbox (message_id, session_id, role, content, next_attempt_at, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, [(i, m["session_id"], m["role"], m["content"], now + lease_seconds, now) for i, m in zip(ids, messages)])
+
+        conn.execute("""
+            INSERT INTO import_checkpoints (source, records_done, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(source) DO UPDATE SET records_done = excluded.records_done, updated_at = excluded.updated_at
+        """, (source, records_done))
+
+    return ids
+
+# -------------------------------
+# Memory compaction (services.compaction)
+# -------------------------------
+def get_sessions_to_compact(only_new: bool = True) -> List[Dict[str, Any]]:
+    """Sessions to compact, with the last message id a compaction can cover.
+
+    ``compact_through_id`` stops short of messages still in the outbox, which
+    are not in Chroma yet. With ``only_new``, sessions without indexed
+    messages newer than their last compaction are skipped.
+    """
+    conn = get_conn()
+    query = """
+        SELECT session_id, compact_through_id FROM (
+            SELECT
+                s.session_id,
+                COALESCE(c.compacted_through_id, 0) AS compacted_through_id,
+                COALESCE(
+                    (SELECT MIN(o.message_id) - 1 FROM memory_outbox o WHERE o.session_id = s.session_id),
+                    (SELECT MAX(m.id) FROM messages m WHERE m.session_id = s.session_id),
+                    0
+                ) AS compact_through_id
+            FROM sessions s
+            LEFT JOIN session_compaction c ON c.session_id = s.session_id
+        )
+        WHERE compact_through_id > compacted_through_id OR NOT ?
+        ORDER BY session_id
+    """
+    return [dict(row) for row in conn.execute(query, (only_new,)).fetchall()]
+
+@timed("sqlite.get_rollup_candidates")
+def get_rollup_candidates(session_id: str, older_than_days: float, max_chars: int) -> List[Dict[str, Any]]:
+    """Short messages older than ``older_than_days`` whose memory has not been compacted, oldest first."""
+    conn = get_conn()
+    rows = conn.execute("""
+        SELECT m.id, m.role, m.content, m.created_at FROM messages m
+        LEFT JOIN compacted_memories c ON c.message_id = m.id
+        WHERE m.session_id = ?
+          AND c.message_id IS NULL
+          AND LENGTH(m.content) <= ?
+          AND datetime(m.created_at) < datetime('now', ?)
+        ORDER BY m.created_at, m.id
+    """, (session_id, max_chars, f"-{older_than_days} days")).fetchall()
+    return [dict(row) for row in rows]
+
+@timed("sqlite.record_compaction")
+def record_compaction(
+    session_id: str, memory_id: str, message_ids: List[int], absorbed_ids: List[str], reason: str
+) -> None:
+    """Map ``message_ids`` to the memory that now stands for them.
+
+    ``absorbed_ids`` are the memory ids being removed; messages previously
+    mapped to one of them move along, so every mapping points at a memory
+    that exists.
+    """
+    now = time.time()
+    with transaction() as conn:
+        conn.executemany(
+            "UPDATE compacted_memories SET memory_id = ?, compacted_at = ? WHERE memory_id = ?",
+            [(memory_id, now, absorbed) for absorbed in absorbed_ids],
+        )
+        conn.executemany("DELETE FROM rollup_memories WHERE memory_id = ?", [(a,) for a in absorbed_ids])
+        conn.executemany("""
+            INSERT INTO compacted_memories (message_id, memory_id, session_id, reason, compacted_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(message_id) DO UPDATE SET
+                memory_id = excluded.memory_id, reason = excluded.reason, compacted_at = excluded.compacted_at
+        """, [(i, memory_id, session_id, reason, now) for i in message_ids])
+
+def save_rollup_memory(memory_id: str, session_id: str, content: str) -> None:
+    with transaction() as conn:
+        conn.execute("""
+            INSERT INTO rollup_memories (memory_id, session_id, content, created_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(memory_id) DO UPDATE SET content = excluded.content
+        """, (memory_id, session_id, content, time.time()))
+
+def mark_session_compacted(session_id: str, through_id: int) -> None:
+    with transaction() as conn:
+        conn.execute("""
+            INSERT INTO session_compaction (session_id, compacted_through_id, compacted_at) VALUES (?, ?, ?)
+            ON CONFLICT(session_id) DO UPDATE SET
+                compacted_through_id = excluded.compacted_through_id, compacted_at = excluded.compacted_at
+        """, (session_id, through_id, time.time()))
+
+@timed("sqlite.get_compacted_targets")
+def get_compacted_targets(message_ids: List[int]) -> Dict[int, str]:
+    """Memory id now standing for each compacted message among ``message_ids``."""
+    if not message_ids:
+        return {}
+    conn = get_conn()
+    placeholders = ",".join("?" * len(message_ids))
+    rows = conn.execute(
+        f"SELECT message_id, memory_id FROM compacted_memories WHERE message_id IN ({placeholders})",
+        message_ids,
+    ).fetchall()
+    return {row["message_id"]: row["memory_id"] for row in rows}
+
+def get_memory_sources(memory_id: str) -> List[int]:
+    """Ids of the messages folded into ``memory_id`` (not including its own message)."""
+    conn = get_conn()
+    rows = conn.execute(
+        "SELECT message_id FROM compacted_memories WHERE memory_id = ? ORDER BY message_id", (memory_id,)
+    ).fetchall()
+    return [row["message_id"] for row in rows]
+
+def get_compaction_totals() -> Dict[str, int]:
+    conn = get_conn()
+    rows = conn.execute("SELECT reason, COUNT(*) AS n FROM compacted_memories GROUP BY reason").fetchall()
+    return {row["reason"]: row["n"] for row in rows}
+
+# -------------------------------
+# Index reconciliation (services.reconcile)
+# -------------------------------
+def get_max_message_id() -> int:
+    conn = get_conn()
+    return conn.execute("""
+        SELECT MAX(COALESCE((SELECT MAX(id) FROM messages), 0),
+                   COALESCE((SELECT MAX(id) FROM archived_messages), 0))
+    """).fetchone()[0]
+
+@timed("sqlite.get_indexable_messages")
+def get_indexable_messages(after_id: int, limit: int) -> List[Dict[str, Any]]:
+    """The next ``limit`` messages after ``after_id`` that should have their own memory.
+
+    Compacted messages are represented by another memory, and messages still
+    in the outbox are left to the indexer.
+    """
+    conn = get_conn()
+    rows = conn.execute("""
+        SELECT m.id AS message_id, m.session_id, m.role, m.content FROM messages m
+        WHERE m.id > ?
+          AND NOT EXISTS (SELECT 1 FROM compacted_memories c WHERE c.message_id = m.id)
+          AND NOT EXISTS (SELECT 1 FROM memory_outbox o WHERE o.message_id = m.id)
+        ORDER BY m.id
+        LIMIT ?
+    """, (after_id, limit)).fetchall()
+    return [dict(row) for row in rows]
+
+@timed("sqlite.get_archived_indexable")
+def get_archived_indexable(after_id: int, limit: int) -> List[Dict[str, Any]]:
+    """Like get_indexable_messages for the archive tier, without the text (see db.archive)."""
+    conn = get_conn()
+    rows = conn.execute("""
+        SELECT a.id AS message_id, a.session_id FROM archived_messages a
+        WHERE a.id > ?
+          AND NOT EXISTS (SELECT 1 FROM compacted_memories c WHERE c.message_id = a.id)
+        ORDER BY a.id
+        LIMIT ?
+    """, (after_id, limit)).fetchall()
+    return [dict(row) for row in rows]
+
+@timed("sqlite.get_index_state")
+def get_index_state(message_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    """Session, content and compaction/outbox status of each existing message in ``message_ids``.
+
+    Archived messages are included with ``archived`` set and no content.
+    """
+    if not message_ids:
+        return {}
+    conn = get_conn()
+    placeholders = ",".join("?" * len(message_ids))
+    rows = conn.execute(f"""
+        SELECT m.id, m.session_id, m.content, 0 AS archived,
+               EXISTS (SELECT 1 FROM compacted_memories c WHERE c.message_id = m.id) AS compacted,
+               EXISTS (SELECT 1 FROM memory_outbox o WHERE o.message_id = m.id) AS pending
+        FROM messages m WHERE m.id IN ({placeholders})
+        UNION ALL
+        SELECT a.id, a.session_id, NULL, 1,
+               EXISTS (SELECT 1 FROM compacted_memories c WHERE c.message_id = a.id), 0
+        FROM archived_messages a WHERE a.id IN ({placeholders})
+    """, message_ids + message_ids).fetchall()
+    return {row["id"]: dict(row) for row in rows}
+
+def get_rollup_memories() -> Dict[str, Dict[str, Any]]:
+    """Every roll-up memory that should exist, by memory id."""
+    conn = get_conn()
+    rows = conn.execute("SELECT memory_id, session_id, content FROM rollup_memories").fetchall()
+    return {row["memory_id"]: dict(row) for row in rows}
+
+def get_compaction_targets(prefix: str) -> set:
+    """Memory ids starting with ``prefix`` that compacted messages point at."""
+    conn = get_conn()
+    rows = conn.execute(
+        "SELECT DISTINCT memory_id FROM compacted_memories WHERE memory_id LIKE ? || '%'", (prefix,)
+    ).fetchall()
+    return {row["memory_id"] for row in rows}
@@ -1,29 +1,90 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+import asyncio
+import hashlib
+import json
 import uuid
 from datetime import datetime
-from .db.chroma import collection
-from .services.memory import write_memory, recall_memories
-from .services.ai import generate_reply, build_prompt
+from typing import Literal, Optional
+from .db.archive import archive_stats as db_archive_stats
+from .db.chroma import count_memories, is_open as chroma_is_open, open_handles, warm_up as warm_up_chroma
+from .services.memory import (
+    RECALL_MODES, check_index_encoder, recall_cache, recall_memories_scored, recall_memories_scored_async,
+)
+from .services.compaction import memory_compactor
+from .services.indexer import memory_indexer
+from .services.context import build_context, prompt_tokens
+from .services.importer import start_import_job, get_import_job
+from .services.ai import (
+    generate_reply_async, stream_reply, embed_text_async, embedding_service,
+    warm_up_embeddings, ping_llm,
+)
+from .services.health import startup
+from .services.scheduler import SchedulerBusy, llm_scheduler
+from .services.sidecar import SidecarError, sidecar
+from .config import CHAT_HISTORY_LIMIT, HISTORY_PAGE_MAX, RECALL_MODE, SESSIONS_PAGE_MAX, WARMUP
+from .services.executors import run_io, shutdown_executors
+from .metrics import (
+    CHROMA_COLLECTION_SIZE, CHROMA_OPEN_COLLECTIONS, EMBED_QUEUE_DEPTH, LLM_ACTIVE, LLM_QUEUE_DEPTH, METRICS_CONTENT_TYPE, OUTBOX_PENDING,
+    MetricsMiddleware, render_metrics,
+)
 from .schemas import (
     CreateSessionRequest, CreateSessionResponse, 
     AddMessageRequest, MessageOut, HistoryResponse,
-    SessionsListResponse, UpdateSessionNameRequest
+    SessionInfo, SessionsListResponse, UpdateSessionNameRequest, ChatResponse
 )
 from .db.sqlite import (
-    init_db, create_session as db_create_session, 
+    DB_PATH, init_db, create_session as db_create_session, 
     add_message as db_add_message, get_history as db_get_history,
-    get_all_sessions, update_session_name, get_session_name
+    get_all_sessions, get_session, sessions_version, update_session_name, get_session_name,
+    get_message, session_has_messages, transaction, close_all as close_db,
+    get_outbox_lag
 )
 
+def _warm_embedding_model() -> None:
+    warm_up_embeddings()
+    check_index_encoder()
+
+async def _warm_up() -> None:
+    """Load Chroma and the embedding model, then ping the LLM, off the request path."""
+    await asyncio.gather(
+        # With a sidecar, Chroma lives there; warming up means reaching it
+        startup.run_async("chroma", lambda: run_io(sidecar.ping if sidecar.enabled else warm_up_chroma)),
+        startup.run_async("embedding_model", lambda: run_io(_warm_embedding_model)),
+    )
+    await startup.run_async("llm", ping_llm)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup
-    init_db()
+    # Startup: only the database is opened eagerly; heavy resources load lazily
+    startup.run("database", init_db)
+    memory_indexer.start()
+    if not sidecar.enabled:
+        # Otherwise the sidecar, the only process writing to Chroma, runs it
+        memory_compactor.start()
+
+    warm_up = None
+    if WARMUP:
+        startup.expect("chroma")
+        startup.expect("embedding_model")
+        startup.expect("llm", required=False)
+        warm_up = asyncio.create_task(_warm_up())
     yield
     # Shutdown
-    pass
+    if warm_up is not None and not warm_up.done():
+        warm_up.cancel()
+    memory_compactor.stop()
+    memory_indexer.stop()
+    embedding_service.close()
+    sidecar.close()
+    shutdown_executors()
+    close_db()
+
+# Uploaded archives are spooled here while they are imported
+IMPORT_DIR = DB_PATH.parent / "imports"
 
 app = FastAPI(title="AI Memory Journal", description="A simple API for a memory journal", lifespan=lifespan)
 
@@ -34,75 +95,371 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "ETag"],
 )
+# Added last so it wraps everything, including CORS
+app.add_middleware(MetricsMiddleware)
+
+# Gauges sampled at scrape time; only collections that are already open are counted
+CHROMA_COLLECTION_SIZE.set_function(lambda: count_memories(open_only=True) if chroma_is_open() else 0)
+CHROMA_OPEN_COLLECTIONS.set_function(open_handles)
+OUTBOX_PENDING.set_function(lambda: get_outbox_lag()["pending"])
+EMBED_QUEUE_DEPTH.set_function(lambda: embedding_service.stats()["queue_depth"])
+LLM_QUEUE_DEPTH.set_function(lambda: llm_scheduler.stats()["queued"])
+LLM_ACTIVE.set_function(lambda: llm_scheduler.stats()["running"])
+
+@app.exception_handler(SchedulerBusy)
+async def scheduler_busy(request: Request, exc: SchedulerBusy) -> JSONResponse:
+    # Rejected before anything was stored, so the client can simply resend
+    return JSONResponse(
+        {"detail": str(exc)}, status_code=429, headers={"Retry-After": str(exc.retry_after)}
+    )
+
+@app.exception_handler(SidecarError)
+async def sidecar_unavailable(request: Request, exc: SidecarError) -> JSONResponse:
+    return JSONResponse({"detail": str(exc)}, status_code=503, headers={"Retry-After": "1"})
+
+@app.get("/healthz")
+async def healthz() -> dict:
+    """Liveness: the process is up and serving the event loop."""
+    return {"status": "ok", "uptime_seconds": startup.report()["uptime_seconds"]}
+
+@app.get("/readyz")
+async def readyz() -> JSONResponse:
+    """Readiness: the database is open and, with warm-up enabled, models are loaded."""
+    report = startup.report()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
+
+@app.get("/metrics", include_in_schema=False)
+def metrics() -> Response:
+    """Prometheus scrape endpoint."""
+    return Response(render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
+async def _sessions_etag() -> str:
+    # Stored in SQLite, so every worker and CLI write agrees on it
+    return f'W/"sessions-{await run_io(sessions_version)}"'
+
+def _not_modified(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if header is None:
+        return False
+    return header.strip() == "*" or etag in (tag.strip() for tag in header.split(","))
+
+def _cacheable(response: Response, etag: str) -> None:
+    response.headers["ETag"] = etag
+    # Clients may keep the body but must revalidate it every time
+    response.headers["Cache-Control"] = "no-cache"
 
 @app.get("/sessions", response_model=SessionsListResponse)
-async def list_sessions() -> SessionsListResponse:
-    """Get all sessions with their names and metadata."""
-    sessions = get_all_sessions()
-    return SessionsListResponse(sessions=sessions)
+async def list_sessions(
+    request: Request,
+    response: Response,
+    before: Optional[str] = Query(None, description="Return sessions after this session id in recency order"),
+    limit: Optional[int] = Query(None, ge=1, le=SESSIONS_PAGE_MAX, description="Page size"),
+) -> SessionsListResponse:
+    """Get sessions with their names and counters, most recently active first.
+
+    Responses carry an ETag that changes with every session write, from any
+    process; send it back in If-None-Match to get a 304 for the cost of
+    reading one row.
+    """
+    # Read the version before the data so a tag never claims newer data than it has
+    etag = await _sessions_etag()
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+    fetch_limit = limit + 1 if limit is not None else None
+    sessions = await run_io(get_all_sessions, before=before, limit=fetch_limit)
+    has_more = limit is not None and len(sessions) > limit
+    _cacheable(response, etag)
+    return SessionsListResponse(sessions=sessions[:limit] if has_more else sessions, has_more=has_more)
+
+@app.get("/sessions/{session_id}", response_model=SessionInfo)
+async def get_session_info(session_id: str, request: Request, response: Response) -> SessionInfo:
+    """Get one session's name and counters."""
+    etag = await _sessions_etag()
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    session = await run_io(get_session, session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    _cacheable(response, etag)
+    return SessionInfo(**session)
 
 @app.post("/sessions", response_model=CreateSessionResponse)
 async def create_session(request: CreateSessionRequest = CreateSessionRequest()) -> CreateSessionResponse:
     """Create a new session with optional name."""
     session_id = str(uuid.uuid4())
-    db_create_session(session_id, request.session_name)
-    session_name = request.session_name or get_session_name(session_id)
+    await run_io(db_create_session, session_id, request.session_name)
+    session_name = request.session_name or await run_io(get_session_name, session_id)
     return CreateSessionResponse(session_id=session_id, session_name=session_name)
 
 @app.patch("/sessions/{session_id}", response_model=dict)
 async def rename_session(session_id: str, request: UpdateSessionNameRequest) -> dict:
     """Rename a session."""
-    success = update_session_name(session_id, request.session_name)
+    success = await run_io(update_session_name, session_id, request.session_name)
     if not success:
         raise HTTPException(status_code=404, detail="Session not found")
     return {"success": True, "session_name": request.session_name}
 
 @app.get("/sessions/{session_id}/history", response_model=HistoryResponse)
-async def get_history(session_id: str) -> HistoryResponse:
-    history = db_get_history(session_id)
-    return HistoryResponse(session_id=session_id, messages=history)
-
-@app.post("/chat")
-async def chat(request: AddMessageRequest):
-
-    db_create_session(request.session_id)
-
-    message_id = db_add_message(request.session_id, "user", request.content)
-    write_memory(message_id=message_id, session_id=request.session_id, role="user", content=request.content)
-
-    history = db_get_history(request.session_id)
-    
-    # Auto-rename session based on first message if it's the first user message
-    if len(history) == 1:  # Only the message we just added
-        session_name = get_session_name(request.session_id)
-        if session_name and (session_name.startswith("Chat -") or session_name == "New Conversation"):
-            # This is the first user message, auto-rename to first 30 chars
-            auto_name = request.content[:30].strip()
-            if len(request.content) > 30:
-                auto_name += "..."
+async def get_history(
+    session_id: str,
+    before_id: Optional[int] = Query(None, description="Return messages older than this message id"),
+    after_id: Optional[int] = Query(None, description="Return messages newer than this message id"),
+    limit: Optional[int] = Query(None, ge=1, le=HISTORY_PAGE_MAX, description="Page size"),
+) -> HistoryResponse:
+    """Get a session's messages, optionally one keyset page at a time."""
+    if before_id is not None and after_id is not None:
+        raise HTTPException(status_code=400, detail="Use either before_id or after_id, not both")
+
+    # Fetch one extra row to learn whether another page exists
+    fetch_limit = limit + 1 if limit is not None else None
+    history = await run_io(db_get_history, session_id, before_id=before_id, after_id=after_id, limit=fetch_limit)
+
+    has_more = limit is not None and len(history) > limit
+    if has_more:
+        # Drop the extra row on the far side of the paging direction
+        history = history[:limit] if after_id is not None else history[1:]
+    return HistoryResponse(session_id=session_id, messages=history, has_more=has_more)
+
+def _auto_name(content: str) -> str:
+    # First user message becomes the session name, truncated to 30 chars
+    auto_name = content[:30].strip()
+    if len(content) > 30:
+        auto_name += "..."
+    return auto_name
+
+def _persist_user_message(session_id: str, content: str) -> tuple[dict, str]:
+    """Create the session if needed, store the message and auto-rename, in one transaction.
+
+    Returns the stored message and the (possibly new) session name.
+    """
+    with transaction():
+        db_create_session(session_id)
+        first_message = not session_has_messages(session_id)
+        message_id = db_add_message(session_id, "user", content)
+
+        session_name = get_session_name(session_id)
+        # Auto-rename session based on first message if it's the first user message
+        if first_message and session_name and (session_name.startswith("Chat -") or session_name == "New Conversation"):
+            auto_name = _auto_name(content)
             if auto_name:
-                update_session_name(request.session_id, auto_name)
+                update_session_name(session_id, auto_name)
+                session_name = auto_name
 
-    # 🔽 retrieve long-term memory
-    memories = recall_memories(query=request.content, session_id=request.session_id, k=5)
+        message = get_message(message_id)
+    return message, session_name
 
-    prompt_messages = build_prompt(history=[{"role": m["role"], "content": m["content"]} for m in history], memories=memories)
-    llm_reply = generate_reply(prompt_messages)
+def _persist_assistant_message(session_id: str, content: str) -> dict:
+    with transaction():
+        message_id = db_add_message(session_id, "assistant", content)
+        return get_message(message_id)
 
-    msg_id =db_add_message(request.session_id, "assistant", llm_reply)
-    write_memory(message_id=msg_id, session_id=request.session_id, role="assistant", content=llm_reply)
+async def _start_turn(request: AddMessageRequest) -> tuple[dict, str, list[float]]:
+    """Persist and embed the user message.
 
-    return {"reply": llm_reply}
+    The message is queued for indexing in the same transaction. Returns the
+    stored message, the session name and the message vector, which doubles
+    as the recall query embedding.
+    """
+    (user_message, session_name), vector = await asyncio.gather(
+        run_io(_persist_user_message, request.session_id, request.content),
+        embed_text_async(request.content),
+    )
+    # Recall sees new messages before they are indexed (keyword index, outbox)
+    recall_cache.bump(request.session_id)
+    memory_indexer.notify()
+    return user_message, session_name, vector
+
+async def _build_turn_prompt(
+    request: AddMessageRequest, query_embedding: list[float]
+) -> tuple[list[dict], list[dict]]:
+    """Return the prompt for this turn and the memories recalled for it."""
+    # 🔽 load history and retrieve long-term memory concurrently
+    history, memories = await asyncio.gather(
+        run_io(db_get_history, request.session_id, limit=CHAT_HISTORY_LIMIT),
+        recall_memories_scored_async(
+            query=request.content, session_id=request.session_id, k=5, query_embedding=query_embedding
+        ),
+    )
+
+    prompt_messages = await build_context(request.session_id, history, [m["content"] for m in memories])
+    return prompt_messages, memories
+
+async def _finish_turn(session_id: str, reply: str) -> dict:
+    """Persist the assistant reply and queue it for long-term memory."""
+    message = await run_io(_persist_assistant_message, session_id, reply)
+    recall_cache.bump(session_id)
+    memory_indexer.notify()
+    return message
+
+def _sse(data: dict, event: Optional[str] = None) -> str:
+    """Format one Server-Sent Event."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+@app.post("/chat", response_model=ChatResponse)
+async def chat(request: AddMessageRequest) -> ChatResponse:
+    """Store a user message, generate the reply and store it.
+
+    Turns in one session run one at a time, in order. Returns 429 with
+    Retry-After when too many turns are already waiting for the LLM.
+    """
+    ticket = llm_scheduler.admit()
+    try:
+        async with llm_scheduler.session(request.session_id):
+            user_message, session_name, vector = await _start_turn(request)
+            prompt_messages, memories = await _build_turn_prompt(request, vector)
+            async with ticket.slot(prompt_tokens(prompt_messages)):
+                llm_reply = await generate_reply_async(prompt_messages)
+
+            assistant_message = await _finish_turn(request.session_id, llm_reply)
+    finally:
+        ticket.release()
+
+    return ChatResponse(
+        reply=llm_reply,
+        session_id=request.session_id,
+        session_name=session_name,
+        user_message=user_message,
+        assistant_message=assistant_message,
+        memories=memories,
+    )
+
+@app.post("/chat/stream")
+async def chat_stream(request: AddMessageRequest, http_request: Request) -> StreamingResponse:
+    """Like /chat, but streams reply tokens as Server-Sent Events.
+
+    Emits ``data: {"token": ...}`` per token and a final ``event: done`` carrying
+    the same payload as /chat once the reply has been persisted. If the client
+    disconnects, generation is cancelled and no assistant message is stored.
+    Scheduled like /chat; a full queue is rejected with 429 before streaming.
+    """
+    # The queue place is reserved before the response starts, so a full queue
+    # still gets a 429. The generator releases it however the stream ends; the
+    # background task covers a client that leaves before the generator runs.
+    # Session locks are only taken inside the generator.
+    ticket = llm_scheduler.admit()
+
+    async def events():
+        parts: list[str] = []
+        try:
+            async with llm_scheduler.session(request.session_id):
+                user_message, session_name, vector = await _start_turn(request)
+                prompt_messages, memories = await _build_turn_prompt(request, vector)
+
+                async with ticket.slot(prompt_tokens(prompt_messages)):
+                    async for token in stream_reply(prompt_messages):
+                        if await http_request.is_disconnected():
+                            # Leaving the loop closes the Ollama stream, which stops generation
+                            return
+                        parts.append(token)
+                        yield _sse({"token": token})
+
+                llm_reply = "".join(parts)
+                assistant_message = await _finish_turn(request.session_id, llm_reply)
+            response = ChatResponse(
+                reply=llm_reply,
+                session_id=request.session_id,
+                session_name=session_name,
+                user_message=user_message,
+                assistant_message=assistant_message,
+                memories=memories,
+            )
+            yield _sse(response.model_dump(mode="json"), event="done")
+        except Exception as e:
+            yield _sse({"detail": str(e)}, event="error")
+        finally:
+            ticket.release()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(ticket.release),
+    )
+
+@app.post("/import", status_code=202)
+async def import_archive(
+    request: Request,
+    format: Literal["ndjson", "markdown"] = Query("ndjson", description="Archive format"),
+) -> dict:
+    """Bulk-import a journal archive sent as the raw request body.
+
+    The body is spooled to disk as it arrives (bounded memory) and imported in
+    the background; poll the returned status URL for progress. The import
+    checkpoint is keyed by the body's SHA-256, so uploading the same archive
+    again after a failed job resumes where it stopped.
+    """
+    IMPORT_DIR.mkdir(parents=True, exist_ok=True)
+    suffix = ".md" if format == "markdown" else ".ndjson"
+    path = IMPORT_DIR / f"upload-{uuid.uuid4()}{suffix}"
+    digest = hashlib.sha256()
+    with path.open("wb") as f:
+        async for chunk in request.stream():
+            digest.update(chunk)
+            await run_io(f.write, chunk)
+
+    source = f"{format}:sha256:{digest.hexdigest()}"
+    job_id = start_import_job(path, format, source=source, delete_after=True)
+    return {"job_id": job_id, "status_url": f"/import/{job_id}"}
+
+@app.get("/import/{job_id}")
+async def import_status(job_id: str) -> dict:
+    job = get_import_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job
 
 @app.get("/debug/memory_count")
 def memory_count():
-    return {"count": collection.count()}
+    if sidecar.enabled:
+        return {"count": sidecar.server_stats()["memories"]}
+    return {"count": count_memories()}
+
+@app.get("/debug/embedding_stats")
+def embedding_stats():
+    if sidecar.enabled:
+        return sidecar.server_stats()["embedding"]
+    return embedding_service.stats()
+
+@app.get("/debug/sidecar")
+def sidecar_stats():
+    return {"client": sidecar.stats(), "server": sidecar.server_stats() if sidecar.enabled else None}
+
+@app.get("/debug/indexer")
+def indexer_stats():
+    return memory_indexer.stats()
+
+@app.get("/debug/archive")
+def archive_stats():
+    return db_archive_stats()
+
+@app.get("/debug/compaction")
+def compaction_stats():
+    if sidecar.enabled:
+        return sidecar.server_stats()["compaction"]
+    return memory_compactor.stats()
+
+@app.get("/debug/scheduler")
+def scheduler_stats():
+    return llm_scheduler.stats()
+
+@app.get("/debug/recall_cache")
+def recall_cache_stats():
+    return recall_cache.stats()
 
 @app.get("/debug/recall")
-def debug_recall(q: str, session_id: str):
-    memories = recall_memories(q, session_id)
-    return {"memories": memories}
+def debug_recall(
+    q: str,
+    session_id: str,
+    k: int = Query(5, ge=1, le=100),
+    mode: str = Query(RECALL_MODE, description=f"One of {', '.join(RECALL_MODES)}"),
+):
+    if mode not in RECALL_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {', '.join(RECALL_MODES)}")
+    return {"mode": mode, "memories": recall_memories_scored(q, session_id, k, mode=mode)}
 
 
 
@@ -0,0 +1,221 @@
+"""Prometheus metrics, per-request stage timings and slow-request profiling.
+
+Code marks a pipeline stage with ``stage("name")`` or ``@timed("name")``.
+Each stage is observed in the ``journal_stage_seconds`` histogram and, when it
+runs inside an HTTP request, added to that request's ``Server-Timing`` header.
+Stages running on the executors are attributed to the request because
+``run_io`` copies the caller's context.
+"""
+import asyncio
+import contextvars
+import functools
+import logging
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+from .config import PROFILE_DIR, PROFILE_MIN_MS, PROFILE_SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+METRICS_CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+_LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+REQUEST_SECONDS = Histogram(
+    "journal_http_request_seconds", "HTTP request latency, including streamed bodies",
+    ["method", "route", "status"], buckets=_LATENCY_BUCKETS,
+)
+STAGE_SECONDS = Histogram(
+    "journal_stage_seconds", "Latency of one pipeline stage", ["stage"], buckets=_LATENCY_BUCKETS,
+)
+LLM_TOKENS = Counter(
+    "journal_llm_tokens_total", "Tokens processed by the LLM as reported by Ollama", ["kind"],
+)
+PROMPT_TOKENS = Histogram(
+    "journal_prompt_tokens", "Estimated size of assembled chat prompts",
+    buckets=(250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000),
+)
+RECALL_HITS = Histogram(
+    "journal_recall_hits", "Memories returned per recall", buckets=(0, 1, 2, 3, 4, 5, 10, 20),
+)
+RECALL_PENDING = Counter(
+    "journal_recall_pending_total", "Not-yet-indexed outbox messages scored during recall",
+)
+RECALL_CACHE_REQUESTS = Counter(
+    "journal_recall_cache_requests_total", "Recall cache lookups by outcome (hit, miss, invalidated, expired)",
+    ["result"],
+)
+LLM_QUEUE_WAIT = Histogram(
+    "journal_llm_queue_wait_seconds", "Time from admission to an LLM generation slot", ["priority"],
+    buckets=_LATENCY_BUCKETS,
+)
+LLM_REJECTED = Counter("journal_llm_rejected_total", "Turns rejected with 429 because the LLM queue was full")
+LLM_QUEUE_DEPTH = Gauge("journal_llm_queue_depth", "Admitted turns waiting for an LLM slot")
+LLM_ACTIVE = Gauge("journal_llm_active", "LLM generations in progress")
+MEMORIES_COMPACTED = Counter(
+    "journal_memories_compacted_total", "Memories removed from the index by compaction", ["reason"],
+)
+CHROMA_COLLECTION_SIZE = Gauge(
+    "journal_chroma_collection_size", "Documents in the open Chroma memory collections",
+)
+CHROMA_OPEN_COLLECTIONS = Gauge("journal_chroma_open_collections", "Chroma collection handles held open")
+OUTBOX_PENDING = Gauge("journal_outbox_pending", "Messages waiting to be indexed")
+EMBED_QUEUE_DEPTH = Gauge("journal_embed_queue_depth", "Texts waiting in the embedding service queue")
+
+
+def render_metrics() -> bytes:
+    """Current metrics in the Prometheus text exposition format."""
+    return generate_latest()
+
+
+# -------------------------------
+# Stage timing
+# -------------------------------
+# Stage name -> accumulated seconds for the current request (None outside requests)
+_timings: contextvars.ContextVar[Optional[dict[str, float]]] = contextvars.ContextVar(
+    "journal_stage_timings", default=None
+)
+_timings_lock = threading.Lock()
+
+
+def record_stage(name: str, seconds: float) -> None:
+    STAGE_SECONDS.labels(name).observe(seconds)
+    timings = _timings.get()
+    if timings is not None:
+        with _timings_lock:
+            timings[name] = timings.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time the enclosed block as pipeline stage ``name``."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+def timed(name: str) -> Callable:
+    """Decorator form of ``stage`` for sync and async functions."""
+    def decorate(fn: Callable) -> Callable:
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with stage(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def server_timing(timings: dict[str, float], total: float) -> str:
+    """Format stage timings as a Server-Timing header value (durations in ms)."""
+    with _timings_lock:
+        items = list(timings.items())
+    parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in items]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+# -------------------------------
+# Sampling profiler
+# -------------------------------
+# pyinstrument attributes samples per async context; profile one request at a time
+_profiling = threading.Lock()
+
+
+def _start_profiler():
+    if not PROFILE_DIR or random.random() >= PROFILE_SAMPLE_RATE:
+        return None
+    if not _profiling.acquire(blocking=False):
+        return None
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        _profiling.release()
+        logger.warning("JOURNAL_PROFILE_DIR is set but pyinstrument is not installed")
+        return None
+    profiler = Profiler(async_mode="enabled")
+    profiler.start()
+    return profiler
+
+
+def _finish_profiler(profiler, method: str, route: str, elapsed: float) -> None:
+    """Stop the profiler and, if the request was slow, write its flame graph."""
+    try:
+        profiler.stop()
+        if elapsed * 1000 < PROFILE_MIN_MS:
+            return
+        from pyinstrument.renderers import SpeedscopeRenderer
+
+        out_dir = Path(PROFILE_DIR)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{method}-{slug}-{elapsed * 1000:.0f}ms"
+        # Open the .speedscope.json at https://www.speedscope.app for a flame graph
+        (out_dir / f"{name}.speedscope.json").write_text(profiler.output(SpeedscopeRenderer()))
+        (out_dir / f"{name}.html").write_text(profiler.output_html())
+    except Exception:
+        logger.exception("Failed to write request profile")
+    finally:
+        _profiling.release()
+
+
+# -------------------------------
+# ASGI middleware
+# -------------------------------
+class MetricsMiddleware:
+    """Times every HTTP request, adds a Server-Timing header and samples profiles.
+
+    A plain ASGI middleware (not BaseHTTPMiddleware) so streamed responses and
+    disconnect detection pass through untouched. For streamed responses the
+    header is sent before the body, so it only covers stages finished by then.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings: dict[str, float] = {}
+        token = _timings.set(timings)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                header = server_timing(timings, time.perf_counter() - started)
+                message = {**message, "headers": [*message.get("headers", []), (b"server-timing", header.encode("latin-1"))]}
+            await send(message)
+
+        profiler = _start_profiler()
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            elapsed = time.perf_counter() - started
+            _timings.reset(token)
+            # The router stores the matched route in the scope; label by its template, not the raw path
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_SECONDS.labels(scope["method"], route, str(status)).observe(elapsed)
+            if profiler is not None:
+                _finish_profiler(profiler, scope["method"], route, elapsed)
@@ -17,9 +17,11 @@ class SessionInfo(BaseModel):
     session_name: str = Field(..., description="The name of the session")
     created_at: str = Field(..., description="Creation timestamp")
     message_count: int = Field(..., description="Number of messages in the session")
+    last_activity: Optional[str] = Field(None, description="Timestamp of the latest message, or creation if none")
 
 class SessionsListResponse(BaseModel):
-    sessions: List[SessionInfo] = Field(..., description="List of all sessions")
+    sessions: List[SessionInfo] = Field(..., description="Sessions, most recently active first")
+    has_more: bool = Field(False, description="Whether more sessions exist after this page")
 
 class UpdateSessionNameRequest(BaseModel):
     session_name: str = Field(..., description="New name for the session")
@@ -39,5 +41,20 @@ class MessageOut(BaseModel):
 class HistoryResponse(BaseModel):
     session_id: str = Field(..., description="The ID of the session")
     messages: List[MessageOut] = Field(..., description="The messages in the session")
+    has_more: bool = Field(False, description="Whether more messages exist beyond this page in the paging direction")
 
 
+
+class RecalledMemory(BaseModel):
+    message_id: Optional[int] = Field(None, description="The source message ID, if the memory maps to one")
+    content: str = Field(..., description="The recalled memory text")
+    distance: Optional[float] = Field(None, description="Squared L2 distance to the query (lower is closer); None for lexical-only matches")
+    score: float = Field(..., description="Reciprocal-rank fusion score across retrievers (higher is better)")
+
+class ChatResponse(BaseModel):
+    reply: str = Field(..., description="The assistant's reply")
+    session_id: str = Field(..., description="The ID of the session")
+    session_name: str = Field(..., description="The session name, after any auto-rename")
+    user_message: MessageOut = Field(..., description="The persisted user message")
+    assistant_message: MessageOut = Field(..., description="The persisted assistant message")
+    memories: List[RecalledMemory] = Field(default_factory=list, description="Memories recalled for this turn")
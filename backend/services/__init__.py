@@ -1,11 +1,21 @@
 """Service layer for AI and memory operations."""
-from .memory import recall_memories, write_memory
-from .ai import generate_reply, build_prompt, embed_text
+from .memory import recall_memories, recall_memories_scored, write_memory, write_memories
+from .ai import generate_reply, generate_reply_async, stream_reply, build_prompt, embed_text, embed_texts, embed_text_async, embedding_service
+from .context import build_context, count_tokens
 
 __all__ = [
     "recall_memories",
+    "recall_memories_scored",
     "write_memory",
+    "write_memories",
     "generate_reply",
+    "generate_reply_async",
+    "stream_reply",
     "build_prompt",
     "embed_text",
+    "build_context",
+    "count_tokens",
+    "embed_texts",
+    "embed_text_async",
+    "embedding_service",
 ]
@@ -1,31 +1,512 @@
 """AI-related operations: embeddings, LLM, and prompt building."""
-from sentence_transformers import SentenceTransformer
+import asyncio
+import functools
+import hashlib
+import logging
+import queue
+import re
+import shutil
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import aclosing
+from pathlib import Path
+from typing import AsyncIterator, Callable, Optional
+
 import ollama
 
-# Initialize embedding model
-_embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
+from ..config import (
+    EMBEDDING_MODEL, EMBEDDING_BACKEND, EMBED_MAX_BATCH, EMBED_MAX_WAIT_MS, EMBED_WORKERS,
+    EMBED_CACHE_SIZE, EMBED_CACHE_PERSIST, EMBED_CACHE_DISK_SIZE, OLLAMA_MODEL,
+    ONNX_MODEL_DIR, ONNX_QUANTIZE, ONNX_THREADS,
+)
+from ..db.sqlite import DB_PATH
+from ..metrics import LLM_TOKENS, record_stage, stage, timed
+from .embedding_cache import EmbeddingCache
+from .executors import run_io
+from .sidecar import sidecar
+
+logger = logging.getLogger(__name__)
+
+# Embedding model, loaded on first use (importing torch alone takes seconds)
+_embedding_model = None
+_embedding_model_lock = threading.Lock()
+
+# Async client so LLM calls don't block the event loop
+_ollama_async = ollama.AsyncClient()
+
+
+# Upper bounds of the batch-size histogram buckets
+_BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+class EmbeddingService:
+    """Collects concurrent embed requests and encodes them in batches.
+
+    Callers get a future per text. Worker threads (one by default) drain the
+    queue, flushing a batch once it holds ``max_batch`` texts or the oldest
+    request has waited ``max_wait_ms``, and run one ``encode`` per batch.
+    Texts in ``cache``'s memory are answered immediately without queueing;
+    its disk tier is consulted by the worker, just before encoding.
+    """
+
+    def __init__(
+        self,
+        encode: Callable[[list[str]], list[list[float]]],
+        *,
+        max_batch: int = EMBED_MAX_BATCH,
+        max_wait_ms: int = EMBED_MAX_WAIT_MS,
+        workers: int = EMBED_WORKERS,
+        cache: Optional[EmbeddingCache] = None,
+    ) -> None:
+        self._encode = encode
+        self.cache = cache
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0, max_wait_ms) / 1000
+        self.workers = max(1, workers)
+        self._queue: "queue.Queue[Optional[tuple[str, Future, float]]]" = queue.Queue()
+        self._threads: list[threading.Thread] = []
+        self._lock = threading.Lock()
+
+        self._batch_sizes = {b: 0 for b in _BATCH_BUCKETS}
+        self._batch_sizes_overflow = 0
+        self._batches = 0
+        self._texts = 0
+        self._queue_wait_total = 0.0
+        self._queue_wait_max = 0.0
+
+    def configure(self, *, max_batch: Optional[int] = None, workers: Optional[int] = None) -> None:
+        """Adjust limits, e.g. larger batches and more workers for bulk jobs."""
+        with self._lock:
+            if max_batch is not None:
+                self.max_batch = max(1, max_batch)
+            if workers is not None:
+                self.workers = max(1, workers)
+
+    def _ensure_worker(self) -> None:
+        if len(self._threads) < self.workers or not all(t.is_alive() for t in self._threads):
+            with self._lock:
+                self._threads = [t for t in self._threads if t.is_alive()]
+                while len(self._threads) < self.workers:
+                    thread = threading.Thread(
+                        target=self._run, name=f"journal-embed-{len(self._threads)}", daemon=True
+                    )
+                    thread.start()
+                    self._threads.append(thread)
+
+    def submit(self, text: str) -> Future:
+        """Queue one text for embedding and return a future for its vector."""
+        future: Future = Future()
+        if self.cache is not None:
+            cached = self.cache.get(text)
+            if cached is not None:
+                future.set_result(cached)
+                return future
+        self._ensure_worker()
+        self._queue.put((text, future, time.perf_counter()))
+        return future
+
+    def embed(self, text: str) -> list[float]:
+        return self.submit(text).result()
+
+    def embed_many(self, texts: list[str]) -> list[list[float]]:
+        futures = [self.submit(t) for t in texts]
+        return [f.result() for f in futures]
+
+    async def embed_async(self, text: str) -> list[float]:
+        return await asyncio.wrap_future(self.submit(text))
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = item[2] + self.max_wait
+            stop = False
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                try:
+                    nxt = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    stop = True
+                    break
+                batch.append(nxt)
+            self._flush(batch)
+            if stop:
+                return
+
+    def _flush(self, batch: list[tuple[str, Future, float]]) -> None:
+        started = time.perf_counter()
+        live = [(text, fut, queued) for text, fut, queued in batch if fut.set_running_or_notify_cancel()]
+        if not live:
+            return
+        if self.cache is not None and self.cache.persistent:
+            # Disk lookups happen here, on the worker, never in submit() on the event loop
+            try:
+                stored = self.cache.load_many([text for text, _, _ in live])
+            except Exception:
+                logger.warning("Embedding cache lookup failed", exc_info=True)
+                stored = [None] * len(live)
+            for (_, fut, _), vector in zip(live, stored):
+                if vector is not None:
+                    fut.set_result(vector)
+            live = [item for item, vector in zip(live, stored) if vector is None]
+            if not live:
+                return
+        try:
+            with stage("embed.encode"):
+                vectors = self._encode([text for text, _, _ in live])
+        except Exception as e:
+            for _, fut, _ in live:
+                fut.set_exception(e)
+            return
+        # Waiters are released before the cache write, which must never strand them
+        for (_, fut, _), vector in zip(live, vectors):
+            fut.set_result(vector)
+        if self.cache is not None:
+            try:
+                self.cache.put_many([text for text, _, _ in live], vectors)
+            except Exception:
+                logger.warning("Could not cache %d embeddings", len(live), exc_info=True)
+        self._record(len(live), [started - queued for _, _, queued in live])
+
+    def _record(self, size: int, waits: list[float]) -> None:
+        with self._lock:
+            self._batches += 1
+            self._texts += size
+            for bound in _BATCH_BUCKETS:
+                if size <= bound:
+                    self._batch_sizes[bound] += 1
+                    break
+            else:
+                self._batch_sizes_overflow += 1
+            self._queue_wait_total += sum(waits)
+            self._queue_wait_max = max(self._queue_wait_max, max(waits))
+
+    def stats(self) -> dict:
+        """Batch-size histogram and queue-wait counters."""
+        with self._lock:
+            histogram = {f"le_{b}": n for b, n in self._batch_sizes.items()}
+            histogram["le_inf"] = self._batch_sizes_overflow
+            return {
+                "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait * 1000,
+                "workers": self.workers,
+                "queue_depth": self._queue.qsize(),
+                "batches": self._batches,
+                "texts": self._texts,
+                "batch_size_histogram": histogram,
+                "queue_wait_seconds_total": self._queue_wait_total,
+                "queue_wait_seconds_max": self._queue_wait_max,
+                "queue_wait_seconds_avg": self._queue_wait_total / self._texts if self._texts else 0.0,
+                "cache": self.cache.stats() if self.cache is not None else None,
+            }
+
+    def close(self) -> None:
+        """Stop the workers after they drain what is already queued."""
+        threads, self._threads = self._threads, []
+        for _ in threads:
+            self._queue.put(None)
+        for thread in threads:
+            thread.join()
+        if self.cache is not None:
+            self.cache.close()
+
+
+def get_embedding_model():
+    """Load the SentenceTransformer model on first use."""
+    global _embedding_model
+    if _embedding_model is None:
+        with _embedding_model_lock:
+            if _embedding_model is None:
+                from sentence_transformers import SentenceTransformer
+                _embedding_model = SentenceTransformer(EMBEDDING_MODEL)
+    return _embedding_model
+
+
+def is_embedding_model_loaded() -> bool:
+    return _embedding_model is not None
+
+
+def warm_up_embeddings() -> None:
+    """Load the configured encoder and run one dummy batch through it."""
+    if sidecar.enabled:
+        # The sidecar owns the encoder; wait until it answers
+        sidecar.ping()
+        return
+    _ENCODERS[EMBEDDING_BACKEND](["warm up"])
+
+
+def _encode_batch(texts: list[str]) -> list[list[float]]:
+    return get_embedding_model().encode(texts).tolist()
+
+
+# -------------------------------
+# ONNX Runtime encoder
+# -------------------------------
+# The same MiniLM weights run through ONNX Runtime: no torch import (hundreds of
+# MB less RSS per worker) and optionally int8 weights. Vectors match the
+# PyTorch ones closely enough to share an index; int8 drifts slightly more.
+ONNX_FILE = "model.onnx"
+ONNX_INT8_FILE = "model_int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+# Token limit of all-MiniLM-L6-v2 in sentence-transformers
+_ONNX_MAX_TOKENS = 256
+
+_onnx_encoder = None
+_onnx_encoder_lock = threading.Lock()
+
+
+class OnnxEncoder:
+    """Sentence embeddings from an ONNX transformer export.
+
+    Mirrors the sentence-transformers pipeline for MiniLM: tokenize, run the
+    transformer, mean-pool token states over the attention mask, L2-normalize.
+    """
+
+    def __init__(self, model_dir: Path, *, quantized: bool = False, threads: int = 0) -> None:
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        path = model_dir / (ONNX_INT8_FILE if quantized else ONNX_FILE)
+        if not path.exists():
+            flag = " --quantize" if quantized else ""
+            raise FileNotFoundError(f"{path} not found; run `python -m backend.cli export-onnx{flag}`")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.inter_op_num_threads = 1
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(str(path), options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        outputs = [o.name for o in self.session.get_outputs()]
+        self.output_name = "last_hidden_state" if "last_hidden_state" in outputs else outputs[0]
+
+        self.tokenizer = Tokenizer.from_file(str(model_dir / TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=_ONNX_MAX_TOKENS)
+        self.tokenizer.enable_padding()
+
+    def encode(self, texts: list[str]) -> list[list[float]]:
+        import numpy as np
+
+        encodings = self.tokenizer.encode_batch(texts)
+        ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": ids, "attention_mask": mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(ids)
+        hidden = self.session.run([self.output_name], feeds)[0]
+
+        weights = mask[..., None].astype(np.float32)
+        pooled = (hidden * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-9)
+        pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+        return pooled.tolist()
+
+
+def get_onnx_encoder() -> OnnxEncoder:
+    """Load the ONNX model on first use."""
+    global _onnx_encoder
+    if _onnx_encoder is None:
+        with _onnx_encoder_lock:
+            if _onnx_encoder is None:
+                _onnx_encoder = OnnxEncoder(ONNX_MODEL_DIR, quantized=ONNX_QUANTIZE, threads=ONNX_THREADS)
+    return _onnx_encoder
+
+
+def _onnx_encode_batch(texts: list[str]) -> list[list[float]]:
+    return get_onnx_encoder().encode(texts)
 
 
+def export_onnx_model(model_dir: Path = ONNX_MODEL_DIR, *, quantize: bool = ONNX_QUANTIZE) -> dict:
+    """Fetch the ONNX export and tokenizer of EMBEDDING_MODEL, optionally adding int8 weights.
+
+    Uses the export published alongside the sentence-transformers model, so
+    neither torch nor the optimum exporter is needed. Quantization is dynamic
+    (int8 weights, activations quantized at run time) and runs locally.
+    """
+    from huggingface_hub import hf_hub_download
+
+    repo = EMBEDDING_MODEL if "/" in EMBEDDING_MODEL else f"sentence-transformers/{EMBEDDING_MODEL}"
+    model_dir.mkdir(parents=True, exist_ok=True)
+    for remote, local in ((f"onnx/{ONNX_FILE}", ONNX_FILE), (TOKENIZER_FILE, TOKENIZER_FILE)):
+        if not (model_dir / local).exists():
+            shutil.copyfile(hf_hub_download(repo, remote), model_dir / local)
+
+    if quantize and not (model_dir / ONNX_INT8_FILE).exists():
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(model_dir / ONNX_FILE, model_dir / ONNX_INT8_FILE, weight_type=QuantType.QInt8)
+
+    return {
+        "model_dir": str(model_dir),
+        "files": {p.name: p.stat().st_size for p in sorted(model_dir.iterdir()) if p.is_file()},
+    }
+
+
+# Deterministic stand-in embedder: a bag of hashed random word vectors.
+# Texts sharing words land near each other, so recall stays meaningful
+# without loading any model. Not compatible with MiniLM vectors.
+_HASH_DIM = 384
+_WORD_RE = re.compile(r"\w+")
+
+
+@functools.lru_cache(maxsize=50_000)
+def _hash_word_vector(word: str):
+    import numpy as np
+    seed = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+    return np.random.default_rng(seed).standard_normal(_HASH_DIM).astype("float32")
+
+
+def _hash_encode_batch(texts: list[str]) -> list[list[float]]:
+    import numpy as np
+    out = []
+    for text in texts:
+        vector = np.zeros(_HASH_DIM, dtype="float32")
+        for word in _WORD_RE.findall(text.lower()):
+            vector += _hash_word_vector(word)
+        norm = float(np.linalg.norm(vector))
+        out.append((vector / norm if norm else vector).tolist())
+    return out
+
+
+_ENCODERS = {
+    "sentence-transformers": _encode_batch,
+    "onnx": _onnx_encode_batch,
+    "hash": _hash_encode_batch,
+}
+
+
+if EMBEDDING_BACKEND not in _ENCODERS:
+    raise ValueError(f"Unknown JOURNAL_EMBEDDING_BACKEND {EMBEDDING_BACKEND!r}; expected one of {sorted(_ENCODERS)}")
+
+
+def _encoder_name() -> str:
+    if EMBEDDING_BACKEND == "sentence-transformers":
+        return EMBEDDING_MODEL
+    if EMBEDDING_BACKEND == "onnx" and ONNX_QUANTIZE:
+        return f"onnx-int8:{EMBEDDING_MODEL}"
+    return f"{EMBEDDING_BACKEND}:{EMBEDDING_MODEL}"
+
+
+# Identifies the exact vectors produced (backend, weights and model)
+ENCODER_NAME = _encoder_name()
+# Encoders in the same vector space can query each other's vectors: the PyTorch
+# and ONNX MiniLM backends share one, the hash stand-in has its own
+VECTOR_SPACE = "hash" if EMBEDDING_BACKEND == "hash" else EMBEDDING_MODEL
+
+
+def encode_batch(texts: list[str]) -> list[list[float]]:
+    """Encode with the configured backend directly, bypassing the cache and batching service."""
+    return _ENCODERS[EMBEDDING_BACKEND](texts)
+
+
+# Cache keys include the encoder so vectors from different backends never mix
+embedding_cache = EmbeddingCache(
+    ENCODER_NAME,
+    max_entries=EMBED_CACHE_SIZE,
+    path=DB_PATH.parent / "embedding_cache.db" if EMBED_CACHE_PERSIST else None,
+    disk_max_entries=EMBED_CACHE_DISK_SIZE,
+)
+
+# Shared by write_memory, recall and bulk paths so concurrent callers batch together
+embedding_service = EmbeddingService(_ENCODERS[EMBEDDING_BACKEND], cache=embedding_cache)
+
+
+@timed("embed")
 def embed_text(text: str) -> list[float]:
     """Generate embeddings for text using sentence transformers."""
-    return _embedding_model.encode(text).tolist()
+    if sidecar.enabled:
+        return sidecar.embed([text])[0]
+    return embedding_service.embed(text)
+
+
+@timed("embed")
+def embed_texts(texts: list[str]) -> list[list[float]]:
+    """Generate embeddings for several texts, batched by the embedding service."""
+    if sidecar.enabled:
+        return sidecar.embed(texts)
+    return embedding_service.embed_many(texts)
+
 
+@timed("embed")
+async def embed_text_async(text: str) -> list[float]:
+    """Embed text without blocking the event loop."""
+    if sidecar.enabled:
+        return (await run_io(sidecar.embed, [text]))[0]
+    return await embedding_service.embed_async(text)
 
+
+def _record_usage(response) -> None:
+    """Count the prompt and completion tokens Ollama reports on a finished reply."""
+    LLM_TOKENS.labels("prompt").inc(response.get("prompt_eval_count") or 0)
+    LLM_TOKENS.labels("completion").inc(response.get("eval_count") or 0)
+
+
+@timed("llm.generate")
 def generate_reply(messages: list[dict]) -> str:
     """Generate a reply using Ollama LLM."""
     response = ollama.chat(
-        model="llama3.1",
+        model=OLLAMA_MODEL,
         messages=messages
     )
+    _record_usage(response)
     return response["message"]["content"]
 
 
+@timed("llm.generate")
+async def generate_reply_async(messages: list[dict]) -> str:
+    """Generate a reply using the async Ollama client."""
+    response = await _ollama_async.chat(
+        model=OLLAMA_MODEL,
+        messages=messages
+    )
+    _record_usage(response)
+    return response["message"]["content"]
+
+
+async def ping_llm() -> None:
+    """Cheap round-trip to Ollama to confirm it is reachable and the model exists."""
+    await _ollama_async.show(OLLAMA_MODEL)
+
+
+async def stream_reply(messages: list[dict]) -> AsyncIterator[str]:
+    """Yield reply tokens from Ollama as they are generated.
+
+    Closing the iterator early closes the underlying HTTP stream, which makes
+    Ollama stop generating.
+    """
+    started = time.perf_counter()
+    first_token = True
+    try:
+        stream = await _ollama_async.chat(
+            model=OLLAMA_MODEL,
+            messages=messages,
+            stream=True
+        )
+        async with aclosing(stream):
+            async for chunk in stream:
+                if chunk.get("done"):
+                    _record_usage(chunk)
+                token = chunk["message"]["content"]
+                if token:
+                    if first_token:
+                        record_stage("llm.first_token", time.perf_counter() - started)
+                        first_token = False
+                    yield token
+    finally:
+        record_stage("llm.stream", time.perf_counter() - started)
+
+
 def build_prompt(
     *,
     history: list[dict],
-    memories: list[str]
+    memories: list[str],
+    summary: Optional[str] = None
 ) -> list[dict]:
-    """Build a prompt with system message, memories, and conversation history."""
+    """Build a prompt with system message, memories, summary, and conversation history."""
     system_message = {
         "role": "system",
         "content": (
@@ -41,11 +522,19 @@ def build_prompt(
         "content": "PAST MEMORIES:\n" + "\n".join(f"- {m}" for m in memories)
     } if memories else None
 
+    summary_block = {
+        "role": "system",
+        "content": "SUMMARY OF EARLIER CONVERSATION:\n" + summary
+    } if summary else None
+
     messages = [system_message]
 
     if memory_block:
         messages.append(memory_block)
 
+    if summary_block:
+        messages.append(summary_block)
+
     messages.extend(history)
 
     return messages
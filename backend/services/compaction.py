@@ -0,0 +1,300 @@
+"""Memory compaction: merge near-duplicate memories and roll up old low-value turns.
+
+Compaction only touches the Chroma index. Messages stay in SQLite (and in
+the keyword index) untouched; ``compacted_memories`` maps every message whose
+memory was removed to the memory that now stands for it.
+"""
+import logging
+import threading
+import time
+from typing import Any, Callable, Optional
+
+import numpy as np
+
+from ..config import (
+    COMPACT_BLOCK, COMPACT_INTERVAL, COMPACT_ROLLUP_AGE_DAYS, COMPACT_ROLLUP_BATCH,
+    COMPACT_ROLLUP_MAX_CHARS, COMPACT_SIMILARITY,
+)
+from ..db.chroma import collection_for, count_memories, session_filter
+from ..db.sqlite import (
+    get_compaction_totals, get_rollup_candidates, get_sessions_to_compact,
+    mark_session_compacted, record_compaction, save_rollup_memory, transaction,
+)
+from ..metrics import MEMORIES_COMPACTED, stage, timed
+from .ai import embed_texts, generate_reply
+from .memory import _message_id, recall_cache
+
+logger = logging.getLogger(__name__)
+
+# Turns a run of messages into the text of one summary memory
+Summarizer = Callable[[list[dict]], str]
+
+
+def near_duplicate_clusters(
+    embeddings: Any,
+    labels: list[str],
+    threshold: float = COMPACT_SIMILARITY,
+    block: int = COMPACT_BLOCK,
+) -> list[list[int]]:
+    """Group rows whose cosine similarity is at least ``threshold``.
+
+    Only rows with equal ``labels`` are compared. Similar pairs are found one
+    ``block`` x ``block`` tile at a time with a matrix product, so memory
+    stays bounded for large sessions. Clustering is greedy in row order: each
+    row that has not been absorbed absorbs every later similar row, so a
+    cluster never drifts beyond its first row's neighbourhood. Returns the
+    clusters with at least two rows, first row first.
+    """
+    n = len(embeddings)
+    if n < 2:
+        return []
+    x = np.asarray(embeddings, dtype=np.float32)
+    x = x / np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12)
+    _, codes = np.unique(np.asarray(labels), return_inverse=True)
+
+    pairs_i, pairs_j = [], []
+    for r0 in range(0, n, block):
+        rows = x[r0:r0 + block]
+        for c0 in range(r0, n, block):
+            hit = rows @ x[c0:c0 + block].T >= threshold
+            if c0 == r0:
+                # Diagonal tile: each pair once, and never a row with itself
+                hit &= np.triu(np.ones(hit.shape, dtype=bool), k=1)
+            hit &= codes[r0:r0 + block, None] == codes[None, c0:c0 + block]
+            i, j = np.nonzero(hit)
+            if len(i):
+                pairs_i.append(i + r0)
+                pairs_j.append(j + c0)
+    if not pairs_i:
+        return []
+
+    i, j = np.concatenate(pairs_i), np.concatenate(pairs_j)
+    order = np.lexsort((j, i))
+    absorbed_by = np.full(n, -1, dtype=np.int64)
+    # Pairs are sparse; a row's own pairs come after any pair that absorbs it
+    for a, b in zip(i[order].tolist(), j[order].tolist()):
+        if absorbed_by[a] < 0 and absorbed_by[b] < 0:
+            absorbed_by[b] = a
+
+    clusters: dict[int, list[int]] = {}
+    for b in np.flatnonzero(absorbed_by >= 0).tolist():
+        root = int(absorbed_by[b])
+        clusters.setdefault(root, [root]).append(b)
+    return list(clusters.values())
+
+
+def _rollup_prompt(messages: list[dict]) -> list[dict]:
+    turns = "\n".join(f"{m['role'].upper()}: {m['content']}" for m in messages)
+    return [
+        {
+            "role": "system",
+            "content": (
+                "Condense these journal turns into one short memory. Keep names, dates, "
+                "facts and feelings worth recalling later; drop small talk. Write at most "
+                "80 words of plain prose."
+            ),
+        },
+        {"role": "user", "content": turns},
+    ]
+
+
+def llm_summarizer(messages: list[dict]) -> str:
+    """Summarizer that asks the LLM for a roll-up of ``messages``."""
+    return generate_reply(_rollup_prompt(messages))
+
+
+def _sort_key(memory_id: str) -> tuple:
+    # Chronological for message memories; roll-ups (no message id) go last
+    message_id = _message_id(memory_id)
+    return (message_id is None, message_id or 0, memory_id)
+
+
+@timed("compaction.session")
+def compact_session(
+    session_id: str,
+    *,
+    through_id: Optional[int] = None,
+    threshold: float = COMPACT_SIMILARITY,
+    block: int = COMPACT_BLOCK,
+    summarize: Optional[Summarizer] = None,
+) -> dict[str, Any]:
+    """Compact one session's memories.
+
+    Near-duplicates (same role) collapse into their longest member. With
+    ``summarize``, runs of short messages older than COMPACT_ROLLUP_AGE_DAYS
+    are then replaced by one summary memory each. ``through_id`` records how
+    far the session has been compacted so later runs can skip it.
+    """
+    stats = {"session_id": session_id, "before": 0, "after": 0, "duplicates": 0, "rolled_up": 0, "rollups": 0}
+    collection = collection_for(session_id, create=False)
+    if collection is None:
+        if through_id is not None:
+            mark_session_compacted(session_id, through_id)
+        return stats
+
+    with stage("compaction.load"):
+        got = collection.get(
+            where=session_filter(session_id), include=["embeddings", "documents", "metadatas"]
+        )
+    order = sorted(range(len(got["ids"])), key=lambda r: _sort_key(got["ids"][r]))
+    ids = [got["ids"][r] for r in order]
+    documents = [got["documents"][r] or "" for r in order]
+    roles = [(got["metadatas"][r] or {}).get("role", "") for r in order]
+    embeddings = np.asarray(got["embeddings"], dtype=np.float32)[order] if ids else None
+    stats["before"] = len(ids)
+
+    removed: set[str] = set()
+    with stage("compaction.dedupe"):
+        clusters = near_duplicate_clusters(embeddings, roles, threshold, block) if ids else []
+    for cluster in clusters:
+        keep = max(cluster, key=lambda r: (len(documents[r]), r))
+        absorbed = [ids[r] for r in cluster if r != keep]
+        message_ids = [m for m in map(_message_id, absorbed) if m is not None]
+        record_compaction(session_id, ids[keep], message_ids, absorbed, "duplicate")
+        removed.update(absorbed)
+    if removed:
+        collection.delete(ids=sorted(removed))
+        stats["duplicates"] = len(removed)
+        MEMORIES_COMPACTED.labels("duplicate").inc(len(removed))
+
+    if summarize is not None:
+        indexed = set(ids) - removed
+        candidates = [
+            m for m in get_rollup_candidates(session_id, COMPACT_ROLLUP_AGE_DAYS, COMPACT_ROLLUP_MAX_CHARS)
+            if f"msg_{m['id']}" in indexed
+        ]
+        for start in range(0, len(candidates), COMPACT_ROLLUP_BATCH):
+            run = candidates[start:start + COMPACT_ROLLUP_BATCH]
+            if len(run) < 2:
+                break
+            with stage("compaction.rollup"):
+                text = summarize(run).strip()
+            if not text:
+                continue
+            memory_id = f"rollup_{run[0]['id']}_{run[-1]['id']}"
+            absorbed = [f"msg_{m['id']}" for m in run]
+            # Write the roll-up before removing what it replaces
+            collection.upsert(
+                ids=[memory_id],
+                documents=[text],
+                embeddings=embed_texts([text]),
+                metadatas=[{"session_id": session_id, "role": "summary"}],
+            )
+            with transaction():
+                # Kept in SQLite too, so a rebuild of the index can restore it
+                save_rollup_memory(memory_id, session_id, text)
+                record_compaction(session_id, memory_id, [m["id"] for m in run], absorbed, "rollup")
+            collection.delete(ids=absorbed)
+            stats["rolled_up"] += len(run)
+            stats["rollups"] += 1
+            MEMORIES_COMPACTED.labels("rollup").inc(len(run))
+
+    stats["after"] = stats["before"] - stats["duplicates"] - stats["rolled_up"] + stats["rollups"]
+    if stats["after"] != stats["before"] or stats["rollups"]:
+        recall_cache.bump(session_id)
+    if through_id is not None:
+        mark_session_compacted(session_id, through_id)
+    return stats
+
+
+def compact(
+    *,
+    session_ids: Optional[list[str]] = None,
+    only_new: bool = True,
+    threshold: float = COMPACT_SIMILARITY,
+    block: int = COMPACT_BLOCK,
+    summarize: Optional[Summarizer] = None,
+    progress: Optional[Callable[[dict], None]] = None,
+) -> dict[str, Any]:
+    """Compact ``session_ids``, or every session with memories added since its last run.
+
+    Roll-ups depend on age rather than new messages, so ``summarize`` scans
+    every session. Returns totals, including the index size before and after.
+    """
+    started = time.perf_counter()
+    if session_ids is not None:
+        targets = [{"session_id": s, "compact_through_id": None} for s in session_ids]
+    else:
+        targets = get_sessions_to_compact(only_new=only_new and summarize is None)
+
+    stats = {
+        "index_before": count_memories(),
+        "sessions": 0, "memories_before": 0, "memories_after": 0,
+        "duplicates": 0, "rolled_up": 0, "rollups": 0,
+    }
+    for target in targets:
+        result = compact_session(
+            target["session_id"],
+            through_id=target["compact_through_id"],
+            threshold=threshold,
+            block=block,
+            summarize=summarize,
+        )
+        stats["sessions"] += 1
+        stats["memories_before"] += result["before"]
+        stats["memories_after"] += result["after"]
+        for key in ("duplicates", "rolled_up", "rollups"):
+            stats[key] += result[key]
+        if progress is not None:
+            progress(stats)
+
+    stats["index_after"] = count_memories()
+    stats["seconds"] = time.perf_counter() - started
+    return stats
+
+
+class MemoryCompactor:
+    """Background thread that runs incremental duplicate compaction every ``interval`` seconds.
+
+    Roll-ups need the LLM and are left to ``python -m backend.cli compact --rollup``.
+    """
+
+    def __init__(self, *, interval: float = COMPACT_INTERVAL) -> None:
+        self.interval = interval
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.runs = 0
+        self.last_run: Optional[dict] = None
+        self.last_error: Optional[str] = None
+
+    def start(self) -> None:
+        if self.interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="journal-compactor", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Stop after the current run."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def run_once(self) -> dict:
+        stats = compact()
+        self.runs += 1
+        self.last_run = {**stats, "finished_at": time.time()}
+        return stats
+
+    def _run(self) -> None:
+        while not self._stopping.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                logger.exception("Memory compaction failed")
+
+    def stats(self) -> dict:
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "interval_seconds": self.interval,
+            "runs": self.runs,
+            "last_run": self.last_run,
+            "last_error": self.last_error,
+            "compacted_messages": get_compaction_totals(),
+        }
+
+
+memory_compactor = MemoryCompactor()
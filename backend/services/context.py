@@ -0,0 +1,208 @@
+"""Token-budgeted prompt assembly with rolling per-session summaries."""
+import asyncio
+import contextvars
+import logging
+import re
+from typing import Optional
+
+from ..config import (
+    PROMPT_TOKEN_BUDGET, PROMPT_RECENT_MESSAGES, PROMPT_MEMORY_BUDGET,
+    PROMPT_SUMMARY_BUDGET, SUMMARY_BATCH_MESSAGES,
+)
+from ..db.sqlite import get_history, get_summary, save_summary
+from ..metrics import PROMPT_TOKENS, timed
+from .ai import build_prompt, generate_reply_async
+from .executors import run_io
+from .scheduler import SchedulerBusy, llm_scheduler
+
+logger = logging.getLogger(__name__)
+
+# Words and individual punctuation marks; close enough to BPE counts for budgeting
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+# Fixed cost of the system message and per-message chat framing
+_SYSTEM_OVERHEAD = 60
+_MESSAGE_OVERHEAD = 4
+
+
+def count_tokens(text: str) -> int:
+    """Approximate the number of LLM tokens in ``text``."""
+    return len(_TOKEN_RE.findall(text))
+
+
+def prompt_tokens(messages: list[dict]) -> int:
+    """Approximate size of a chat prompt, including per-message framing."""
+    return sum(count_tokens(m["content"]) + _MESSAGE_OVERHEAD for m in messages)
+
+
+def _truncate_to_tokens(text: str, budget: int) -> str:
+    matches = list(_TOKEN_RE.finditer(text))
+    if len(matches) <= budget:
+        return text
+    return text[:matches[budget - 1].end()] + " …" if budget > 0 else ""
+
+
+def _fit_memories(memories: list[str], budget: int) -> list[str]:
+    """Keep memories in rank order until the memory budget is spent."""
+    kept, used = [], 0
+    for memory in memories:
+        cost = count_tokens(memory) + 2
+        if used + cost > budget:
+            break
+        kept.append(memory)
+        used += cost
+    return kept
+
+
+def _fit_recent(history: list[dict], budget: int, max_messages: int) -> list[dict]:
+    """Keep the newest messages verbatim within the budget.
+
+    The newest message (the current user turn) is always kept, truncated if it
+    alone exceeds the budget.
+    """
+    kept: list[dict] = []
+    used = 0
+    for message in reversed(history):
+        if len(kept) >= max_messages:
+            break
+        cost = count_tokens(message["content"]) + _MESSAGE_OVERHEAD
+        if used + cost > budget:
+            if not kept:
+                content = _truncate_to_tokens(message["content"], max(budget - _MESSAGE_OVERHEAD, 1))
+                kept.append({**message, "content": content})
+            break
+        kept.append(message)
+        used += cost
+    kept.reverse()
+    return kept
+
+
+def assemble_prompt(
+    *,
+    history: list[dict],
+    memories: list[str],
+    summary: Optional[str],
+    budget: int = PROMPT_TOKEN_BUDGET,
+) -> tuple[list[dict], list[dict]]:
+    """Build the LLM prompt within ``budget`` tokens.
+
+    Recalled memories and the summary each get their own budget; whatever is
+    left goes to the most recent messages. Returns the prompt and the messages
+    kept verbatim.
+    """
+    memories = _fit_memories(memories, PROMPT_MEMORY_BUDGET)
+    if summary:
+        summary = _truncate_to_tokens(summary, PROMPT_SUMMARY_BUDGET)
+
+    used = _SYSTEM_OVERHEAD
+    used += sum(count_tokens(m) + 2 for m in memories)
+    used += count_tokens(summary) + _MESSAGE_OVERHEAD if summary else 0
+
+    recent = _fit_recent(history, max(budget - used, 1), PROMPT_RECENT_MESSAGES)
+    prompt = build_prompt(
+        history=[{"role": m["role"], "content": m["content"]} for m in recent],
+        memories=memories,
+        summary=summary,
+    )
+    return prompt, recent
+
+
+# -------------------------------
+# Rolling summaries
+# -------------------------------
+_refreshing: set[str] = set()
+_background: set[asyncio.Task] = set()
+
+
+def _summary_prompt(summary: Optional[str], messages: list[dict]) -> list[dict]:
+    turns = "\n".join(f"{m['role'].upper()}: {m['content']}" for m in messages)
+    return [
+        {
+            "role": "system",
+            "content": (
+                "You maintain a running summary of a journaling conversation.\n"
+                "Merge the new turns into the existing summary. Keep names, dates, "
+                "facts and open questions. Write at most 200 words of plain prose."
+            ),
+        },
+        {
+            "role": "user",
+            "content": f"EXISTING SUMMARY:\n{summary or '(none)'}\n\nNEW TURNS:\n{turns}",
+        },
+    ]
+
+
+@timed("summary.refresh")
+async def refresh_summary(session_id: str, window_start_id: int) -> None:
+    """Fold messages older than the verbatim window into the session summary.
+
+    Only the turns after ``summarized_through_id`` are sent to the LLM, so the
+    summary is updated incrementally rather than recomputed from scratch.
+    """
+    if session_id in _refreshing:
+        return
+    _refreshing.add(session_id)
+    try:
+        while True:
+            current = await run_io(get_summary, session_id)
+            through_id = current["summarized_through_id"] if current else None
+            pending = await run_io(
+                get_history, session_id,
+                after_id=through_id, before_id=window_start_id,
+                limit=SUMMARY_BATCH_MESSAGES, oldest_first=True,
+            )
+            if not pending:
+                return
+            prompt = _summary_prompt(current["summary"] if current else None, pending)
+            try:
+                ticket = llm_scheduler.admit()
+            except SchedulerBusy:
+                # Busy serving turns; a later turn will trigger the refresh again
+                return
+            try:
+                async with ticket.slot(prompt_tokens(prompt), background=True):
+                    summary = await generate_reply_async(prompt)
+            finally:
+                ticket.release()
+            await run_io(save_summary, session_id, summary.strip(), pending[-1]["id"])
+            if len(pending) < SUMMARY_BATCH_MESSAGES:
+                return
+    except Exception:
+        logger.exception("Summary refresh failed for session %s", session_id)
+    finally:
+        _refreshing.discard(session_id)
+
+
+def _needs_summary(session_id: str, summary: Optional[dict], window_start_id: int) -> bool:
+    """Whether any message older than the window is not yet in the summary."""
+    through_id = summary["summarized_through_id"] if summary else None
+    return bool(get_history(session_id, after_id=through_id, before_id=window_start_id, limit=1))
+
+
+@timed("context.build")
+async def build_context(
+    session_id: str,
+    history: list[dict],
+    memories: list[str],
+) -> list[dict]:
+    """Assemble the prompt for a turn and schedule a summary refresh if needed.
+
+    ``history`` is the latest slice of the session, oldest first. The refresh
+    runs in the background after the turn's prompt has been built, so it never
+    adds to the current turn's latency.
+    """
+    summary = await run_io(get_summary, session_id)
+    prompt, recent = assemble_prompt(
+        history=history,
+        memories=memories,
+        summary=summary["summary"] if summary else None,
+    )
+    PROMPT_TOKENS.observe(prompt_tokens(prompt))
+
+    if recent and await run_io(_needs_summary, session_id, summary, recent[0]["id"]):
+        # Start from an empty context so the refresh is not timed as part of this request
+        task = contextvars.Context().run(asyncio.create_task, refresh_summary(session_id, recent[0]["id"]))
+        _background.add(task)
+        task.add_done_callback(_background.discard)
+
+    return prompt
@@ -0,0 +1,204 @@
+"""Content-addressed embedding cache with LRU eviction and optional SQLite persistence."""
+import hashlib
+import logging
+import sqlite3
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text so trivially different spellings share a cache entry."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def cache_key(text: str, model_name: str) -> str:
+    return hashlib.sha256(f"{model_name}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """In-memory LRU of vectors keyed by hash of (model, normalized text).
+
+    When ``path`` is given, every computed vector is also written through to a
+    small SQLite file, so hot strings survive restarts. The on-disk table is
+    pruned back to ``disk_max_entries`` by least-recent use. The file may be
+    shared by several processes; a disk error (e.g. "database is locked") is
+    counted and skipped, never raised to the caller.
+
+    ``get`` only looks at memory and is safe to call on the event loop. Disk
+    lookups (``load_many``) and writes belong on worker threads; they take a
+    separate lock, so memory lookups never wait on disk I/O. Recency updates
+    from disk hits are buffered and written with the next write.
+    """
+
+    # Buffered recency updates flushed even when nothing is being written
+    _TOUCH_FLUSH = 1000
+
+    def __init__(
+        self,
+        model_name: str,
+        *,
+        max_entries: int = 10_000,
+        path: Optional[Path] = None,
+        disk_max_entries: int = 200_000,
+    ) -> None:
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.disk_max_entries = disk_max_entries
+        self._entries: "OrderedDict[str, list[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk: Optional[sqlite3.Connection] = None
+        self._disk_lock = threading.Lock()
+        self._disk_writes = 0
+        self._touched: set[str] = set()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_errors = 0
+
+        if path is not None:
+            self._disk = sqlite3.connect(path, check_same_thread=False)
+            self._disk.execute("PRAGMA journal_mode=WAL")
+            self._disk.execute("PRAGMA synchronous=NORMAL")
+            self._disk.execute("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    key TEXT PRIMARY KEY,
+                    vector BLOB NOT NULL,
+                    last_used TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            self._disk.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+            self._disk.commit()
+
+    @property
+    def persistent(self) -> bool:
+        return self._disk is not None
+
+    def key(self, text: str) -> str:
+        return cache_key(text, self.model_name)
+
+    def get(self, text: str) -> Optional[list[float]]:
+        """Vector from the in-memory LRU, or None (a miss here may still be on disk)."""
+        key = self.key(text)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return vector
+            if self._disk is None:
+                self.misses += 1
+            return None
+
+    def load_many(self, texts: list[str]) -> list[Optional[list[float]]]:
+        """Look ``texts`` up on disk in one query; found vectors are promoted to memory."""
+        keys = [self.key(text) for text in texts]
+        found: dict[str, list[float]] = {}
+        with self._disk_lock:
+            if self._disk is not None:
+                try:
+                    unique = list(dict.fromkeys(keys))
+                    for start in range(0, len(unique), 500):
+                        chunk = unique[start:start + 500]
+                        placeholders = ",".join("?" * len(chunk))
+                        for key, blob in self._disk.execute(
+                            f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                        ):
+                            found[key] = array("f", blob).tolist()
+                except sqlite3.Error:
+                    self._disk_failed("read")
+                self._touched.update(found)
+                if len(self._touched) >= self._TOUCH_FLUSH:
+                    self._write_disk([])
+        with self._lock:
+            for key in found:
+                self._insert(key, found[key])
+            self.disk_hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return [found.get(key) for key in keys]
+
+    def put(self, text: str, vector: list[float]) -> None:
+        self.put_many([text], [vector])
+
+    def put_many(self, texts: list[str], vectors: list[list[float]]) -> None:
+        keys = [self.key(text) for text in texts]
+        with self._lock:
+            for key, vector in zip(keys, vectors):
+                self._insert(key, vector)
+        with self._disk_lock:
+            if self._disk is not None:
+                self._write_disk([(key, array("f", vector).tobytes()) for key, vector in zip(keys, vectors)])
+
+    def _write_disk(self, rows: list[tuple[str, bytes]]) -> None:
+        # Called with the disk lock held: new vectors plus buffered recency updates, one commit
+        touched, self._touched = self._touched, set()
+        try:
+            if rows:
+                self._disk.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, CURRENT_TIMESTAMP)",
+                    rows,
+                )
+            if touched:
+                self._disk.executemany(
+                    "UPDATE embeddings SET last_used = CURRENT_TIMESTAMP WHERE key = ?", [(k,) for k in touched]
+                )
+            before = self._disk_writes
+            self._disk_writes += len(rows)
+            if self._disk_writes // 1000 != before // 1000:
+                self._prune_disk()
+            self._disk.commit()
+        except sqlite3.Error:
+            self._disk_failed("write")
+
+    def _insert(self, key: str, vector: list[float]) -> None:
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _disk_failed(self, action: str) -> None:
+        # Called with the disk lock held; the in-memory LRU keeps working
+        self.disk_errors += 1
+        try:
+            self._disk.rollback()
+        except sqlite3.Error:
+            pass
+        logger.warning("Embedding cache disk %s failed", action, exc_info=True)
+
+    def _prune_disk(self) -> None:
+        self._disk.execute("""
+            DELETE FROM embeddings WHERE key IN (
+                SELECT key FROM embeddings ORDER BY last_used DESC LIMIT -1 OFFSET ?
+            )
+        """, (self.disk_max_entries,))
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "persistent": self._disk is not None,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "disk_errors": self.disk_errors,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+    def close(self) -> None:
+        with self._disk_lock:
+            if self._disk is not None:
+                if self._touched:
+                    self._write_disk([])
+                self._disk.close()
+                self._disk = None
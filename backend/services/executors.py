@@ -0,0 +1,53 @@
+"""Bounded executors for running blocking work from async endpoints."""
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Callable, TypeVar
+
+from ..config import IO_WORKERS
+
+T = TypeVar("T")
+
+# Blocking I/O (SQLite, Chroma)
+_POOL_SIZES = {"io": IO_WORKERS}
+
+# Created on first use and dropped by shutdown_executors, so a later app
+# lifespan in the same process (e.g. consecutive TestClients) gets fresh pools
+_pools: dict[str, ThreadPoolExecutor] = {}
+_pools_lock = threading.Lock()
+
+
+def _pool(kind: str) -> ThreadPoolExecutor:
+    pool = _pools.get(kind)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(kind)
+            if pool is None:
+                pool = _pools[kind] = ThreadPoolExecutor(
+                    max_workers=_POOL_SIZES[kind], thread_name_prefix=f"journal-{kind}"
+                )
+    return pool
+
+
+async def _run_in(executor: Executor, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    loop = asyncio.get_running_loop()
+    # Carry context variables into the worker thread, like asyncio.to_thread does
+    ctx = contextvars.copy_context()
+    call = functools.partial(ctx.run, func, *args, **kwargs)
+    return await loop.run_in_executor(executor, call)
+
+
+async def run_io(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a blocking I/O callable on the I/O pool."""
+    return await _run_in(_pool("io"), func, *args, **kwargs)
+
+
+def shutdown_executors() -> None:
+    """Stop the pools, waiting for in-flight work to finish; the next call starts new ones."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown(wait=True)
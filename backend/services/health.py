@@ -0,0 +1,77 @@
+"""Startup phase tracking for liveness and readiness probes."""
+import asyncio
+import logging
+import threading
+import time
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTracker:
+    """Records how long each startup phase took and whether it succeeded.
+
+    The process is ready once every *required* phase has finished. Optional
+    phases (e.g. the LLM ping) are reported but do not gate readiness.
+    """
+
+    def __init__(self) -> None:
+        self.started_at = time.time()
+        self._phases: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def expect(self, name: str, *, required: bool = True) -> None:
+        with self._lock:
+            self._phases[name] = {"status": "pending", "required": required, "seconds": None, "error": None}
+
+    def _finish(self, name: str, status: str, seconds: float, error: Optional[str] = None) -> None:
+        with self._lock:
+            phase = self._phases.setdefault(name, {"required": True})
+            phase.update(status=status, seconds=round(seconds, 4), error=error)
+
+    def run(self, name: str, func: Callable[[], object], *, required: bool = True) -> None:
+        """Run a synchronous startup phase and record it."""
+        self.expect(name, required=required)
+        t0 = time.perf_counter()
+        try:
+            func()
+        except Exception as e:
+            self._finish(name, "failed", time.perf_counter() - t0, f"{type(e).__name__}: {e}")
+            raise
+        self._finish(name, "ok", time.perf_counter() - t0)
+
+    async def run_async(self, name: str, func: Callable[[], Awaitable[object]]) -> bool:
+        """Run an async startup phase; failures are recorded, not raised."""
+        with self._lock:
+            if name not in self._phases:
+                self._phases[name] = {"status": "pending", "required": True, "seconds": None, "error": None}
+            self._phases[name]["status"] = "running"
+        t0 = time.perf_counter()
+        try:
+            await func()
+        except asyncio.CancelledError:
+            self._finish(name, "cancelled", time.perf_counter() - t0)
+            raise
+        except Exception as e:
+            logger.warning("Startup phase %s failed: %s", name, e)
+            self._finish(name, "failed", time.perf_counter() - t0, f"{type(e).__name__}: {e}")
+            return False
+        self._finish(name, "ok", time.perf_counter() - t0)
+        return True
+
+    @property
+    def ready(self) -> bool:
+        with self._lock:
+            return all(p["status"] == "ok" for p in self._phases.values() if p["required"])
+
+    def report(self) -> dict:
+        with self._lock:
+            phases = {name: dict(p) for name, p in self._phases.items()}
+        return {
+            "ready": self.ready,
+            "uptime_seconds": round(time.time() - self.started_at, 3),
+            "phases": phases,
+        }
+
+
+startup = StartupTracker()
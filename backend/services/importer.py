@@ -0,0 +1,318 @@
+"""Bulk import of journal archives (NDJSON or Markdown)."""
+import json
+import logging
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Iterator, Optional, get_args
+
+from ..db.sqlite import complete_outbox, get_import_checkpoint, import_batch
+from ..schemas import Role
+from .ai import embed_texts
+from .memory import recall_cache, write_memories
+
+logger = logging.getLogger(__name__)
+
+# Namespace for session ids derived from archive names and titles
+_SESSION_NAMESPACE = uuid.UUID("8f0d7c7e-4f43-4c1e-9a57-6f1b0e3c2a10")
+
+_HEADING_RE = re.compile(r"^(#{1,2})\s+(.*?)\s*$")
+
+# How long the outbox rows of an imported batch stay claimed by the importer.
+# Only if it dies before indexing them does the background indexer take over.
+_INDEX_LEASE_SECONDS = 600.0
+
+# Roles the API can return (MessageOut.role)
+ROLES = get_args(Role)
+
+
+def _timestamp(value: Any) -> str:
+    """Normalize a timestamp to SQLite's CURRENT_TIMESTAMP format (UTC)."""
+    if not value:
+        dt = datetime.now(timezone.utc)
+    elif isinstance(value, (int, float)):
+        dt = datetime.fromtimestamp(value, timezone.utc)
+    else:
+        dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc)
+    return dt.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _session_id_for(name: str) -> str:
+    return str(uuid.uuid5(_SESSION_NAMESPACE, name))
+
+
+def iter_ndjson(path: Path) -> Iterator[dict]:
+    """Yield records from an NDJSON archive, one JSON object per line.
+
+    Each object needs ``content`` and may have ``session_id``, ``session_name``,
+    ``role`` (``user`` or ``assistant``, default ``user``) and ``created_at``
+    (ISO 8601 or epoch seconds). Records that break these rules stop the
+    import with their line number, like invalid JSON does.
+    """
+    default_session = path.stem
+    with path.open("r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                obj = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}:{line_no}: invalid JSON: {e}") from None
+            if not isinstance(obj, dict):
+                raise ValueError(f"{path}:{line_no}: expected a JSON object, got {type(obj).__name__}")
+            content = obj.get("content")
+            if content is not None and not isinstance(content, str):
+                raise ValueError(f"{path}:{line_no}: content must be a string, got {type(content).__name__}")
+            content = (content or "").strip()
+            if not content:
+                continue
+            role = obj.get("role", "user")
+            if role not in ROLES:
+                raise ValueError(f"{path}:{line_no}: role must be one of {', '.join(ROLES)}, got {role!r}")
+            try:
+                created_at = _timestamp(obj.get("created_at"))
+            except (ValueError, TypeError, OverflowError, OSError) as e:
+                raise ValueError(f"{path}:{line_no}: invalid created_at: {e}") from None
+            session_name = str(obj.get("session_name") or default_session)
+            yield {
+                "session_id": str(obj.get("session_id") or _session_id_for(session_name)),
+                "session_name": session_name,
+                "role": role,
+                "content": content,
+                "created_at": created_at,
+            }
+
+
+def iter_markdown(path: Path) -> Iterator[dict]:
+    """Yield records from a Markdown journal.
+
+    ``# Title`` starts a session and ``## <date>`` starts an entry; the text
+    under each entry becomes one user message. Text outside any ``##`` entry
+    becomes a message of its own. Files without a ``#`` heading form a single
+    session named after the file.
+    """
+    session_name = path.stem
+    entry_date: Optional[str] = None
+    lines: list[str] = []
+
+    def flush() -> Optional[dict]:
+        content = "\n".join(lines).strip()
+        lines.clear()
+        if not content:
+            return None
+        try:
+            created_at = _timestamp(entry_date)
+        except ValueError:
+            # Entry heading is not a date; keep it as part of the text
+            content = f"{entry_date}\n\n{content}"
+            created_at = _timestamp(None)
+        return {
+            "session_id": _session_id_for(f"{path.name}/{session_name}"),
+            "session_name": session_name,
+            "role": "user",
+            "content": content,
+            "created_at": created_at,
+        }
+
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            match = _HEADING_RE.match(line)
+            if match:
+                record = flush()
+                if record:
+                    yield record
+                if len(match.group(1)) == 1:
+                    session_name, entry_date = match.group(2), None
+                else:
+                    entry_date = match.group(2)
+                continue
+            lines.append(line.rstrip("\n"))
+    record = flush()
+    if record:
+        yield record
+
+
+PARSERS: dict[str, Callable[[Path], Iterator[dict]]] = {
+    "ndjson": iter_ndjson,
+    "markdown": iter_markdown,
+}
+
+
+def detect_format(path: Path) -> str:
+    return "markdown" if path.suffix.lower() in (".md", ".markdown") else "ndjson"
+
+
+def _chunks(records: Iterator[dict], size: int) -> Iterator[list[dict]]:
+    chunk: list[dict] = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _index_chunk(messages: list[dict], ids: list[int], upsert_size: int) -> None:
+    """Embed a chunk through the shared batching service and upsert it into Chroma."""
+    vectors = embed_texts([m["content"] for m in messages])
+    items = [{**m, "message_id": i} for m, i in zip(messages, ids)]
+    for start in range(0, len(ids), upsert_size):
+        end = start + upsert_size
+        write_memories(items[start:end], vectors[start:end])
+    # These rows were queued in the outbox alongside the insert; they are indexed now
+    complete_outbox(ids)
+
+
+def import_archive(
+    path: Path,
+    *,
+    fmt: Optional[str] = None,
+    batch_size: int = 2000,
+    upsert_size: int = 1000,
+    resume: bool = True,
+    source: Optional[str] = None,
+    progress: Optional[Callable[[dict], None]] = None,
+) -> dict:
+    """Stream an archive into SQLite and Chroma.
+
+    Records are read lazily and handled ``batch_size`` at a time, so memory
+    stays bounded. Each batch is inserted with ``executemany`` in one
+    transaction that also advances the checkpoint and queues the messages in
+    the memory outbox. Indexing of batch N overlaps the insert of batch N+1.
+    If the process dies, re-running resumes after the last committed batch,
+    and anything committed but not yet indexed is drained from the outbox.
+    The checkpoint is keyed by ``source``, which defaults to the file's path.
+    """
+    path = Path(path)
+    fmt = fmt or detect_format(path)
+    source = source or f"{fmt}:{path.resolve()}"
+    skip = get_import_checkpoint(source) if resume else 0
+
+    records = PARSERS[fmt](path)
+    for _ in range(skip):
+        if next(records, None) is None:
+            break
+
+    stats = {
+        "source": source,
+        "skipped": skip,
+        "imported": 0,
+        "sessions": 0,
+        "db_seconds": 0.0,
+        "index_seconds": 0.0,
+        "elapsed_seconds": 0.0,
+        "records_per_second": 0.0,
+    }
+    started = time.perf_counter()
+    done = skip
+    seen_sessions: set[str] = set()
+
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="journal-import-index") as indexer:
+        pending: Optional[Future] = None
+
+        for chunk in _chunks(records, batch_size):
+            sessions = []
+            for record in chunk:
+                if record["session_id"] not in seen_sessions:
+                    seen_sessions.add(record["session_id"])
+                    sessions.append({
+                        "session_id": record["session_id"],
+                        "session_name": record["session_name"],
+                        "created_at": record["created_at"],
+                    })
+
+            t0 = time.perf_counter()
+            ids = import_batch(
+                sessions, chunk, source=source, records_done=done + len(chunk),
+                lease_seconds=_INDEX_LEASE_SECONDS,
+            )
+            stats["db_seconds"] += time.perf_counter() - t0
+            # New messages are immediately visible to keyword recall
+            recall_cache.bump(*{m["session_id"] for m in chunk})
+
+            # Keep at most one chunk indexing in the background
+            if pending is not None:
+                stats["index_seconds"] += pending.result()
+            pending = indexer.submit(_timed, _index_chunk, chunk, ids, upsert_size)
+
+            done += len(chunk)
+            stats["imported"] += len(chunk)
+            stats["sessions"] = len(seen_sessions)
+            stats["elapsed_seconds"] = time.perf_counter() - started
+            stats["records_per_second"] = stats["imported"] / stats["elapsed_seconds"]
+            if progress:
+                progress(dict(stats))
+
+        if pending is not None:
+            stats["index_seconds"] += pending.result()
+
+    stats["elapsed_seconds"] = time.perf_counter() - started
+    if stats["elapsed_seconds"] > 0:
+        stats["records_per_second"] = stats["imported"] / stats["elapsed_seconds"]
+    logger.info(
+        "Imported %d records (%d sessions) from %s in %.1fs (%.0f rec/s)",
+        stats["imported"], stats["sessions"], path, stats["elapsed_seconds"], stats["records_per_second"],
+    )
+    return stats
+
+
+def _timed(func: Callable, *args: Any) -> float:
+    t0 = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - t0
+
+
+# -------------------------------
+# Background jobs for the HTTP API
+# -------------------------------
+_jobs: dict[str, dict] = {}
+_jobs_lock = threading.Lock()
+
+
+def start_import_job(
+    path: Path,
+    fmt: Optional[str] = None,
+    *,
+    source: Optional[str] = None,
+    delete_after: bool = False,
+) -> str:
+    """Run ``import_archive`` on a background thread and return a job id."""
+    job_id = str(uuid.uuid4())
+    with _jobs_lock:
+        _jobs[job_id] = {"job_id": job_id, "status": "running", "stats": None, "error": None}
+
+    def update(stats: dict) -> None:
+        with _jobs_lock:
+            _jobs[job_id]["stats"] = stats
+
+    def run() -> None:
+        try:
+            stats = import_archive(path, fmt=fmt, source=source, progress=update)
+            status, error = "done", None
+        except Exception as e:
+            logger.exception("Import job %s failed", job_id)
+            stats, status, error = None, "failed", str(e)
+        finally:
+            if delete_after:
+                Path(path).unlink(missing_ok=True)
+        with _jobs_lock:
+            _jobs[job_id].update(status=status, error=error)
+            if stats is not None:
+                _jobs[job_id]["stats"] = stats
+
+    threading.Thread(target=run, name=f"journal-import-{job_id[:8]}", daemon=True).start()
+    return job_id
+
+
+def get_import_job(job_id: str) -> Optional[dict]:
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        return dict(job) if job else None
@@ -0,0 +1,126 @@
+"""Background worker that drains the memory outbox into Chroma."""
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from ..db.sqlite import claim_outbox_batch, complete_outbox, fail_outbox, get_outbox_lag
+from ..metrics import stage
+from .memory import write_memories
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryIndexer:
+    """Write-behind indexer for chat memories.
+
+    ``add_message`` records a pending row in ``memory_outbox`` in the same
+    transaction as the message. This worker drains those rows in batches into
+    Chroma, deleting them once upserted. A failed batch is retried row by row,
+    and only the rows that still fail back off exponentially. Because the
+    outbox is durable, rows left over from a crash are picked up on the next
+    start. Every server worker runs
+    an indexer; each batch is claimed for ``lease_seconds`` first, so a row
+    is indexed by one of them only.
+    """
+
+    def __init__(self, *, batch_size: int = 64, poll_interval: float = 1.0, lease_seconds: float = 120.0) -> None:
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.indexed = 0
+        self.failed_batches = 0
+        self.last_error: Optional[str] = None
+        self.last_batch_at: Optional[float] = None
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="journal-indexer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Stop after the current batch. Unindexed rows stay in the outbox."""
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def notify(self) -> None:
+        """Wake the worker because new rows were queued."""
+        self._wake.set()
+
+    def drain_once(self) -> int:
+        """Index one batch synchronously. Returns the number of rows handled."""
+        rows = claim_outbox_batch(self.batch_size, self.lease_seconds)
+        if not rows:
+            return 0
+
+        ids = [row["message_id"] for row in rows]
+        try:
+            with stage("indexer.batch"):
+                write_memories(rows)
+        except Exception as e:
+            self.failed_batches += 1
+            self.last_error = f"{type(e).__name__}: {e}"
+            logger.warning("Memory indexing failed for %d rows: %s", len(rows), self.last_error)
+            if len(rows) == 1:
+                fail_outbox(ids, self.last_error)
+                return 0
+            return self._drain_rows(rows)
+
+        complete_outbox(ids)
+        self.indexed += len(ids)
+        self.last_batch_at = time.time()
+        return len(ids)
+
+    def _drain_rows(self, rows: List[Dict[str, Any]]) -> int:
+        """Retry a failed batch one row at a time, so only the failing rows back off."""
+        done = []
+        for row in rows:
+            try:
+                with stage("indexer.row"):
+                    write_memories([row])
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                logger.warning("Memory indexing failed for message %s: %s", row["message_id"], error)
+                fail_outbox([row["message_id"]], error)
+            else:
+                done.append(row["message_id"])
+
+        if done:
+            complete_outbox(done)
+            self.indexed += len(done)
+            self.last_batch_at = time.time()
+        return len(done)
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                handled = self.drain_once()
+            except Exception:
+                logger.exception("Memory indexer loop error")
+                handled = 0
+            if handled < self.batch_size:
+                # Backlog drained (or backing off); sleep until notified or the next poll
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def stats(self) -> dict:
+        return {
+            **get_outbox_lag(),
+            "running": self._thread is not None and self._thread.is_alive(),
+            "indexed": self.indexed,
+            "failed_batches": self.failed_batches,
+            "last_error": self.last_error,
+            "last_batch_at": self.last_batch_at,
+        }
+
+
+memory_indexer = MemoryIndexer()
@@ -1,25 +1,221 @@
 """Memory operations for reading and writing to ChromaDB."""
-from ..db.chroma import collection
-from .ai import embed_text
+import asyncio
+import logging
+from typing import Any, Callable, Optional
+
+from ..config import (
+    RECALL_CACHE_SIZE, RECALL_CACHE_TTL, RECALL_MODE, RECALL_PENDING_LIMIT, RECALL_RRF_K, SIDECAR_SOCKET,
+)
+from ..db.chroma import collection_for, collection_name, get_collection, list_collections, session_filter
+from ..db.sqlite import (
+    get_compacted_targets, get_index_meta, get_pending_memories, search_messages, set_index_meta,
+)
+from ..metrics import RECALL_HITS, RECALL_PENDING, stage, timed
+from .ai import ENCODER_NAME, VECTOR_SPACE, embed_text, embed_text_async, embed_texts
+from .executors import run_io
+from .recall_cache import RecallCache
+from .sidecar import sidecar
+
+logger = logging.getLogger(__name__)
+
+# Shared by the sync and async recall paths; write paths bump session versions.
+# With a sidecar, other workers and the sidecar's compactor write too, and their
+# writes never bump this process's versions, so results are not cached at all.
+recall_cache = RecallCache(
+    max_entries=0 if SIDECAR_SOCKET else RECALL_CACHE_SIZE, ttl_seconds=RECALL_CACHE_TTL
+)
+
+
+def _squared_l2(a: list[float], b: list[float]) -> float:
+    # Same metric as the collection's HNSW index ("l2" reports squared distance)
+    return sum((x - y) * (x - y) for x, y in zip(a, b))
+
+
+def _message_id(memory_id: str) -> Optional[int]:
+    prefix, _, suffix = memory_id.partition("_")
+    return int(suffix) if prefix == "msg" and suffix.isdigit() else None
+
+
+RECALL_MODES = ("hybrid", "vector", "lexical")
+
+
+def _check_mode(mode: str) -> None:
+    if mode not in RECALL_MODES:
+        raise ValueError(f"Unknown recall mode {mode!r}; expected one of {RECALL_MODES}")
+
+
+def _query_index(query_embedding: list[float], session_id: str, n: int) -> list[tuple[str, str, float]]:
+    """Nearest indexed memories of a session as (id, document, distance)."""
+    if sidecar.enabled:
+        return sidecar.query(query_embedding, session_id, n)
+    # Recall never creates collections; a session with nothing indexed has none yet
+    collection = collection_for(session_id, create=False)
+    if collection is None:
+        return []
+    with stage("chroma.query"):
+        results = collection.query(
+            query_embeddings=[query_embedding],
+            n_results=n,
+            where=session_filter(session_id)
+        )
+    if not results["documents"]:
+        return []
+    return list(zip(results["ids"][0], results["documents"][0], results["distances"][0]))
+
+
+def _vector_candidates(query_embedding: list[float], session_id: str, n: int) -> list[dict[str, Any]]:
+    """Nearest memories by embedding, including messages still waiting in the outbox.
+
+    The outbox is read before the index: a row the indexer drains in between
+    is then found in Chroma, while the other order could miss it in both.
+    Only the newest RECALL_PENDING_LIMIT pending rows are embedded, so a
+    large backlog does not turn every recall into a bulk encode.
+    """
+    pending = get_pending_memories(session_id, RECALL_PENDING_LIMIT)
+    candidates: dict[str, tuple[float, str]] = {
+        id_: (dist, doc) for id_, doc, dist in _query_index(query_embedding, session_id, n)
+    }
+
+    # Rows drained meanwhile are already candidates from the index
+    pending = [p for p in pending if f"msg_{p['message_id']}" not in candidates]
+    if pending:
+        RECALL_PENDING.inc(len(pending))
+        vectors = embed_texts([p["content"] for p in pending])
+        for p, vector in zip(pending, vectors):
+            candidates[f"msg_{p['message_id']}"] = (_squared_l2(query_embedding, vector), p["content"])
+
+    ranked = sorted(candidates.items(), key=lambda c: c[1][0])[:n]
+    # Very short texts embed poorly and crowd out real matches
+    return [
+        {"id": id_, "content": doc, "distance": dist}
+        for id_, (dist, doc) in ranked
+        if len(doc) > 20
+    ]
+
+
+def _lexical_candidates(query: str, session_id: str, n: int) -> list[dict[str, Any]]:
+    """Best BM25 matches from the SQLite full-text index.
+
+    Messages whose memory was compacted are reported under the memory that
+    replaced them, so fusion merges them with its vector hit.
+    """
+    rows = search_messages(session_id, query, n)
+    targets = get_compacted_targets([row["message_id"] for row in rows])
+    return [
+        {"id": targets.get(row["message_id"], f"msg_{row['message_id']}"), "content": row["content"]}
+        for row in rows
+    ]
+
+
+def _fuse(ranked_lists: list[list[dict[str, Any]]], k: int) -> list[dict[str, Any]]:
+    """Merge ranked lists with reciprocal-rank fusion and keep the top ``k``.
+
+    A memory scores ``sum(1 / (RECALL_RRF_K + rank))`` over the lists it
+    appears in, so agreement between retrievers beats a high rank in one.
+    """
+    fused: dict[str, dict[str, Any]] = {}
+    for ranked in ranked_lists:
+        for rank, item in enumerate(ranked, start=1):
+            entry = fused.setdefault(item["id"], {
+                "message_id": _message_id(item["id"]),
+                "content": item["content"],
+                "distance": None,
+                "score": 0.0,
+            })
+            entry["score"] += 1 / (RECALL_RRF_K + rank)
+            if "distance" in item:
+                entry["distance"] = item["distance"]
+
+    memories = sorted(fused.values(), key=lambda m: m["score"], reverse=True)[:k]
+    RECALL_HITS.observe(len(memories))
+    return memories
+
+
+@timed("recall")
+def recall_memories_scored(
+    query: str,
+    session_id: str,
+    k: int = 5,
+    query_embedding: Optional[list[float]] = None,
+    mode: str = RECALL_MODE,
+) -> list[dict[str, Any]]:
+    """Recall relevant memories with their ids and scores, best first.
+
+    ``mode`` picks the retrievers (see RECALL_MODES): vector search over
+    Chroma, BM25 over the SQLite full-text index, or both fused. Pass
+    ``query_embedding`` when the caller already embedded ``query`` so the
+    text is not encoded twice; lexical mode never embeds. Messages still
+    waiting in the indexing outbox are included by both retrievers, so the
+    current turn is visible before the background indexer has caught up.
+    Results are cached until the session is next written (see recall_cache).
+    """
+    _check_mode(mode)
+    if mode != "lexical" and query_embedding is None:
+        query_embedding = embed_text(query)
+
+    key = recall_cache.key(session_id, mode, k, query, query_embedding if mode != "lexical" else None)
+    cached = recall_cache.get(key)
+    if cached is not None:
+        return cached
+    version = recall_cache.version(session_id)
+
+    ranked_lists = []
+    if mode != "lexical":
+        ranked_lists.append(_vector_candidates(query_embedding, session_id, k))
+    if mode != "vector":
+        ranked_lists.append(_lexical_candidates(query, session_id, k))
+    memories = _fuse(ranked_lists, k)
+    recall_cache.put(key, version, memories)
+    return memories
 
 
 def recall_memories(
     query: str,
     session_id: str,
-    k: int = 5
+    k: int = 5,
+    query_embedding: Optional[list[float]] = None,
+    mode: str = RECALL_MODE,
 ) -> list[str]:
     """Recall relevant memories from ChromaDB based on query."""
-    results = collection.query(
-        query_texts=[query],
-        n_results=k,
-        where={"session_id": session_id}
-    )
+    return [m["content"] for m in recall_memories_scored(query, session_id, k, query_embedding, mode)]
 
-    if not results["documents"]:
-        return []
 
-    docs = results["documents"][0]
-    return [d for d in docs if len(d) > 20]
+def write_memories(items: list[dict[str, Any]], vectors: Optional[list[list[float]]] = None) -> None:
+    """Embed and upsert several memories in one batch.
+
+    Each item needs ``message_id``, ``session_id``, ``role`` and ``content``.
+    ``vectors`` may be supplied when the contents were already embedded.
+    Items are grouped by the collection their session lives in, one upsert
+    per collection.
+    """
+    if not items:
+        return
+
+    if sidecar.enabled:
+        # The sidecar owns Chroma (and embeds there when no vectors are given)
+        sidecar.upsert(items, vectors)
+        recall_cache.bump(*{item["session_id"] for item in items})
+        return
+
+    if vectors is None:
+        vectors = embed_texts([item["content"] for item in items])
+
+    groups: dict[str, list[int]] = {}
+    for i, item in enumerate(items):
+        groups.setdefault(collection_name(item["session_id"]), []).append(i)
+
+    with stage("chroma.upsert"):
+        for name, rows in groups.items():
+            get_collection(name).upsert(
+                ids=[f"msg_{items[i]['message_id']}" for i in rows],
+                documents=[items[i]["content"] for i in rows],
+                embeddings=[vectors[i] for i in rows],
+                metadatas=[{
+                    "session_id": items[i]["session_id"],
+                    "role": items[i]["role"]
+                } for i in rows]
+            )
+    recall_cache.bump(*{item["session_id"] for item in items})
 
 
 def write_memory(
@@ -28,16 +224,102 @@ def write_memory(
     session_id: str,
     role: str,
     content: str,
+    vector: Optional[list[float]] = None,
 ) -> None:
-    """Write a memory to ChromaDB with embeddings."""
-    vector = embed_text(content)
-
-    collection.upsert(
-        ids=[f"msg_{message_id}"],
-        documents=[content],
-        embeddings=[vector],
-        metadatas=[{
-            "session_id": session_id,
-            "role": role
-        }]
+    """Write a memory to ChromaDB with embeddings.
+
+    ``vector`` may be supplied when the content was already embedded.
+    """
+    if vector is None:
+        vector = embed_text(content)
+    write_memories(
+        [{"message_id": message_id, "session_id": session_id, "role": role, "content": content}],
+        [vector],
     )
+
+
+@timed("recall")
+async def recall_memories_scored_async(
+    query: str,
+    session_id: str,
+    k: int = 5,
+    query_embedding: Optional[list[float]] = None,
+    mode: str = RECALL_MODE,
+) -> list[dict[str, Any]]:
+    """Async variant of recall_memories_scored; the two retrievers run concurrently."""
+    _check_mode(mode)
+    if mode != "lexical" and query_embedding is None:
+        query_embedding = await embed_text_async(query)
+
+    key = recall_cache.key(session_id, mode, k, query, query_embedding if mode != "lexical" else None)
+    cached = recall_cache.get(key)
+    if cached is not None:
+        return cached
+    version = recall_cache.version(session_id)
+
+    retrievals = []
+    if mode != "lexical":
+        retrievals.append(run_io(_vector_candidates, query_embedding, session_id, k))
+    if mode != "vector":
+        retrievals.append(run_io(_lexical_candidates, query, session_id, k))
+    memories = _fuse(list(await asyncio.gather(*retrievals)), k)
+    recall_cache.put(key, version, memories)
+    return memories
+
+
+# -------------------------------
+# Encoder changes
+# -------------------------------
+def check_index_encoder() -> bool:
+    """Compare the configured encoder with the one that built the index.
+
+    An index without a record is assumed to match and is stamped with the
+    current encoder. Returns False (and logs) when the vector spaces differ,
+    in which case recall quality is meaningless until ``reembed_memories`` runs.
+    """
+    space, encoder = get_index_meta("vector_space"), get_index_meta("encoder")
+    if space is None:
+        set_index_meta({"vector_space": VECTOR_SPACE, "encoder": ENCODER_NAME})
+        return True
+    if space != VECTOR_SPACE:
+        logger.error(
+            "Memories were embedded with %s but the configured encoder is %s; "
+            "run `python -m backend.cli reembed`", encoder, ENCODER_NAME,
+        )
+        return False
+    if encoder != ENCODER_NAME:
+        logger.info("Index built with %s, querying with %s (same vector space)", encoder, ENCODER_NAME)
+    return True
+
+
+def reembed_memories(
+    *, batch_size: int = 256, progress: Optional[Callable[[dict], None]] = None
+) -> dict[str, Any]:
+    """Re-encode every stored memory with the configured encoder, in place.
+
+    Documents are read back from Chroma page by page and their vectors
+    replaced; ids, documents and metadata are untouched, so it is safe to
+    re-run after an interruption. Run it with the server stopped after
+    switching to an encoder in a different vector space. Chroma fixes a
+    collection's dimension, so both encoders must produce vectors of one size.
+    """
+    if sidecar.enabled:
+        raise RuntimeError("reembed opens Chroma directly; run it with JOURNAL_SIDECAR_SOCKET unset")
+    stats = {"encoder": ENCODER_NAME, "collections": 0, "memories": 0}
+    for name in list_collections():
+        collection = get_collection(name, create=False)
+        offset = 0
+        while True:
+            page = collection.get(include=["documents"], limit=batch_size, offset=offset)
+            if not page["ids"]:
+                break
+            collection.update(ids=page["ids"], embeddings=embed_texts([d or "" for d in page["documents"]]))
+            offset += len(page["ids"])
+            stats["memories"] += len(page["ids"])
+            if progress is not None:
+                progress(stats)
+        stats["collections"] += 1
+
+    set_index_meta({"vector_space": VECTOR_SPACE, "encoder": ENCODER_NAME})
+    recall_cache.clear()
+    return stats
@@ -0,0 +1,124 @@
+"""Recall result cache invalidated by per-session write versions."""
+import hashlib
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Any, Optional
+
+from ..metrics import RECALL_CACHE_REQUESTS
+from .embedding_cache import normalize_text
+
+RecallKey = tuple[str, str, int, str]
+
+
+class RecallCache:
+    """LRU of recall results keyed by (session, mode, k, query digest).
+
+    Every session has a write version that is bumped whenever something that
+    recall can see changes: memories upserted into Chroma, messages added (the
+    keyword index and the pending outbox see them immediately) or removed.
+    Entries remember the version they were computed under and are ignored
+    once it moves on, so a result is never served after a write to its
+    session made through this process. Callers read the version *before*
+    running the query, so a write that lands mid-query invalidates the entry
+    it produces. Versions are not shared between processes: writes by CLI
+    tools are only bounded by ``ttl_seconds``, and with several workers (the
+    sidecar setup) the cache is switched off (see services.memory).
+    """
+
+    def __init__(self, *, max_entries: int = 2048, ttl_seconds: float = 300.0) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self._entries: "OrderedDict[RecallKey, tuple[int, float, list[dict[str, Any]]]]" = OrderedDict()
+        self._versions: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+        self.expired = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def key(
+        session_id: str, mode: str, k: int, query: str, embedding: Optional[list[float]]
+    ) -> RecallKey:
+        """Key on the embedding's bytes for vector search and the normalized text for keyword search."""
+        digest = hashlib.blake2b(digest_size=16)
+        if embedding is not None:
+            digest.update(array("f", embedding).tobytes())
+        if mode != "vector":
+            digest.update(b"\0" + normalize_text(query).lower().encode("utf-8"))
+        return session_id, mode, k, digest.hexdigest()
+
+    def version(self, session_id: str) -> int:
+        with self._lock:
+            return self._versions.get(session_id, 0)
+
+    def bump(self, *session_ids: str) -> None:
+        """Invalidate every cached result for these sessions."""
+        with self._lock:
+            for session_id in session_ids:
+                self._versions[session_id] = self._versions.get(session_id, 0) + 1
+
+    def get(self, key: RecallKey) -> Optional[list[dict[str, Any]]]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                result = "miss"
+            elif entry[0] != self._versions.get(key[0], 0):
+                result = "invalidated"
+            elif entry[1] < time.monotonic():
+                result = "expired"
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                RECALL_CACHE_REQUESTS.labels("hit").inc()
+                return [dict(m) for m in entry[2]]
+
+            if entry is not None:
+                del self._entries[key]
+            if result == "invalidated":
+                self.invalidated += 1
+            elif result == "expired":
+                self.expired += 1
+            self.misses += 1
+        RECALL_CACHE_REQUESTS.labels(result).inc()
+        return None
+
+    def put(self, key: RecallKey, version: int, memories: list[dict[str, Any]]) -> None:
+        """Store results computed under ``version`` (read before the query ran)."""
+        if not self.enabled:
+            return
+        with self._lock:
+            if version != self._versions.get(key[0], 0):
+                # The session was written while the query ran
+                return
+            self._entries[key] = (version, time.monotonic() + self.ttl, [dict(m) for m in memories])
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidated": self.invalidated,
+                "expired": self.expired,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,238 @@
+"""Reconcile the Chroma memory index with SQLite, or rebuild it side by side.
+
+SQLite is the source of truth. Every message should have a memory ``msg_<id>``
+in its session's collection unless compaction folded it into another memory
+(``compacted_memories``) or it is still waiting in the outbox, which the
+indexer drains. Roll-up memories are rebuilt from ``rollup_memories``.
+"""
+import logging
+import shutil
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from ..config import CHROMA_DIR
+from ..db.archive import read_archived_messages
+from ..db.chroma import collection_name, get_collection, list_collections, use_directory
+from ..db.sqlite import (
+    get_archived_indexable, get_compaction_targets, get_index_state, get_indexable_messages, get_max_message_id,
+    get_rollup_memories, save_rollup_memory, set_index_meta,
+)
+from .ai import ENCODER_NAME, VECTOR_SPACE, embed_texts
+from .memory import _message_id, recall_cache, write_memories
+from .sidecar import sidecar
+
+logger = logging.getLogger(__name__)
+
+# Where `rebuild` builds the new index before it is swapped in
+GREEN_DIR = CHROMA_DIR.with_name(CHROMA_DIR.name + ".green")
+_ROLLUP_PREFIX = "rollup_"
+
+
+def _scan_index(
+    stats: dict, present: bytearray, rollups: dict[str, dict], *, page_size: int, dry_run: bool,
+    progress: Optional[Callable[[dict], None]],
+) -> set[str]:
+    """Page through every collection, marking good memories and deleting the rest.
+
+    A memory is kept when its message exists (in either tier), is not
+    compacted, lives in this collection under the current layout and has the
+    message's text. Stale
+    ones are left for the SQLite pass to overwrite. Returns the roll-up ids
+    found in place.
+    """
+    rollup_targets = get_compaction_targets(_ROLLUP_PREFIX)
+    rollups_present: set[str] = set()
+
+    for name in list_collections():
+        collection = get_collection(name, create=False)
+        orphans: list[str] = []
+        offset = 0
+        while True:
+            page = collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+            if not page["ids"]:
+                break
+            offset += len(page["ids"])
+            stats["index_scanned"] += len(page["ids"])
+
+            message_ids = {i: _message_id(i) for i in page["ids"]}
+            state = get_index_state([m for m in message_ids.values() if m is not None])
+            for memory_id, document, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+                metadata = metadata or {}
+                message_id = message_ids[memory_id]
+                if message_id is None:
+                    rollup = rollups.get(memory_id)
+                    if rollup is None and memory_id in rollup_targets and metadata.get("session_id"):
+                        # Written before roll-up text was kept in SQLite; keep a copy now
+                        rollup = {"memory_id": memory_id, "session_id": metadata["session_id"], "content": document}
+                        rollups[memory_id] = rollup
+                        if not dry_run:
+                            save_rollup_memory(memory_id, rollup["session_id"], document or "")
+                    if rollup is not None and collection_name(rollup["session_id"]) == name:
+                        rollups_present.add(memory_id)
+                    else:
+                        orphans.append(memory_id)
+                    continue
+
+                row = state.get(message_id)
+                if row is None or row["compacted"]:
+                    orphans.append(memory_id)
+                elif collection_name(row["session_id"]) != name:
+                    # Left behind by a layout change; re-added to the right collection
+                    stats["misplaced"] += 1
+                    orphans.append(memory_id)
+                elif metadata.get("session_id") != row["session_id"] or (
+                    # Archived text is not decompressed just to compare it
+                    not row["archived"] and document != row["content"]
+                ):
+                    stats["stale"] += 1
+                else:
+                    present[message_id] = 1
+            if progress is not None:
+                progress(stats)
+
+        if orphans:
+            stats["orphans"] += len(orphans)
+            if not dry_run:
+                for start in range(0, len(orphans), page_size):
+                    collection.delete(ids=orphans[start:start + page_size])
+                stats["deleted"] += len(orphans)
+        stats["collections"] += 1
+    return rollups_present
+
+
+def _write_archived(rows: list[dict]) -> None:
+    messages = read_archived_messages([r["message_id"] for r in rows])
+    write_memories([
+        {"message_id": m["id"], "session_id": m["session_id"], "role": m["role"], "content": m["content"]}
+        for m in messages.values()
+    ])
+
+
+def reconcile(
+    *,
+    batch_size: int = 256,
+    page_size: int = 1000,
+    workers: int = 2,
+    dry_run: bool = False,
+    progress: Optional[Callable[[dict], None]] = None,
+) -> dict[str, Any]:
+    """Bring the index in line with SQLite, touching only what differs.
+
+    First every collection is paged through and each healthy ``msg_<id>`` is
+    marked in a bitmap indexed by message id (one byte per message, the only
+    state kept for the whole run); orphans are deleted as they are found.
+    Then messages are streamed from SQLite in id order, hot then archived,
+    and those not marked
+    (missing or stale) are re-embedded and upserted ``batch_size`` at a time,
+    with up to ``workers`` batches in flight. Safe to re-run; ``dry_run`` only
+    counts.
+    """
+    if sidecar.enabled:
+        # Orphans are read and deleted through the local client; writes must go there too
+        raise RuntimeError("reconcile opens Chroma directly; run it with JOURNAL_SIDECAR_SOCKET unset")
+    started = time.perf_counter()
+    stats = {
+        "collections": 0, "index_scanned": 0, "messages_scanned": 0,
+        "stale": 0, "misplaced": 0, "orphans": 0, "deleted": 0,
+        "missing": 0, "reembedded": 0, "rollups_restored": 0,
+        "elapsed_seconds": 0.0, "reembedded_per_second": 0.0,
+    }
+
+    def report() -> None:
+        stats["elapsed_seconds"] = time.perf_counter() - started
+        if stats["elapsed_seconds"] > 0:
+            stats["reembedded_per_second"] = stats["reembedded"] / stats["elapsed_seconds"]
+        if progress is not None:
+            progress(dict(stats))
+
+    present = bytearray(get_max_message_id() + 1)
+    rollups = get_rollup_memories()
+    rollups_present = _scan_index(
+        stats, present, rollups, page_size=page_size, dry_run=dry_run, progress=lambda _: report(),
+    )
+
+    missing_rollups = [r for memory_id, r in rollups.items() if memory_id not in rollups_present]
+    stats["rollups_restored"] = len(missing_rollups)
+    if missing_rollups and not dry_run:
+        vectors = embed_texts([r["content"] for r in missing_rollups])
+        for rollup, vector in zip(missing_rollups, vectors):
+            get_collection(collection_name(rollup["session_id"])).upsert(
+                ids=[rollup["memory_id"]], documents=[rollup["content"]], embeddings=[vector],
+                metadatas=[{"session_id": rollup["session_id"], "role": "summary"}],
+            )
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="journal-reconcile") as pool:
+        in_flight: deque[tuple[Future, int]] = deque()
+
+        def settle(limit: int) -> None:
+            while len(in_flight) > limit:
+                future, size = in_flight.popleft()
+                future.result()
+                stats["reembedded"] += size
+                report()
+
+        # Hot messages carry their text; archived ones are decoded by the worker
+        for fetch, write in ((get_indexable_messages, write_memories), (get_archived_indexable, _write_archived)):
+            after_id = 0
+            while True:
+                rows = fetch(after_id, batch_size)
+                if not rows:
+                    break
+                after_id = rows[-1]["message_id"]
+                stats["messages_scanned"] += len(rows)
+                todo = [r for r in rows if r["message_id"] >= len(present) or not present[r["message_id"]]]
+                stats["missing"] += len(todo)
+                if todo and not dry_run:
+                    in_flight.append((pool.submit(write, todo), len(todo)))
+                    settle(max(1, workers) * 2)
+                elif not todo:
+                    report()
+        settle(0)
+
+    # Stale counts were also counted as missing; report them once
+    stats["missing"] = max(0, stats["missing"] - stats["stale"])
+    if not dry_run:
+        recall_cache.clear()
+    report()
+    logger.info("Reconciled memory index: %s", stats)
+    return stats
+
+
+def rebuild(
+    *,
+    fresh: bool = False,
+    swap: bool = False,
+    batch_size: int = 256,
+    page_size: int = 1000,
+    workers: int = 2,
+    progress: Optional[Callable[[dict], None]] = None,
+) -> dict[str, Any]:
+    """Build a complete index in GREEN_DIR, and with ``swap`` make it the live one.
+
+    The build reads only SQLite and may run while the server keeps serving
+    the current ("blue") index; re-running resumes it, ``fresh`` starts over.
+    Memories written while it runs are caught up by the reconcile that
+    ``swap`` performs before renaming the directories, which must happen with
+    the server stopped. The old index is kept beside CHROMA_DIR.
+    """
+    if fresh and GREEN_DIR.exists():
+        shutil.rmtree(GREEN_DIR)
+    use_directory(GREEN_DIR)
+    stats: dict[str, Any] = {"green_dir": str(GREEN_DIR), "encoder": ENCODER_NAME}
+    try:
+        stats["build"] = reconcile(batch_size=batch_size, page_size=page_size, workers=workers, progress=progress)
+    finally:
+        use_directory(CHROMA_DIR)
+
+    if swap:
+        blue_dir = CHROMA_DIR.with_name(f"{CHROMA_DIR.name}.blue-{time.strftime('%Y%m%d-%H%M%S')}")
+        if CHROMA_DIR.exists():
+            CHROMA_DIR.rename(blue_dir)
+            stats["blue_dir"] = str(blue_dir)
+        GREEN_DIR.rename(CHROMA_DIR)
+        # The new index was embedded by the configured encoder
+        set_index_meta({"vector_space": VECTOR_SPACE, "encoder": ENCODER_NAME})
+        stats["swapped"] = True
+    return stats
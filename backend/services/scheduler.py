@@ -0,0 +1,194 @@
+"""Admission control and scheduling for LLM generations."""
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from ..config import LLM_MAX_CONCURRENT, LLM_MAX_QUEUE, LLM_SHORT_PROMPT_BOOST, LLM_SHORT_PROMPT_TOKENS
+from ..metrics import LLM_QUEUE_WAIT, LLM_REJECTED
+
+# Background work (summaries) yields to user turns that arrive up to this much later
+_BACKGROUND_PENALTY = 30.0
+
+
+class SchedulerBusy(Exception):
+    """The wait queue is full; the client should retry after ``retry_after`` seconds."""
+
+    def __init__(self, retry_after: int) -> None:
+        super().__init__(f"LLM queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """One admitted generation, from admission until it finishes or is abandoned."""
+
+    def __init__(self, scheduler: "LLMScheduler") -> None:
+        self._scheduler = scheduler
+        self._admitted_at = time.perf_counter()
+        self._pending = True
+
+    @asynccontextmanager
+    async def slot(self, prompt_tokens: int, *, background: bool = False) -> AsyncIterator[None]:
+        """Wait for a generation slot, hold it for the block, then hand it on."""
+        scheduler = self._scheduler
+        short = prompt_tokens <= scheduler.short_prompt_tokens
+        priority = time.monotonic()
+        if background:
+            priority += _BACKGROUND_PENALTY
+        elif short:
+            # Short prompts finish quickly; let them pass longer ones that queued a little earlier
+            priority -= scheduler.short_prompt_boost
+
+        await scheduler._acquire(priority)
+        self._leave_queue()
+        LLM_QUEUE_WAIT.labels("background" if background else "short" if short else "long").observe(
+            time.perf_counter() - self._admitted_at
+        )
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            scheduler._record_service(time.perf_counter() - started)
+            scheduler.completed += 1
+            scheduler._release()
+
+    def _leave_queue(self) -> None:
+        if self._pending:
+            self._pending = False
+            self._scheduler._pending -= 1
+
+    def release(self) -> None:
+        """Give up the queue position if the slot was never reached. Safe to call twice."""
+        self._leave_queue()
+
+
+class LLMScheduler:
+    """Caps concurrent generations, bounds the wait queue and serializes sessions.
+
+    A turn is admitted first, which fails fast with ``SchedulerBusy`` once
+    ``max_queue`` turns are already waiting, before anything is written. It
+    then takes its session's lock, so turns in one session run strictly in
+    arrival order, and finally waits for one of ``max_concurrent`` slots.
+    Waiters are served oldest first, except that short prompts are treated
+    as if they arrived ``short_prompt_boost`` seconds earlier. That keeps
+    quick replies quick under load without starving long prompts.
+
+    Everything runs on the event loop, so no thread locks are needed.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_concurrent: int = LLM_MAX_CONCURRENT,
+        max_queue: int = LLM_MAX_QUEUE,
+        short_prompt_tokens: int = LLM_SHORT_PROMPT_TOKENS,
+        short_prompt_boost: float = LLM_SHORT_PROMPT_BOOST,
+    ) -> None:
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.short_prompt_tokens = short_prompt_tokens
+        self.short_prompt_boost = short_prompt_boost
+
+        self._running = 0
+        self._pending = 0
+        self._waiters: list[tuple[float, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._sessions: dict[str, tuple[asyncio.Lock, int]] = {}
+        self._service_avg: Optional[float] = None
+
+        self.admitted = 0
+        self.rejected = 0
+        self.completed = 0
+
+    # -------------------------------
+    # Admission
+    # -------------------------------
+    def retry_after(self) -> int:
+        """Seconds until a queued turn is likely to start, from the average generation time."""
+        per_generation = self._service_avg or 5.0
+        return max(1, math.ceil(per_generation * (self._pending + 1) / self.max_concurrent))
+
+    def check(self) -> None:
+        """Raise ``SchedulerBusy`` if a new turn would not be admitted right now."""
+        if self._pending >= self.max_queue:
+            self.rejected += 1
+            LLM_REJECTED.inc()
+            raise SchedulerBusy(self.retry_after())
+
+    def admit(self) -> Ticket:
+        """Reserve a place in the queue. Release the ticket when the turn ends."""
+        self.check()
+        self._pending += 1
+        self.admitted += 1
+        return Ticket(self)
+
+    # -------------------------------
+    # Per-session ordering
+    # -------------------------------
+    @asynccontextmanager
+    async def session(self, session_id: str) -> AsyncIterator[None]:
+        """Run the block exclusively for ``session_id``; waiters go in arrival order."""
+        lock, users = self._sessions.get(session_id, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        self._sessions[session_id] = (lock, users + 1)
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, users = self._sessions[session_id]
+            if users <= 1:
+                del self._sessions[session_id]
+            else:
+                self._sessions[session_id] = (lock, users - 1)
+
+    # -------------------------------
+    # Generation slots
+    # -------------------------------
+    async def _acquire(self, priority: float) -> None:
+        while self._waiters and self._waiters[0][2].done():
+            heapq.heappop(self._waiters)
+        if self._running < self.max_concurrent and not self._waiters:
+            self._running += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as we were cancelled; pass it on
+                self._release()
+            raise
+
+    def _release(self) -> None:
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                # Hand the slot straight to the next waiter; the running count is unchanged
+                future.set_result(None)
+                return
+        self._running -= 1
+
+    def _record_service(self, seconds: float) -> None:
+        self._service_avg = seconds if self._service_avg is None else 0.8 * self._service_avg + 0.2 * seconds
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "running": self._running,
+            "queued": self._pending,
+            "waiting_for_slot": sum(1 for _, _, f in self._waiters if not f.done()),
+            "active_sessions": len(self._sessions),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "avg_generation_seconds": self._service_avg,
+        }
+
+
+llm_scheduler = LLMScheduler()
@@ -0,0 +1,327 @@
+"""Embedding and index sidecar: one process owns the model and Chroma for all server workers.
+
+Run several uvicorn workers and each would load its own encoder and open its
+own PersistentClient on CHROMA_DIR, which multiplies memory and is unsafe
+for concurrent writers. With JOURNAL_SIDECAR_SOCKET set, embed_text(s),
+vector recall and write_memories become thin clients of
+``python -m backend.cli sidecar``, which serves them over a Unix socket.
+Requests from every worker land in the sidecar's one EmbeddingService, so
+they are micro-batched together.
+
+Wire format: each message is a frame of two big-endian uint32 lengths, a
+JSON header and a binary payload. Vectors travel in the payload as a
+little-endian float32 matrix whose shape is given in the header.
+"""
+import json
+import logging
+import os
+import queue
+import signal
+import socket
+import socketserver
+import struct
+import threading
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+import numpy as np
+
+from ..config import SIDECAR_POOL, SIDECAR_SOCKET, SIDECAR_TIMEOUT
+from ..metrics import stage
+
+logger = logging.getLogger(__name__)
+
+_FRAME = struct.Struct(">II")
+_VECTOR_DTYPE = np.dtype("<f4")
+
+
+class SidecarError(RuntimeError):
+    """The sidecar could not be reached or failed the request."""
+
+
+# -------------------------------
+# Framing
+# -------------------------------
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    buf = bytearray(size)
+    view = memoryview(buf)
+    got = 0
+    while got < size:
+        n = sock.recv_into(view[got:])
+        if n == 0:
+            raise ConnectionError("connection closed")
+        got += n
+    return bytes(buf)
+
+
+def send_frame(sock: socket.socket, header: dict, payload: bytes = b"") -> None:
+    head = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    sock.sendall(_FRAME.pack(len(head), len(payload)) + head + payload)
+
+
+def recv_frame(sock: socket.socket) -> tuple[dict, bytes]:
+    head_size, payload_size = _FRAME.unpack(_recv_exact(sock, _FRAME.size))
+    header = json.loads(_recv_exact(sock, head_size))
+    return header, _recv_exact(sock, payload_size) if payload_size else b""
+
+
+def pack_vectors(vectors: list[list[float]]) -> tuple[bytes, list[int]]:
+    """Encode vectors as a float32 matrix; returns the bytes and its shape."""
+    matrix = np.asarray(vectors, dtype=_VECTOR_DTYPE)
+    if matrix.ndim != 2:
+        matrix = matrix.reshape(len(vectors), -1)
+    return matrix.tobytes(), list(matrix.shape)
+
+
+def unpack_vectors(payload: bytes, shape: list[int]) -> list[list[float]]:
+    return np.frombuffer(payload, dtype=_VECTOR_DTYPE).reshape(shape).tolist()
+
+
+# -------------------------------
+# Client (server processes)
+# -------------------------------
+class SidecarClient:
+    """Pooled connections to the sidecar; disabled when ``socket_path`` is empty.
+
+    Calls block, so async callers run them on the I/O pool. At most
+    ``pool_size`` requests are in flight per process; idle connections are
+    reused, and one that went stale (the sidecar restarted) is replaced once.
+    """
+
+    def __init__(self, socket_path: str, *, pool_size: int = SIDECAR_POOL, timeout: float = SIDECAR_TIMEOUT) -> None:
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.pool_size = max(1, pool_size)
+        self._slots = threading.BoundedSemaphore(self.pool_size)
+        self._idle: "queue.LifoQueue[socket.socket]" = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._errors = 0
+        self._reconnects = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.socket_path)
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def _exchange(self, header: dict, payload: bytes) -> tuple[dict, bytes]:
+        try:
+            sock, pooled = self._idle.get_nowait(), True
+        except queue.Empty:
+            sock, pooled = self._connect(), False
+        try:
+            send_frame(sock, header, payload)
+            reply = recv_frame(sock)
+        except ConnectionError as e:
+            sock.close()
+            if not pooled:
+                raise
+            # The sidecar closed this idle connection; retry once on a new one
+            logger.debug("Reconnecting to sidecar: %s", e)
+            with self._lock:
+                self._reconnects += 1
+            sock = self._connect()
+            try:
+                send_frame(sock, header, payload)
+                reply = recv_frame(sock)
+            except BaseException:
+                sock.close()
+                raise
+        except BaseException:
+            sock.close()
+            raise
+        self._idle.put(sock)
+        return reply
+
+    def call(self, op: str, header: Optional[dict] = None, payload: bytes = b"") -> tuple[dict, bytes]:
+        """Send one request and return the reply header and payload."""
+        with self._slots, stage(f"sidecar.{op}"):
+            try:
+                reply, data = self._exchange({"op": op, **(header or {})}, payload)
+            except (OSError, ValueError) as e:
+                with self._lock:
+                    self._errors += 1
+                raise SidecarError(f"sidecar at {self.socket_path} unavailable: {e}") from e
+        with self._lock:
+            self._calls += 1
+            if not reply.get("ok"):
+                self._errors += 1
+        if not reply.get("ok"):
+            raise SidecarError(reply.get("error", "sidecar request failed"))
+        return reply, data
+
+    def ping(self) -> dict:
+        return self.call("ping")[0]
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        if not texts:
+            return []
+        reply, data = self.call("embed", {"texts": texts})
+        return unpack_vectors(data, reply["shape"])
+
+    def query(self, query_embedding: list[float], session_id: str, n: int) -> list[tuple[str, str, float]]:
+        """Nearest indexed memories of a session as (id, document, distance)."""
+        payload, shape = pack_vectors([query_embedding])
+        reply, _ = self.call("query", {"session_id": session_id, "n": n, "shape": shape}, payload)
+        return [tuple(hit) for hit in reply["hits"]]
+
+    def upsert(self, items: list[dict[str, Any]], vectors: Optional[list[list[float]]] = None) -> None:
+        """Index ``items`` (see memory.write_memories); the sidecar embeds them when ``vectors`` is None."""
+        fields = ("message_id", "session_id", "role", "content")
+        header: dict[str, Any] = {"items": [{f: item[f] for f in fields} for item in items]}
+        payload = b""
+        if vectors is not None:
+            payload, header["shape"] = pack_vectors(vectors)
+        self.call("upsert", header, payload)
+
+    def server_stats(self) -> dict:
+        return self.call("stats")[0]["stats"]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "socket": self.socket_path,
+                "pool_size": self.pool_size,
+                "idle_connections": self._idle.qsize(),
+                "calls": self._calls,
+                "errors": self._errors,
+                "reconnects": self._reconnects,
+            }
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+# Used by services.ai and services.memory when JOURNAL_SIDECAR_SOCKET is set
+sidecar = SidecarClient(SIDECAR_SOCKET)
+
+
+# -------------------------------
+# Server (the sidecar process)
+# -------------------------------
+class _Handler(socketserver.BaseRequestHandler):
+    """Serves requests on one connection until the client closes it."""
+
+    def handle(self) -> None:
+        ops: dict[str, Callable[[dict, bytes], tuple[dict, bytes]]] = self.server.ops
+        while True:
+            try:
+                header, payload = recv_frame(self.request)
+            except (ConnectionError, OSError):
+                return
+            try:
+                op = ops.get(header.get("op"))
+                if op is None:
+                    raise ValueError(f"unknown op {header.get('op')!r}")
+                reply, data = op(header, payload)
+                reply["ok"] = True
+            except Exception as e:
+                logger.exception("Sidecar request %r failed", header.get("op"))
+                reply, data = {"ok": False, "error": f"{type(e).__name__}: {e}"}, b""
+            try:
+                send_frame(self.request, reply, data)
+            except OSError:
+                return
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str, ops: dict) -> None:
+        self.ops = ops
+        super().__init__(path, _Handler)
+
+
+def _server_ops() -> dict[str, Callable[[dict, bytes], tuple[dict, bytes]]]:
+    from ..db.chroma import count_memories
+    from .ai import ENCODER_NAME, VECTOR_SPACE, embed_texts, embedding_service
+    from .compaction import memory_compactor
+    from .memory import _query_index, write_memories
+
+    def ping(header: dict, payload: bytes) -> tuple[dict, bytes]:
+        return {"encoder": ENCODER_NAME, "vector_space": VECTOR_SPACE, "pid": os.getpid()}, b""
+
+    def embed(header: dict, payload: bytes) -> tuple[dict, bytes]:
+        data, shape = pack_vectors(embed_texts(header["texts"]))
+        return {"shape": shape}, data
+
+    def query(header: dict, payload: bytes) -> tuple[dict, bytes]:
+        (vector,) = unpack_vectors(payload, header["shape"])
+        return {"hits": _query_index(vector, header["session_id"], header["n"])}, b""
+
+    def upsert(header: dict, payload: bytes) -> tuple[dict, bytes]:
+        vectors = unpack_vectors(payload, header["shape"]) if payload else None
+        write_memories(header["items"], vectors)
+        return {}, b""
+
+    def stats(header: dict, payload: bytes) -> tuple[dict, bytes]:
+        return {"stats": {
+            "encoder": ENCODER_NAME,
+            "memories": count_memories(),
+            "embedding": embedding_service.stats(),
+            "compaction": memory_compactor.stats(),
+        }}, b""
+
+    return {"ping": ping, "embed": embed, "query": query, "upsert": upsert, "stats": stats}
+
+
+def serve(socket_path: str = SIDECAR_SOCKET) -> None:
+    """Load the encoder and Chroma, then answer requests on ``socket_path`` until SIGINT/SIGTERM.
+
+    The sidecar also runs the periodic compactor (JOURNAL_COMPACT_INTERVAL),
+    since it is the only process allowed to write to Chroma.
+    """
+    if not socket_path:
+        raise ValueError("No socket path; set JOURNAL_SIDECAR_SOCKET or pass --socket")
+    # This process is the sidecar: its own embeds and index writes stay local
+    sidecar.socket_path = ""
+
+    from ..db.chroma import warm_up as warm_up_chroma
+    from .ai import embedding_service, warm_up_embeddings
+    from .compaction import memory_compactor
+    from .memory import check_index_encoder
+
+    path = Path(socket_path)
+    if path.exists():
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(str(path))
+        except OSError:
+            path.unlink()  # left behind by a sidecar that did not shut down cleanly
+        else:
+            raise RuntimeError(f"A sidecar is already listening on {path}")
+        finally:
+            probe.close()
+
+    warm_up_chroma()
+    warm_up_embeddings()
+    check_index_encoder()
+
+    server = _Server(str(path), _server_ops())
+    os.chmod(path, 0o600)
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    memory_compactor.start()
+    logger.info("Sidecar listening on %s", path)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        memory_compactor.stop()
+        server.server_close()
+        path.unlink(missing_ok=True)
+        embedding_service.close()
@@ -0,0 +1,5 @@
+"""Offline, reproducible performance benchmarks for the journal backend.
+
+Run ``python -m benchmarks.run --help`` for the end-to-end suite and
+``python -m benchmarks.compare old.json new.json`` to diff two result files.
+"""
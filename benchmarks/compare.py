@@ -0,0 +1,51 @@
+"""Compare two benchmark result files and flag regressions.
+
+    python -m benchmarks.compare baseline.json candidate.json [--threshold 10]
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+METRICS = ("p50_ms", "p95_ms", "p99_ms", "throughput_rps", "mrr")
+# Metrics where a higher value is an improvement
+HIGHER_IS_BETTER = ("throughput_rps", "mrr")
+
+
+def _rows(results: dict):
+    groups = {
+        "endpoints": results.get("endpoints"),
+        "stages": results.get("stages"),
+        "recall": (results.get("recall") or {}).get("modes"),
+    }
+    for group, entries in groups.items():
+        for name, stats in (entries or {}).items():
+            for metric in METRICS:
+                if metric in stats:
+                    yield f"{group}.{name}.{metric}", stats[metric]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("baseline", type=Path)
+    parser.add_argument("candidate", type=Path)
+    parser.add_argument("--threshold", type=float, default=10.0, help="Percent change that counts as a regression")
+    args = parser.parse_args(argv)
+
+    old = dict(_rows(json.loads(args.baseline.read_text())))
+    new = dict(_rows(json.loads(args.candidate.read_text())))
+
+    regressions = 0
+    print(f"{'metric':<50} {'baseline':>12} {'candidate':>12} {'change':>9}")
+    for key in sorted(old.keys() & new.keys()):
+        a, b = old[key], new[key]
+        change = (b - a) / a * 100 if a else 0.0
+        worse = -change if key.endswith(HIGHER_IS_BETTER) else change
+        flag = "  REGRESSION" if worse > args.threshold else ""
+        regressions += bool(flag)
+        print(f"{key:<50} {a:>12.2f} {b:>12.2f} {change:>+8.1f}%{flag}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
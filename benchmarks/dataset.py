@@ -0,0 +1,47 @@
+"""Deterministic synthetic journal data in the importer's NDJSON format."""
+import json
+import random
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+_SYLLABLES = ["ka", "lo", "mi", "ren", "sa", "tu", "vel", "zor", "an", "de", "fi", "gor", "ha", "jin", "ku", "ly"]
+COMMON_WORDS = ("today I felt went with my the and a to about was really think work family friend "
+           "morning evening walk coffee dinner tired happy worried plan remember").split()
+
+
+def _vocabulary(rng: random.Random, size: int) -> list[str]:
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def write_ndjson(path: Path, *, sessions: int, messages: int, seed: int = 42) -> None:
+    """Write ``messages`` alternating user/assistant turns spread over ``sessions``."""
+    rng = random.Random(seed)
+    vocab = _vocabulary(rng, 5000)
+    start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    per_session = max(1, messages // sessions)
+
+    with path.open("w", encoding="utf-8") as f:
+        written = 0
+        for s in range(sessions):
+            count = per_session if s < sessions - 1 else messages - written
+            t = start + timedelta(hours=s)
+            for i in range(count):
+                words = [rng.choice(COMMON_WORDS) if rng.random() < 0.6 else rng.choice(vocab)
+                         for _ in range(rng.randint(8, 40))]
+                f.write(json.dumps({
+                    "session_name": f"bench-{s}",
+                    "role": "user" if i % 2 == 0 else "assistant",
+                    "content": " ".join(words),
+                    "created_at": (t + timedelta(seconds=30 * i)).isoformat(),
+                }) + "\n")
+            written += count
+            if written >= messages:
+                break
+
+
+def sample_query(rng: random.Random) -> str:
+    """A user-style message for load generation."""
+    return " ".join(rng.choice(COMMON_WORDS) for _ in range(rng.randint(6, 20)))
@@ -0,0 +1,158 @@
+"""Embedding backends side by side: load time, latency, throughput, RSS and parity.
+
+Each backend runs in its own process, so its peak RSS (PyTorch vs ONNX
+Runtime) is measured in isolation. Parity is the cosine similarity between a
+backend's vectors and the reference backend's for the same texts; a backend
+whose worst text falls below --min-cosine fails the run (exit status 1).
+
+    python -m benchmarks.embedders --backends sentence-transformers onnx onnx-int8 --texts 2000
+
+The ONNX backends need `python -m backend.cli export-onnx --quantize` first.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from .common import project_root, summarize
+from .dataset import sample_query
+
+BACKENDS = {
+    "sentence-transformers": {"JOURNAL_EMBEDDING_BACKEND": "sentence-transformers"},
+    "onnx": {"JOURNAL_EMBEDDING_BACKEND": "onnx", "JOURNAL_ONNX_QUANTIZE": "0"},
+    "onnx-int8": {"JOURNAL_EMBEDDING_BACKEND": "onnx", "JOURNAL_ONNX_QUANTIZE": "1"},
+    "hash": {"JOURNAL_EMBEDDING_BACKEND": "hash"},
+}
+# Backends producing the same model's vectors; parity is only meaningful among these
+MINILM_BACKENDS = ("sentence-transformers", "onnx", "onnx-int8")
+
+
+def _texts(count: int, seed: int) -> list[str]:
+    # Journal-like lengths: from a short query up to a paragraph
+    rng = random.Random(seed)
+    return [" ".join(sample_query(rng) for _ in range(rng.randint(1, 12))) for _ in range(count)]
+
+
+def _peak_rss_bytes() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def child(texts_path: Path, vectors_path: Path, batch_size: int, singles: int) -> dict:
+    """Time the configured backend in this process (run via --child)."""
+    from backend.services import ai
+
+    texts = json.loads(texts_path.read_text())
+    rss_before = _peak_rss_bytes()
+    t0 = time.perf_counter()
+    ai.warm_up_embeddings()
+    load_seconds = time.perf_counter() - t0
+
+    latencies = []
+    for text in texts[:singles]:
+        t0 = time.perf_counter()
+        ai.encode_batch([text])
+        latencies.append(time.perf_counter() - t0)
+
+    vectors = []
+    t0 = time.perf_counter()
+    for start in range(0, len(texts), batch_size):
+        vectors.extend(ai.encode_batch(texts[start:start + batch_size]))
+    elapsed = time.perf_counter() - t0
+    np.save(vectors_path, np.asarray(vectors, dtype=np.float32))
+
+    return {
+        "encoder": ai.ENCODER_NAME,
+        "load_seconds": load_seconds,
+        "single": summarize(latencies),
+        "batch_size": batch_size,
+        "texts_per_second": len(texts) / elapsed if elapsed > 0 else 0.0,
+        "peak_rss_bytes": _peak_rss_bytes(),
+        "peak_rss_growth_bytes": _peak_rss_bytes() - rss_before,
+    }
+
+
+def _parity(reference: np.ndarray, vectors: np.ndarray) -> dict:
+    if reference.shape != vectors.shape:
+        return {"error": f"shape {vectors.shape} differs from the reference {reference.shape}"}
+    a = reference / np.maximum(np.linalg.norm(reference, axis=1, keepdims=True), 1e-12)
+    b = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    cosine = np.sort((a * b).sum(axis=1))
+    return {
+        "mean_cosine": float(cosine.mean()),
+        "p01_cosine": float(cosine[int(0.01 * (len(cosine) - 1))]),
+        "min_cosine": float(cosine[0]),
+    }
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backends", nargs="+", choices=sorted(BACKENDS),
+                        default=["sentence-transformers", "onnx", "onnx-int8"])
+    parser.add_argument("--reference", choices=sorted(BACKENDS), default="sentence-transformers",
+                        help="Backend the others are compared against")
+    parser.add_argument("--texts", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--singles", type=int, default=100, help="Texts encoded one at a time for latency")
+    parser.add_argument("--min-cosine", type=float, default=0.98)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", type=Path, help="Write results JSON here (default: stdout)")
+    parser.add_argument("--child", nargs=2, type=Path, metavar=("TEXTS", "VECTORS"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(child(*args.child, batch_size=args.batch_size, singles=args.singles)))
+        return
+
+    workdir = Path(tempfile.mkdtemp(prefix="journal-embedders-"))
+    texts_path = workdir / "texts.json"
+    texts_path.write_text(json.dumps(_texts(args.texts, args.seed)))
+
+    results, vectors = {}, {}
+    for backend in dict.fromkeys([args.reference, *args.backends]):
+        print(f"encoding with {backend}…", file=sys.stderr)
+        env = {**os.environ, **BACKENDS[backend],
+               "PYTHONPATH": project_root() + os.pathsep + os.environ.get("PYTHONPATH", "")}
+        out_path = workdir / f"{backend}.npy"
+        proc = subprocess.run(
+            [sys.executable, "-m", "benchmarks.embedders", "--child", str(texts_path), str(out_path),
+             "--batch-size", str(args.batch_size), "--singles", str(args.singles)],
+            env=env, cwd=project_root(), capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            # e.g. the ONNX model was never exported or torch is not installed
+            results[backend] = {"error": (proc.stderr.strip().splitlines() or ["failed"])[-1]}
+            continue
+        results[backend] = json.loads(proc.stdout)
+        vectors[backend] = np.load(out_path)
+
+    failed = []
+    if args.reference in vectors and args.reference in MINILM_BACKENDS:
+        for backend, vecs in vectors.items():
+            if backend == args.reference or backend not in MINILM_BACKENDS:
+                continue
+            parity = _parity(vectors[args.reference], vecs)
+            parity["ok"] = parity.get("min_cosine", -1.0) >= args.min_cosine
+            results[backend]["parity"] = parity
+            if not parity["ok"]:
+                failed.append(backend)
+
+    text = json.dumps({"texts": args.texts, "reference": args.reference, "backends": results}, indent=2)
+    if args.out:
+        args.out.write_text(text)
+        print(f"wrote {args.out}", file=sys.stderr)
+    else:
+        print(text)
+    if failed:
+        raise SystemExit(f"parity below {args.min_cosine} for: {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+    main()
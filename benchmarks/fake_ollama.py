@@ -0,0 +1,119 @@
+"""A stand-in Ollama server with configurable latency and token rate.
+
+Implements the parts of the Ollama HTTP API the backend uses (/api/chat,
+streaming and not, /api/show, /api/tags). Point the app at it with
+OLLAMA_HOST=http://127.0.0.1:<port>.
+
+    python -m benchmarks.fake_ollama --port 11999 --latency-ms 200 --tokens-per-sec 30
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timezone
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+# Set from the command line in main()
+SETTINGS = {
+    "latency_ms": 200.0,
+    "prefill_ms_per_1k_tokens": 50.0,
+    "tokens_per_sec": 30.0,
+    "reply_tokens": 60,
+}
+
+_WORDS = ("that sounds like a meaningful day and I remember you mentioned it before "
+          "tell me more about how it made you feel").split()
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _prefill_seconds(messages: list[dict]) -> float:
+    prompt_tokens = sum(len(m.get("content", "")) for m in messages) / 4
+    return (SETTINGS["latency_ms"] + SETTINGS["prefill_ms_per_1k_tokens"] * prompt_tokens / 1000) / 1000
+
+
+def _tokens() -> list[str]:
+    n = int(SETTINGS["reply_tokens"])
+    return [(" " if i else "") + _WORDS[i % len(_WORDS)] for i in range(n)]
+
+
+def _final(model: str, content: str, started: float, prompt_chars: int) -> dict:
+    return {
+        "model": model,
+        "created_at": _now(),
+        "message": {"role": "assistant", "content": content},
+        "done": True,
+        "done_reason": "stop",
+        "total_duration": int((time.perf_counter() - started) * 1e9),
+        "prompt_eval_count": prompt_chars // 4,
+        "eval_count": int(SETTINGS["reply_tokens"]),
+    }
+
+
+async def chat(request: Request):
+    body = await request.json()
+    model = body.get("model", "fake")
+    messages = body.get("messages", [])
+    prompt_chars = sum(len(m.get("content", "")) for m in messages)
+    started = time.perf_counter()
+    per_token = 1.0 / SETTINGS["tokens_per_sec"] if SETTINGS["tokens_per_sec"] > 0 else 0.0
+
+    if not body.get("stream", True):
+        await asyncio.sleep(_prefill_seconds(messages) + per_token * SETTINGS["reply_tokens"])
+        return JSONResponse(_final(model, "".join(_tokens()), started, prompt_chars))
+
+    async def stream():
+        await asyncio.sleep(_prefill_seconds(messages))
+        for token in _tokens():
+            yield json.dumps({
+                "model": model, "created_at": _now(),
+                "message": {"role": "assistant", "content": token}, "done": False,
+            }) + "\n"
+            await asyncio.sleep(per_token)
+        yield json.dumps(_final(model, "", started, prompt_chars)) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+async def show(request: Request):
+    return JSONResponse({"modelfile": "", "parameters": "", "template": "", "details": {"family": "fake"}, "model_info": {}})
+
+
+async def tags(request: Request):
+    return JSONResponse({"models": [{"name": "fake", "model": "fake"}]})
+
+
+app = Starlette(routes=[
+    Route("/api/chat", chat, methods=["POST"]),
+    Route("/api/show", show, methods=["POST"]),
+    Route("/api/tags", tags, methods=["GET"]),
+])
+
+
+def main(argv=None) -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Fake Ollama server")
+    parser.add_argument("--port", type=int, default=11999)
+    parser.add_argument("--latency-ms", type=float, default=SETTINGS["latency_ms"])
+    parser.add_argument("--prefill-ms-per-1k-tokens", type=float, default=SETTINGS["prefill_ms_per_1k_tokens"])
+    parser.add_argument("--tokens-per-sec", type=float, default=SETTINGS["tokens_per_sec"])
+    parser.add_argument("--reply-tokens", type=int, default=SETTINGS["reply_tokens"])
+    args = parser.parse_args(argv)
+    SETTINGS.update(
+        latency_ms=args.latency_ms,
+        prefill_ms_per_1k_tokens=args.prefill_ms_per_1k_tokens,
+        tokens_per_sec=args.tokens_per_sec,
+        reply_tokens=args.reply_tokens,
+    )
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
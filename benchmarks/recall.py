@@ -0,0 +1,92 @@
+"""Recall latency and hit quality per recall mode (vector, lexical, hybrid).
+
+Run with the same JOURNAL_* environment as the server under test, against a
+seeded and fully indexed dataset; prints JSON. Each query is built from a
+sampled message: a few of its rarer words plus common filler, the way a user
+refers back to a name or place. A query is a hit when that message comes
+back in the top ``k``.
+
+    python -m benchmarks.recall --queries 500 --k 5
+"""
+import argparse
+import json
+import random
+import time
+
+from .common import summarize
+from .dataset import COMMON_WORDS
+
+_COMMON_SET = set(COMMON_WORDS)
+
+
+def _make_query(content: str, rng: random.Random) -> str:
+    words = content.split()
+    rare = [w for w in dict.fromkeys(words) if w not in _COMMON_SET] or words
+    picked = rng.sample(rare, min(2, len(rare)))
+    filler = [rng.choice(COMMON_WORDS) for _ in range(rng.randint(2, 5))]
+    mixed = picked + filler
+    rng.shuffle(mixed)
+    return " ".join(mixed)
+
+
+def run(queries: int, k: int, seed: int) -> dict:
+    from backend.db import sqlite as db
+    from backend.services import ai, memory
+
+    db.init_db()
+    # Measure the retrievers themselves, not cache hits
+    memory.recall_cache.max_entries = 0
+    rng = random.Random(seed)
+    conn = db.get_conn()
+    targets = [dict(r) for r in conn.execute(
+        "SELECT id, session_id, content FROM messages ORDER BY RANDOM() LIMIT ?", (queries,))]
+    if not targets:
+        raise SystemExit("no messages in the database; seed it first")
+
+    pending = db.get_outbox_lag()["pending"]
+    cases = [(t["id"], t["session_id"], _make_query(t["content"], rng)) for t in targets]
+
+    # Embed up front so every mode measures retrieval alone; embedding is reported separately
+    embed_latencies, embeddings = [], []
+    for _, _, query in cases:
+        t0 = time.perf_counter()
+        embeddings.append(ai.embed_text(query))
+        embed_latencies.append(time.perf_counter() - t0)
+
+    results = {}
+    for mode in memory.RECALL_MODES:
+        latencies, hits, reciprocal_ranks = [], 0, 0.0
+        for (target_id, session_id, query), embedding in zip(cases, embeddings):
+            t0 = time.perf_counter()
+            found = memory.recall_memories_scored(query, session_id, k, query_embedding=embedding, mode=mode)
+            latencies.append(time.perf_counter() - t0)
+            ids = [m["message_id"] for m in found]
+            if target_id in ids:
+                hits += 1
+                reciprocal_ranks += 1 / (ids.index(target_id) + 1)
+        out = summarize(latencies)
+        out[f"hit_rate_at_{k}"] = hits / len(cases)
+        out["mrr"] = reciprocal_ranks / len(cases)
+        results[mode] = out
+
+    return {
+        "queries": len(cases),
+        "k": k,
+        "outbox_pending": pending,
+        "embedding_backend": ai.EMBEDDING_BACKEND,
+        "embed_query": summarize(embed_latencies),
+        "modes": results,
+    }
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+    print(json.dumps(run(args.queries, args.k, args.seed), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""End-to-end benchmark: seed a dataset, start the app against a fake LLM, drive load.
+
+Everything runs locally and offline. The app runs as a real uvicorn process
+with its data under --workdir, its LLM calls go to benchmarks.fake_ollama,
+and embeddings come from the deterministic hash embedder or the real MiniLM
+model (--embedder).
+
+    python -m benchmarks.run --sessions 10000 --messages 1000000 --concurrency 32 --out results.json
+
+Datasets are cached per (sessions, messages, embedder, partition) under the workdir, so
+repeated runs skip seeding.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+import requests
+
+from .common import RssSampler, free_port, project_root, stop, summarize, wait_for
+from .dataset import sample_query, write_ndjson
+
+EMBEDDERS = {"hash": "hash", "minilm": "sentence-transformers"}
+ENDPOINTS = ("chat", "chat_stream", "sessions", "history", "recall")
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=project_root(), text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _app_env(data_dir: Path, embedder: str, ollama_port: int, partition: str = "global") -> dict:
+    env = dict(os.environ)
+    env.update(
+        JOURNAL_DATA_DIR=str(data_dir / "data"),
+        JOURNAL_CHROMA_DIR=str(data_dir / "chroma"),
+        JOURNAL_EMBEDDING_BACKEND=EMBEDDERS[embedder],
+        JOURNAL_CHROMA_PARTITION=partition,
+        OLLAMA_HOST=f"http://127.0.0.1:{ollama_port}",
+        PYTHONPATH=project_root() + os.pathsep + env.get("PYTHONPATH", ""),
+    )
+    return env
+
+
+def seed(data_dir: Path, env: dict, sessions: int, messages: int) -> dict:
+    """Import a synthetic dataset unless this workdir already has it."""
+    marker = data_dir / "seeded.json"
+    if marker.exists():
+        return json.loads(marker.read_text())
+
+    (data_dir / "data").mkdir(parents=True, exist_ok=True)
+    archive = data_dir / "dataset.ndjson"
+    t0 = time.perf_counter()
+    write_ndjson(archive, sessions=sessions, messages=messages)
+    generate_s = time.perf_counter() - t0
+
+    out = subprocess.run(
+        [sys.executable, "-m", "backend.cli", "import", str(archive), "--embed-workers", "2"],
+        env=env, cwd=project_root(), check=True, capture_output=True, text=True,
+    )
+    stats = json.loads(out.stdout)
+    stats["generate_seconds"] = generate_s
+    archive.unlink()
+    marker.write_text(json.dumps(stats))
+    return stats
+
+
+def _session_ids(data_dir: Path, limit: int = 2000) -> list[str]:
+    conn = sqlite3.connect(f"file:{data_dir / 'data' / 'journal.db'}?mode=ro", uri=True)
+    try:
+        return [r[0] for r in conn.execute("SELECT session_id FROM sessions ORDER BY RANDOM() LIMIT ?", (limit,))]
+    finally:
+        conn.close()
+
+
+def _request(endpoint: str, http: requests.Session, base: str, session_id: str, rng: random.Random) -> None:
+    if endpoint == "chat":
+        r = http.post(f"{base}/chat", json={"session_id": session_id, "role": "user", "content": sample_query(rng)})
+    elif endpoint == "chat_stream":
+        r = http.post(f"{base}/chat/stream", stream=True,
+                      json={"session_id": session_id, "role": "user", "content": sample_query(rng)})
+        for _ in r.iter_lines():
+            pass
+    elif endpoint == "sessions":
+        r = http.get(f"{base}/sessions")
+    elif endpoint == "history":
+        r = http.get(f"{base}/sessions/{session_id}/history", params={"limit": 50})
+    elif endpoint == "recall":
+        r = http.get(f"{base}/debug/recall", params={"q": sample_query(rng), "session_id": session_id})
+    else:
+        raise ValueError(endpoint)
+    r.raise_for_status()
+
+
+def drive(endpoint: str, base: str, session_ids: list[str], *,
+          concurrency: int, requests_per_worker: int, server_pid: int, seed: int) -> dict:
+    """Run ``concurrency`` closed-loop clients against one endpoint."""
+    latencies: list[float] = []
+    errors = 0
+    rejected = 0
+    first_error = None
+    lock = threading.Lock()
+
+    def worker(n: int) -> None:
+        nonlocal errors, rejected, first_error
+        rng = random.Random(seed * 1000 + n)
+        with requests.Session() as http:
+            for _ in range(requests_per_worker):
+                t0 = time.perf_counter()
+                try:
+                    _request(endpoint, http, base, rng.choice(session_ids), rng)
+                except requests.RequestException as e:
+                    if getattr(e.response, "status_code", None) == 429:
+                        # Backpressure from the LLM scheduler, not a failure
+                        with lock:
+                            rejected += 1
+                        continue
+                    with lock:
+                        errors += 1
+                        first_error = first_error or repr(e)
+                    continue
+                with lock:
+                    latencies.append(time.perf_counter() - t0)
+
+    with RssSampler(server_pid) as rss:
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(worker, range(concurrency)))
+        elapsed = time.perf_counter() - t0
+
+    out = summarize(latencies, elapsed, errors)
+    out["concurrency"] = concurrency
+    out["rejected"] = rejected
+    out["first_error"] = first_error
+    out["server_peak_rss_bytes"] = rss.peak
+    return out
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=20_000)
+    parser.add_argument("--embedder", choices=sorted(EMBEDDERS), default="hash")
+    parser.add_argument("--partition", choices=["global", "session", "shard"], default="global",
+                        help="Chroma partitioning strategy (JOURNAL_CHROMA_PARTITION)")
+    parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, default=list(ENDPOINTS))
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=20, help="Requests per client per endpoint")
+    parser.add_argument("--llm-latency-ms", type=float, default=200.0)
+    parser.add_argument("--llm-tokens-per-sec", type=float, default=30.0)
+    parser.add_argument("--llm-reply-tokens", type=int, default=60)
+    parser.add_argument("--stage-iterations", type=int, default=200)
+    parser.add_argument("--no-stages", action="store_true", help="Skip in-process stage timings")
+    parser.add_argument("--recall-queries", type=int, default=300)
+    parser.add_argument("--no-recall", action="store_true", help="Skip the recall latency/quality comparison")
+    parser.add_argument("--workdir", type=Path, help="Reuse datasets across runs (default: temp dir)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", type=Path, help="Write results JSON here (default: stdout)")
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or Path(tempfile.mkdtemp(prefix="journal-bench-"))
+    data_dir = workdir / f"{args.embedder}-{args.partition}-{args.sessions}s-{args.messages}m"
+    data_dir.mkdir(parents=True, exist_ok=True)
+
+    ollama_port, app_port = free_port(), free_port()
+    env = _app_env(data_dir, args.embedder, ollama_port, args.partition)
+    ollama = app = None
+    try:
+        ollama = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.fake_ollama", "--port", str(ollama_port),
+             "--latency-ms", str(args.llm_latency_ms), "--tokens-per-sec", str(args.llm_tokens_per_sec),
+             "--reply-tokens", str(args.llm_reply_tokens)],
+            cwd=project_root(), env=env,
+        )
+        wait_for(f"http://127.0.0.1:{ollama_port}/api/tags", proc=ollama)
+
+        print(f"seeding {args.messages:,} messages in {args.sessions:,} sessions…", file=sys.stderr)
+        seed_stats = seed(data_dir, env, args.sessions, args.messages)
+
+        base = f"http://127.0.0.1:{app_port}"
+        app = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(app_port), "--log-level", "warning"],
+            cwd=project_root(), env=env,
+        )
+        t0 = time.perf_counter()
+        wait_for(f"{base}/readyz", proc=app, timeout=300)
+        startup = {"ready_seconds": time.perf_counter() - t0, "readyz": requests.get(f"{base}/readyz").json()}
+
+        session_ids = _session_ids(data_dir)
+        endpoints = {}
+        for endpoint in args.endpoints:
+            print(f"driving {endpoint}…", file=sys.stderr)
+            endpoints[endpoint] = drive(
+                endpoint, base, session_ids,
+                concurrency=args.concurrency, requests_per_worker=args.requests,
+                server_pid=app.pid, seed=args.seed,
+            )
+        stop(app)
+        app = None
+
+        stages = None
+        if not args.no_stages:
+            print("timing stages…", file=sys.stderr)
+            out = subprocess.run(
+                [sys.executable, "-m", "benchmarks.stages", "--iterations", str(args.stage_iterations)],
+                env=env, cwd=project_root(), check=True, capture_output=True, text=True,
+            )
+            stages = json.loads(out.stdout)
+
+        recall = None
+        if not args.no_recall:
+            print("measuring recall modes…", file=sys.stderr)
+            out = subprocess.run(
+                [sys.executable, "-m", "benchmarks.recall", "--queries", str(args.recall_queries)],
+                env=env, cwd=project_root(), check=True, capture_output=True, text=True,
+            )
+            recall = json.loads(out.stdout)
+    finally:
+        stop(app)
+        stop(ollama)
+
+    results = {
+        "meta": {
+            "git_commit": _git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": {k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items()},
+        },
+        "seed": seed_stats,
+        "startup": startup,
+        "endpoints": endpoints,
+        "stages": stages,
+        "recall": recall,
+    }
+    text = json.dumps(results, indent=2)
+    if args.out:
+        args.out.write_text(text)
+        print(f"wrote {args.out}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
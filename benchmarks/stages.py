@@ -0,0 +1,107 @@
+"""In-process timings of individual pipeline stages.
+
+Run with the same JOURNAL_* environment as the server under test; prints JSON.
+Each stage is repeated ``--iterations`` times against the seeded dataset.
+"""
+import argparse
+import asyncio
+import json
+import random
+import resource
+import time
+from typing import Callable
+
+from .common import summarize
+from .dataset import sample_query
+
+
+def _peak_rss_bytes() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _time(func: Callable[[], object], iterations: int) -> dict:
+    latencies = []
+    rss_before = _peak_rss_bytes()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - t0)
+    out = summarize(latencies)
+    out["peak_rss_bytes"] = _peak_rss_bytes()
+    out["peak_rss_growth_bytes"] = out["peak_rss_bytes"] - rss_before
+    return out
+
+
+def run(iterations: int, seed: int) -> dict:
+    from backend.db import sqlite as db
+    from backend.services import ai, memory
+    from backend.services.context import assemble_prompt
+
+    db.init_db()
+    rng = random.Random(seed)
+    conn = db.get_conn()
+    session_ids = [r[0] for r in conn.execute("SELECT session_id FROM sessions ORDER BY RANDOM() LIMIT 200")]
+    if not session_ids:
+        raise SystemExit("no sessions in the database; seed it first")
+
+    # Unique texts so the embedding cache does not hide encode cost
+    counter = iter(range(10**9))
+    unique = lambda: f"{sample_query(rng)} #{next(counter)}"  # noqa: E731
+
+    stages = {}
+    stages["embed_single"] = _time(lambda: ai.embed_text(unique()), iterations)
+    stages["embed_batch_32"] = _time(lambda: ai.embed_texts([unique() for _ in range(32)]), max(1, iterations // 8))
+    stages["embed_cached"] = _time(lambda: ai.embed_text("a repeated greeting"), iterations)
+
+    stages["sqlite_get_history_50"] = _time(
+        lambda: db.get_history(rng.choice(session_ids), limit=50), iterations)
+    stages["sqlite_get_all_sessions"] = _time(db.get_all_sessions, max(1, iterations // 10))
+
+    query_vectors = ai.embed_texts([sample_query(rng) for _ in range(32)])
+    # Repeated queries would otherwise be answered by the recall cache
+    memory.recall_cache.max_entries = 0
+    stages["chroma_recall_query"] = _time(
+        lambda: memory.recall_memories_scored(
+            "", rng.choice(session_ids), 5, query_embedding=rng.choice(query_vectors), mode="vector"),
+        iterations)
+    stages["fts_recall_query"] = _time(
+        lambda: memory.recall_memories_scored(sample_query(rng), rng.choice(session_ids), 5, mode="lexical"),
+        iterations)
+    memory.recall_cache.max_entries = 1024
+    memory.recall_memories_scored("cached query", session_ids[0], 5, query_embedding=query_vectors[0])
+    stages["recall_cached"] = _time(
+        lambda: memory.recall_memories_scored("cached query", session_ids[0], 5, query_embedding=query_vectors[0]),
+        iterations)
+
+    history = db.get_history(session_ids[0], limit=50)
+    memories = [m["content"] for m in history[:5]]
+    stages["prompt_assembly"] = _time(
+        lambda: assemble_prompt(history=history, memories=memories, summary="earlier summary " * 40),
+        iterations)
+
+    stages["sqlite_add_message"] = _time(
+        lambda: db.add_message(session_ids[0], "user", "benchmark write"), iterations)
+    # Leave the dataset as it was for the next run
+    with db.transaction() as c:
+        c.execute("DELETE FROM memory_outbox WHERE content = 'benchmark write'")
+        c.execute("DELETE FROM messages WHERE content = 'benchmark write'")
+
+    async def one_llm_call():
+        await ai.generate_reply_async([{"role": "user", "content": sample_query(rng)}])
+
+    stages["llm_generate"] = _time(lambda: asyncio.run(one_llm_call()), max(1, iterations // 20))
+
+    ai.embedding_service.close()
+    return stages
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+    print(json.dumps(run(args.iterations, args.seed)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""ONNX encoder parity with the sentence-transformers reference.
+
+Both backends share one Chroma index, so their vectors for the same text must
+stay close. Skipped unless the ONNX model has been fetched
+(`python -m backend.cli export-onnx --quantize`) and sentence-transformers is
+installed.
+"""
+import numpy as np
+import pytest
+
+from backend.config import ONNX_MODEL_DIR
+from backend.services.ai import ONNX_FILE, ONNX_INT8_FILE, OnnxEncoder, _encode_batch
+
+# Same bar as `python -m benchmarks.embedders --min-cosine`
+MIN_COSINE = 0.98
+
+TEXTS = [
+    "Had coffee with Sam and talked about moving to Lisbon next spring.",
+    "I keep forgetting to water the basil.",
+    "What did I say last week about the job interview?",
+    "Réunion à 14h, puis dîner chez Zoë — très fatiguée.",
+    "ok",
+    "Ran 5k in 27:41, knee felt fine, PR on the hill segment!",
+    # Longer than the 256-token limit, so truncation must match too
+    " ".join(f"Day {i}: wrote notes about the garden, the weather and the book club." for i in range(60)),
+]
+
+
+@pytest.fixture(scope="module")
+def reference() -> np.ndarray:
+    pytest.importorskip("sentence_transformers")
+    return np.asarray(_encode_batch(TEXTS))
+
+
+@pytest.mark.parametrize("quantized", [False, True], ids=["fp32", "int8"])
+def test_onnx_matches_reference(quantized: bool, reference: np.ndarray) -> None:
+    pytest.importorskip("onnxruntime")
+    model_file = ONNX_MODEL_DIR / (ONNX_INT8_FILE if quantized else ONNX_FILE)
+    if not model_file.exists():
+        pytest.skip(f"{model_file} not found; run `python -m backend.cli export-onnx --quantize`")
+
+    vectors = np.asarray(OnnxEncoder(ONNX_MODEL_DIR, quantized=quantized).encode(TEXTS))
+    assert vectors.shape == reference.shape
+
+    a = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    b = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    cosine = (a * b).sum(axis=1)
+    worst = int(cosine.argmin())
+    assert cosine[worst] >= MIN_COSINE, f"cosine {cosine[worst]:.4f} for {TEXTS[worst][:40]!r}"